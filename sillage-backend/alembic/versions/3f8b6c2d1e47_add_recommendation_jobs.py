@@ -0,0 +1,52 @@
+"""Add recomendacion_jobs table for async recommendations
+
+Revision ID: 3f8b6c2d1e47
+Revises: 9a4d2f6b8e31
+Create Date: 2026-10-18 18:12:37.204615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f8b6c2d1e47"
+down_revision: Union[str, Sequence[str], None] = "9a4d2f6b8e31"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'recomendacion_jobs',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('estado', sa.String(length=20), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('intentos', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('recomendacion_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['recomendacion_id'], ['recomendaciones.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_recomendacion_jobs_user_id'), 'recomendacion_jobs', ['user_id'], unique=False)
+    op.create_index(
+        'ix_recomendacion_jobs_estado_created',
+        'recomendacion_jobs',
+        ['estado', 'created_at'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recomendacion_jobs_estado_created', table_name='recomendacion_jobs')
+    op.drop_index(op.f('ix_recomendacion_jobs_user_id'), table_name='recomendacion_jobs')
+    op.drop_table('recomendacion_jobs')
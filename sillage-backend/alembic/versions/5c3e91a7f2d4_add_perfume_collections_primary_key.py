@@ -0,0 +1,63 @@
+"""Add composite primary key and active-rows index to perfume_collections
+
+Revision ID: 5c3e91a7f2d4
+Revises: d1b7baf88e23
+Create Date: 2026-10-18 15:12:40.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5c3e91a7f2d4"
+down_revision: Union[str, Sequence[str], None] = "d1b7baf88e23"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    row_id = "ctid" if bind.dialect.name == "postgresql" else "rowid"
+
+    # Quitar filas huérfanas y duplicados; se conserva la fila activa más reciente
+    op.execute("DELETE FROM perfume_collections WHERE user_id IS NULL OR perfume_id IS NULL")
+    op.execute(f"""
+        DELETE FROM perfume_collections WHERE {row_id} IN (
+            SELECT {row_id} FROM (
+                SELECT {row_id}, row_number() OVER (
+                    PARTITION BY user_id, perfume_id
+                    ORDER BY CASE WHEN removed_at IS NULL THEN 0 ELSE 1 END,
+                             added_at DESC, removed_at DESC
+                ) AS rn
+                FROM perfume_collections
+            ) ranked
+            WHERE rn > 1
+        )
+    """)
+
+    with op.batch_alter_table('perfume_collections') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('perfume_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_primary_key('perfume_collections_pkey', ['user_id', 'perfume_id'])
+
+    op.create_index(
+        'ix_perfume_collections_active',
+        'perfume_collections',
+        ['user_id', sa.text('added_at DESC'), sa.text('perfume_id DESC')],
+        unique=False,
+        postgresql_where=sa.text('removed_at IS NULL'),
+        sqlite_where=sa.text('removed_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_perfume_collections_active', table_name='perfume_collections')
+    with op.batch_alter_table('perfume_collections') as batch_op:
+        batch_op.drop_constraint('perfume_collections_pkey', type_='primary')
+        batch_op.alter_column('perfume_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,83 @@
+"""Add perfume search_text with trigram index
+
+Revision ID: 842a78cd0c3c
+Revises: 25772214108d
+Create Date: 2026-10-18 10:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from unidecode import unidecode
+
+
+# revision identifiers, used by Alembic.
+revision: str = "842a78cd0c3c"
+down_revision: Union[str, Sequence[str], None] = "25772214108d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def _search_text(nombre, marca) -> str:
+    # Misma normalización que app.utils.text.build_search_text
+    return " ".join(unidecode(f"{nombre or ''} {marca or ''}").lower().split())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    is_postgres = bind.dialect.name == "postgresql"
+
+    with op.batch_alter_table("perfumes") as batch_op:
+        batch_op.add_column(sa.Column("search_text", sa.String(length=320), nullable=True))
+
+    # Rellenar search_text para el catálogo existente
+    perfumes = sa.table(
+        "perfumes",
+        sa.column("id", sa.Integer),
+        sa.column("nombre", sa.String),
+        sa.column("marca", sa.String),
+        sa.column("search_text", sa.String),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(perfumes.c.id, perfumes.c.nombre, perfumes.c.marca)
+            .where(perfumes.c.id > last_id)
+            .order_by(perfumes.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        bind.execute(
+            perfumes.update()
+            .where(perfumes.c.id == sa.bindparam("_id"))
+            .values(search_text=sa.bindparam("_search_text")),
+            [
+                {"_id": row.id, "_search_text": _search_text(row.nombre, row.marca)}
+                for row in rows
+            ],
+        )
+        last_id = rows[-1].id
+
+    if is_postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.create_index(
+            "ix_perfumes_search_text_trgm",
+            "perfumes",
+            ["search_text"],
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_perfumes_search_text_trgm", table_name="perfumes")
+
+    with op.batch_alter_table("perfumes") as batch_op:
+        batch_op.drop_column("search_text")
@@ -0,0 +1,33 @@
+"""Add (user_id, created_at DESC, id DESC) index to recomendaciones
+
+Revision ID: 9a4d2f6b8e31
+Revises: 5c3e91a7f2d4
+Create Date: 2026-10-18 16:40:05.913522
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9a4d2f6b8e31"
+down_revision: Union[str, Sequence[str], None] = "5c3e91a7f2d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_recomendaciones_user_created',
+        'recomendaciones',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recomendaciones_user_created', table_name='recomendaciones')
@@ -0,0 +1,31 @@
+"""Add es_fallback flag to recomendaciones
+
+Revision ID: c4a1e9d07b52
+Revises: 3f8b6c2d1e47
+Create Date: 2026-10-18 19:03:51.447120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4a1e9d07b52"
+down_revision: Union[str, Sequence[str], None] = "3f8b6c2d1e47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'recomendaciones',
+        sa.Column('es_fallback', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('recomendaciones', 'es_fallback')
@@ -0,0 +1,153 @@
+"""Add note/accord lookup tables and perfume mappings
+
+Revision ID: d1b7baf88e23
+Revises: 842a78cd0c3c
+Create Date: 2026-10-18 11:03:52.671120
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from unidecode import unidecode
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d1b7baf88e23"
+down_revision: Union[str, Sequence[str], None] = "842a78cd0c3c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def _clave(value) -> str:
+    # Misma normalización que app.utils.text.normalize_text
+    return " ".join(unidecode(str(value)).lower().split())
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [v for v in value if v is not None]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notas',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('clave', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_notas_id'), 'notas', ['id'], unique=False)
+    op.create_index(op.f('ix_notas_clave'), 'notas', ['clave'], unique=True)
+    op.create_table('acordes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('clave', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_acordes_id'), 'acordes', ['id'], unique=False)
+    op.create_index(op.f('ix_acordes_clave'), 'acordes', ['clave'], unique=True)
+    op.create_table('perfume_notas',
+    sa.Column('perfume_id', sa.Integer(), nullable=False),
+    sa.Column('nota_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['nota_id'], ['notas.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['perfume_id'], ['perfumes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('perfume_id', 'nota_id')
+    )
+    op.create_index('ix_perfume_notas_nota_id', 'perfume_notas', ['nota_id', 'perfume_id'], unique=False)
+    op.create_table('perfume_acordes',
+    sa.Column('perfume_id', sa.Integer(), nullable=False),
+    sa.Column('acorde_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['acorde_id'], ['acordes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['perfume_id'], ['perfumes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('perfume_id', 'acorde_id')
+    )
+    op.create_index('ix_perfume_acordes_acorde_id', 'perfume_acordes', ['acorde_id', 'perfume_id'], unique=False)
+
+    # Rellenar vocabularios y mapeos a partir de las columnas JSON
+    bind = op.get_bind()
+    perfumes = sa.table(
+        "perfumes",
+        sa.column("id", sa.Integer),
+        sa.column("notas", sa.JSON),
+        sa.column("acordes", sa.JSON),
+    )
+    targets = [
+        ("notas", "perfume_notas", "nota_id"),
+        ("acordes", "perfume_acordes", "acorde_id"),
+    ]
+    vocab_tables = {
+        name: sa.table(name, sa.column("id", sa.Integer), sa.column("nombre", sa.String), sa.column("clave", sa.String))
+        for name, _, _ in targets
+    }
+    mapping_tables = {
+        name: sa.table(mapping, sa.column("perfume_id", sa.Integer), sa.column(column, sa.Integer))
+        for name, mapping, column in targets
+    }
+    ids = {name: {} for name, _, _ in targets}
+
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(perfumes.c.id, perfumes.c.notas, perfumes.c.acordes)
+            .where(perfumes.c.id > last_id)
+            .order_by(perfumes.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        for name, _, column in targets:
+            vocab = vocab_tables[name]
+            claves_por_perfume = []
+            nuevos = {}
+            for row in rows:
+                claves = set()
+                for value in _as_list(getattr(row, name)):
+                    clave = _clave(value)[:100]
+                    if not clave:
+                        continue
+                    claves.add(clave)
+                    if clave not in ids[name] and clave not in nuevos:
+                        nuevos[clave] = str(value).strip()[:100]
+                claves_por_perfume.append((row.id, claves))
+
+            if nuevos:
+                bind.execute(
+                    vocab.insert(),
+                    [{"clave": clave, "nombre": nombre} for clave, nombre in nuevos.items()]
+                )
+                result = bind.execute(
+                    sa.select(vocab.c.clave, vocab.c.id).where(vocab.c.clave.in_(list(nuevos)))
+                )
+                ids[name].update(dict(result.fetchall()))
+
+            mapping_rows = [
+                {"perfume_id": perfume_id, column: ids[name][clave]}
+                for perfume_id, claves in claves_por_perfume
+                for clave in claves
+            ]
+            if mapping_rows:
+                bind.execute(mapping_tables[name].insert(), mapping_rows)
+
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_perfume_acordes_acorde_id', table_name='perfume_acordes')
+    op.drop_table('perfume_acordes')
+    op.drop_index('ix_perfume_notas_nota_id', table_name='perfume_notas')
+    op.drop_table('perfume_notas')
+    op.drop_index(op.f('ix_acordes_clave'), table_name='acordes')
+    op.drop_index(op.f('ix_acordes_id'), table_name='acordes')
+    op.drop_table('acordes')
+    op.drop_index(op.f('ix_notas_clave'), table_name='notas')
+    op.drop_index(op.f('ix_notas_id'), table_name='notas')
+    op.drop_table('notas')
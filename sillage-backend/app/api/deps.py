@@ -62,6 +62,27 @@ async def get_current_user(
     return user
 
 
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    """Validar el token sin consultar la BD (para endpoints de lectura muy rápidos)"""
+    try:
+        payload = jwt.decode(
+            token,
+            settings.SECRET_KEY,
+            algorithms=[settings.ALGORITHM]
+        )
+        user_id = payload.get("sub")
+    except JWTError:
+        user_id = None
+
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return int(user_id)
+
+
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -74,6 +95,18 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_current_superuser(
+    current_user: User = Depends(get_current_active_user)
+) -> User:
+    """Verificar que el usuario sea administrador"""
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permisos insuficientes"
+        )
+    return current_user
+
+
 async def get_current_subscribed_user(
     current_user: User = Depends(get_current_active_user)
 ) -> User:
@@ -1,96 +1,554 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Query
+import gzip
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func
+from sqlalchemy import select, and_, or_, func, literal, union_all
 from datetime import datetime
 
-from app.api.deps import get_db, get_current_active_user
+from app.api.deps import get_db, get_current_active_user, get_current_superuser, get_current_user_id
+from app.core.database import get_dialect_name
 from app.models.user import User
-from app.models.perfume import Perfume, perfume_collection
-from app.schemas.perfume import Perfume as PerfumeSchema, PerfumeCreate
-from typing import List, Optional
+from app.models.perfume import Perfume, perfume_collection, Nota, Acorde, perfume_nota, perfume_acorde
+from app.schemas.perfume import (
+    Perfume as PerfumeSchema,
+    CatalogDelta,
+    CollectionBatchRequest,
+    CollectionBatchResult,
+    PerfumeCreate,
+    PerfumeFacets,
+    PerfumeSuggestion,
+)
+from app.services.catalog import catalog, sort_key
+from app.services.catalog_sync import DeltaTooLarge, get_catalog_delta, get_catalog_snapshot
+from app.services.collection import (
+    active_collection_ids,
+    apply_collection_changes,
+    upsert_collection_entries,
+)
+from app.services.similarity import similarity_index
+from app.services.search_cache import (
+    get_cached_search,
+    get_catalog_version,
+    get_search_cache_stats,
+    search_cache_key,
+    set_cached_search,
+)
+from app.services.tags import sync_perfume_tags, has_acorde, has_nota
+from app.services.versions import collection_version
+from app.utils.etag import make_etag, etag_matches, not_modified, set_etag
+from app.utils.pagination import encode_cursor, decode_cursor, set_next_cursor
+from app.utils.responses import fast_json_response
+from app.utils.text import normalize_text
+from typing import List, Optional, Tuple
 
 router = APIRouter()
 
+# Columnas devueltas por la colección (proyección directa a dict)
+COLLECTION_COLUMNS = (
+    Perfume.id,
+    Perfume.nombre,
+    Perfume.marca,
+    Perfume.perfumista,
+    Perfume.notas,
+    Perfume.acordes,
+    Perfume.is_private,
+    Perfume.created_by,
+    Perfume.created_at,
+    Perfume.updated_at,
+)
+# Página por defecto cuando se pagina solo con cursor
+COLLECTION_PAGE_SIZE = 100
+
 
 @router.get("/search", response_model=List[PerfumeSchema])
 async def search_perfumes(
+    response: Response,
     q: Optional[str] = Query(None, description="Búsqueda por nombre"),
     marca: Optional[str] = Query(None, description="Filtrar por marca"),
     acorde: Optional[str] = Query(None, description="Filtrar por acorde"),
-    limit: int = Query(50, le=100),
+    nota: Optional[str] = Query(None, description="Filtrar por nota"),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (X-Next-Cursor)"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Buscar perfumes en la base de datos"""
-    query = select(Perfume)
+    """Buscar perfumes (ordenados por relevancia si hay `q`)"""
+    q_norm = normalize_text(q)
+    position = decode_cursor(cursor)
+    mode = position["m"] if position else None
+    after = position["k"] if position else None
 
-    # Aplicar filtros
-    conditions = []
-    conditions.append(
-        or_(
-            Perfume.is_private.is_(False),
-            Perfume.created_by == current_user.id
+    # Catálogo público desde memoria; los perfumes privados siempre desde la BD
+    if catalog.ready and mode in (None, "mem"):
+        public = catalog.search_ranked(
+            q=q, marca=marca, acorde=acorde, nota=nota, limit=limit, after=after
         )
+        if public or not q_norm or mode == "mem":
+            private = await _search_private_perfumes(
+                db, current_user, q_norm, marca, acorde, nota, after
+            )
+            page = sorted(public + private, key=lambda item: item[0])[:limit]
+            if len(page) == limit:
+                set_next_cursor(response, encode_cursor(m="mem", k=page[-1][0]))
+            return [perfume for _, perfume in page]
+
+    if mode == "mem":
+        raise HTTPException(status_code=400, detail="Cursor expirado, repite la búsqueda")
+
+    # Sin catálogo en memoria o sin coincidencias por prefijo: búsqueda difusa en la BD
+    page = await _search_perfumes_in_db(
+        db, current_user, q_norm, marca, acorde, nota, limit, after
     )
-    if q:
-        conditions.append(
-            or_(
-                Perfume.nombre.ilike(f"%{q}%"),
-                Perfume.marca.ilike(f"%{q}%")
+    if len(page) == limit:
+        set_next_cursor(response, encode_cursor(m="db", k=page[-1][0]))
+    return [perfume for _, perfume in page]
+
+
+async def _search_private_perfumes(
+    db: AsyncSession,
+    current_user: User,
+    q_norm: str,
+    marca: Optional[str],
+    acorde: Optional[str],
+    nota: Optional[str],
+    after: Optional[tuple] = None,
+) -> List[Tuple[tuple, Perfume]]:
+    """Perfumes privados del usuario con la misma clave de orden que el catálogo"""
+    conditions = [
+        Perfume.is_private.is_(True),
+        Perfume.created_by == current_user.id
+    ]
+    if marca:
+        conditions.append(Perfume.marca.ilike(f"%{marca}%"))
+    if acorde:
+        conditions.append(has_acorde(acorde))
+    if nota:
+        conditions.append(has_nota(nota))
+
+    result = await db.execute(select(Perfume).where(and_(*conditions)))
+    ranked = []
+    for perfume in result.scalars().all():
+        key = sort_key(perfume.search_text or "", perfume.id, q_norm)
+        if key is not None and (after is None or key > after):
+            ranked.append((key, perfume))
+    return ranked
+
+
+def _visible_perfumes(current_user: User):
+    """Regla de visibilidad: catálogo público más los perfumes propios"""
+    return or_(
+        Perfume.is_private.is_(False),
+        Perfume.created_by == current_user.id
+    )
+
+
+def _search_conditions(
+    db: AsyncSession,
+    visibility,
+    q_norm: str,
+    marca: Optional[str],
+    acorde: Optional[str],
+    nota: Optional[str],
+) -> Tuple[list, list]:
+    """Condiciones y expresiones de orden de una búsqueda en la BD.
+
+    El orden es una lista de (expresión, descendente); la última siempre es el id.
+    """
+    conditions = []
+    conditions.append(visibility)
+    order = [(Perfume.id, False)]
+    if q_norm:
+        if get_dialect_name(db) == "postgresql":
+            # Subcadena o similitud de trigramas: ambos usan el índice GIN
+            conditions.append(
+                or_(
+                    Perfume.search_text.contains(q_norm, autoescape=True),
+                    Perfume.search_text.op("%>")(q_norm)
+                )
             )
-        )
+            rank = func.word_similarity(q_norm, Perfume.search_text)
+            order = [(rank, True), (Perfume.id, False)]
+        else:
+            conditions.append(Perfume.search_text.contains(q_norm, autoescape=True))
+            order = [(func.instr(Perfume.search_text, q_norm), False), (Perfume.id, False)]
     if marca:
         conditions.append(Perfume.marca.ilike(f"%{marca}%"))
     if acorde:
-        conditions.append(Perfume.acordes.contains([acorde]))
-    
-    if conditions:
-        query = query.where(and_(*conditions))
-    
-    query = query.limit(limit)
+        conditions.append(has_acorde(acorde))
+    if nota:
+        conditions.append(has_nota(nota))
+    return conditions, order
+
+
+def _keyset_condition(order: list, after: tuple):
+    """Condición para continuar después de `after` según el orden indicado"""
+    (expr, descending), rest = order[0], order[1:]
+    value = after[0]
+    beyond = expr < value if descending else expr > value
+    if not rest:
+        return beyond
+    return or_(beyond, and_(expr == value, _keyset_condition(rest, after[1:])))
+
+
+async def _query_search_page(
+    db: AsyncSession,
+    visibility,
+    q_norm: str,
+    marca: Optional[str],
+    acorde: Optional[str],
+    nota: Optional[str],
+    limit: int,
+    after: Optional[tuple],
+) -> Tuple[list, List[Tuple[tuple, Perfume]]]:
+    """Una página de la búsqueda en la BD; devuelve el orden y pares (clave, perfume)"""
+    conditions, order = _search_conditions(db, visibility, q_norm, marca, acorde, nota)
+    if after is not None:
+        if len(after) != len(order):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        conditions.append(_keyset_condition(order, after))
+
+    query = (
+        select(Perfume, *[expr for expr, _ in order])
+        .where(and_(*conditions))
+        .order_by(*[expr.desc() if descending else expr for expr, descending in order])
+        .limit(limit)
+    )
     
     result = await db.execute(query)
-    return result.scalars().all()
+    return order, [(tuple(row[1:]), row[0]) for row in result.all()]
+
+
+async def _search_perfumes_in_db(
+    db: AsyncSession,
+    current_user: User,
+    q_norm: str,
+    marca: Optional[str],
+    acorde: Optional[str],
+    nota: Optional[str],
+    limit: int,
+    after: Optional[tuple] = None,
+) -> List[Tuple[tuple, dict]]:
+    """Búsqueda en la BD con coincidencia por trigramas (PostgreSQL).
+
+    Es el camino de respaldo: se usa mientras el catálogo en memoria no está
+    listo y, con el catálogo cargado, cuando `q` no tiene coincidencias por
+    prefijo (errores de tipeo). Solo aquí aplica el cache de Redis: la mitad
+    pública se guarda bajo la versión del catálogo, que sube únicamente al
+    cambiar el catálogo público (carga CSV); los privados se consultan siempre.
+    """
+    version = await get_catalog_version()
+    cache_key = search_cache_key(
+        version,
+        q=q_norm,
+        marca=marca.lower() if marca else None,
+        acorde=normalize_text(acorde) or None,
+        nota=normalize_text(nota) or None,
+        limit=limit,
+        after=after,
+    )
+    public = await get_cached_search(cache_key)
+    if public is not None:
+        public = [(tuple(key), perfume) for key, perfume in public]
+    else:
+        _, rows = await _query_search_page(
+            db, Perfume.is_private.is_(False), q_norm, marca, acorde, nota, limit, after
+        )
+        public = [
+            (key, PerfumeSchema.model_validate(perfume).model_dump(mode="json"))
+            for key, perfume in rows
+        ]
+        await set_cached_search(cache_key, [[list(key), perfume] for key, perfume in public])
+
+    order, private = await _query_search_page(
+        db,
+        and_(Perfume.is_private.is_(True), Perfume.created_by == current_user.id),
+        q_norm, marca, acorde, nota, limit, after
+    )
+
+    def merge_key(item):
+        key = item[0]
+        return tuple(-value if descending else value for value, (_, descending) in zip(key, order))
+
+    return sorted(public + private, key=merge_key)[:limit]
+
+
+@router.get("/search/cache-stats")
+async def get_search_cache_statistics(
+    current_user: User = Depends(get_current_superuser)
+):
+    """Aciertos y fallos del cache de búsqueda"""
+    return await get_search_cache_stats()
+
+
+@router.get("/facets", response_model=PerfumeFacets)
+async def get_search_facets(
+    q: Optional[str] = Query(None, description="Búsqueda por nombre"),
+    marca: Optional[str] = Query(None, description="Filtrar por marca"),
+    acorde: Optional[str] = Query(None, description="Filtrar por acorde"),
+    nota: Optional[str] = Query(None, description="Filtrar por nota"),
+    top: int = Query(20, le=100, description="Valores por faceta"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Conteos por marca, acorde y nota para los mismos filtros de /search"""
+    q_norm = normalize_text(q)
+
+    if catalog.ready:
+        # Sin filtros se parte de los agregados precalculados del catálogo
+        counter = catalog.facet_counts(q=q, marca=marca, acorde=acorde, nota=nota)
+        if counter.total or not q_norm:
+            private = await _search_private_perfumes(db, current_user, q_norm, marca, acorde, nota)
+            for _, perfume in private:
+                counter.add(perfume.marca, perfume.acordes, perfume.notas)
+            return counter.top(top)
+
+    return await _facets_in_db(db, current_user, q_norm, marca, acorde, nota, top)
+
+
+async def _facets_in_db(
+    db: AsyncSession,
+    current_user: User,
+    q_norm: str,
+    marca: Optional[str],
+    acorde: Optional[str],
+    nota: Optional[str],
+    top: int,
+) -> dict:
+    """Conteos de facetas en una sola consulta (UNION ALL sobre los perfumes filtrados)"""
+    conditions, _ = _search_conditions(
+        db, _visible_perfumes(current_user), q_norm, marca, acorde, nota
+    )
+    matching = select(Perfume.id, Perfume.marca).where(and_(*conditions)).cte("matching")
+
+    total_query = select(
+        literal("total").label("faceta"),
+        literal("").label("valor"),
+        func.count().label("total"),
+        literal(0).label("primero"),
+    ).select_from(matching)
+    # Marca cruda + id más bajo: se agrupa por forma normalizada en Python, igual que FacetCounter
+    marcas_query = select(
+        literal("marcas"), matching.c.marca, func.count(), func.min(matching.c.id)
+    ).group_by(matching.c.marca)
+    acordes_query = select(
+        literal("acordes"), Acorde.nombre, func.count(), literal(0)
+    ).select_from(
+        matching
+        .join(perfume_acorde, perfume_acorde.c.perfume_id == matching.c.id)
+        .join(Acorde, Acorde.id == perfume_acorde.c.acorde_id)
+    ).group_by(Acorde.id, Acorde.nombre)
+    notas_query = select(
+        literal("notas"), Nota.nombre, func.count(), literal(0)
+    ).select_from(
+        matching
+        .join(perfume_nota, perfume_nota.c.perfume_id == matching.c.id)
+        .join(Nota, Nota.id == perfume_nota.c.nota_id)
+    ).group_by(Nota.id, Nota.nombre)
+
+    result = await db.execute(union_all(total_query, marcas_query, acordes_query, notas_query))
+
+    facets = {"total": 0, "marcas": [], "acordes": [], "notas": []}
+    marcas = {}
+    for faceta, valor, total, primero in result.all():
+        if faceta == "total":
+            facets["total"] = total
+        elif faceta == "marcas":
+            clave = normalize_text(valor)
+            if not clave:
+                continue
+            # Etiqueta: la marca tal como aparece en el perfume de menor id
+            label, first, count = marcas.get(clave, (valor, primero, 0))
+            if primero < first:
+                label, first = valor, primero
+            marcas[clave] = (label, first, count + total)
+        else:
+            facets[faceta].append({"valor": valor, "total": total})
+    facets["marcas"] = [{"valor": label, "total": count} for label, _, count in marcas.values()]
+    for faceta in ("marcas", "acordes", "notas"):
+        facets[faceta].sort(key=lambda item: (-item["total"], item["valor"]))
+        del facets[faceta][top:]
+    return facets
+
+
+@router.get("/autocomplete", response_model=List[PerfumeSuggestion])
+async def autocomplete_perfumes(
+    q: str = Query(..., min_length=1, description="Prefijo a completar"),
+    limit: int = Query(10, le=50),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Autocompletar nombres del catálogo público desde memoria"""
+    if catalog.ready:
+        return catalog.autocomplete(q, limit)
+
+    q_norm = normalize_text(q)
+    result = await db.execute(
+        select(Perfume.id, Perfume.nombre, Perfume.marca)
+        .where(
+            and_(
+                Perfume.is_private.is_(False),
+                Perfume.search_text.startswith(q_norm, autoescape=True)
+            )
+        )
+        .order_by(Perfume.search_text, Perfume.id)
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in result]
+
+
+@router.get("/catalog/snapshot")
+async def get_catalog_snapshot_file(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Catálogo público completo (JSON columnar con gzip) para uso offline"""
+    snapshot = await get_catalog_snapshot(db)
+    if etag_matches(request, snapshot.etag):
+        return not_modified(snapshot.etag)
+
+    headers = {"ETag": snapshot.etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+    body = snapshot.body
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/catalog/delta", response_model=CatalogDelta)
+async def get_catalog_changes(
+    since: datetime = Query(..., description="Versión del snapshot o del último delta aplicado"),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Cambios del catálogo público desde una versión (marca de agua created_at/updated_at)"""
+    try:
+        return await get_catalog_delta(db, since)
+    except DeltaTooLarge:
+        raise HTTPException(
+            status_code=410,
+            detail="Demasiados cambios, descarga de nuevo el snapshot del catálogo"
+        )
+
+
+@router.get("/{perfume_id}/similar", response_model=List[PerfumeSchema])
+async def get_similar_perfumes(
+    perfume_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Perfumes del catálogo más parecidos por notas, acordes y perfumista"""
+    perfume = catalog.get(perfume_id)
+    if perfume is None:
+        # Perfume privado (o aún no cargado en memoria): se lee de la BD
+        result = await db.execute(select(Perfume).where(Perfume.id == perfume_id))
+        perfume = result.scalar_one_or_none()
+        if not perfume or (perfume.is_private and perfume.created_by != current_user.id):
+            raise HTTPException(status_code=404, detail="Perfume no encontrado")
+        perfume = PerfumeSchema.model_validate(perfume).model_dump()
+
+    if not catalog.ready or not len(similarity_index):
+        raise HTTPException(status_code=503, detail="Índice de similitud no disponible")
+
+    similares = similarity_index.similar(
+        notas=perfume["notas"],
+        acordes=perfume["acordes"],
+        perfumista=perfume["perfumista"],
+        limit=limit,
+        exclude_id=perfume_id,
+    )
+    return [p for p in (catalog.get(pid) for pid, _ in similares) if p is not None]
 
 
 @router.get("/collection")
 async def get_my_collection(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Tamaño de página (activa la paginación)"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (X-Next-Cursor)"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Obtener la colección de perfumes del usuario"""
+    """Obtener la colección de perfumes del usuario (más recientes primero).
+
+    Sin `limit` ni `cursor` se devuelve la colección completa, como siempre;
+    la paginación por cursor es opcional.
+    """
+    if cursor and limit is None:
+        limit = COLLECTION_PAGE_SIZE
+    etag = make_etag(current_user.id, limit, cursor, await collection_version(db, current_user.id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    conditions = [
+        perfume_collection.c.perfume_id == Perfume.id,
+        perfume_collection.c.user_id == current_user.id,
+        perfume_collection.c.removed_at.is_(None)
+    ]
+    position = decode_cursor(cursor, "a")
+    if position:
+        conditions.append(
+            or_(
+                perfume_collection.c.added_at < position["a"],
+                and_(
+                    perfume_collection.c.added_at == position["a"],
+                    perfume_collection.c.perfume_id < position["p"]
+                )
+            )
+        )
+
+    # Solo las columnas que se devuelven, sin hidratar entidades ORM
     query = select(
-        Perfume,
+        *COLLECTION_COLUMNS,
         perfume_collection.c.added_at
-    ).join(
+    ).select_from(Perfume).join(
         perfume_collection,
-        and_(
-            perfume_collection.c.perfume_id == Perfume.id,
-            perfume_collection.c.user_id == current_user.id,
-            perfume_collection.c.removed_at.is_(None)
-        )
+        and_(*conditions)
+    ).order_by(
+        perfume_collection.c.added_at.desc(),
+        perfume_collection.c.perfume_id.desc()
     )
+    if limit is not None:
+        query = query.limit(limit)
     
     result = await db.execute(query)
-    perfumes = []
-    for perfume, added_at in result:
-        perfume_dict = {
-            "id": perfume.id,
-            "nombre": perfume.nombre,
-            "marca": perfume.marca,
-            "perfumista": perfume.perfumista,
-            "notas": perfume.notas,
-            "acordes": perfume.acordes,
-            "is_private": perfume.is_private,
-            "created_by": perfume.created_by,
-            "created_at": perfume.created_at,
-            "updated_at": perfume.updated_at,
-            "added_at": added_at
-        }
-        perfumes.append(perfume_dict)
+    perfumes = [dict(row._mapping) for row in result]
+
+    if limit is not None and len(perfumes) == limit:
+        last = perfumes[-1]
+        set_next_cursor(response, encode_cursor(a=last["added_at"], p=last["id"]))
     
-    return perfumes
+    return fast_json_response(perfumes, response)
+
+
+@router.post("/collection/batch", response_model=CollectionBatchResult)
+async def update_collection_batch(
+    batch: CollectionBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Agregar y/o eliminar varios perfumes de mi colección en una sola transacción"""
+    if set(batch.agregar) & set(batch.eliminar):
+        raise HTTPException(
+            status_code=400,
+            detail="Un perfume no puede agregarse y eliminarse en la misma operación"
+        )
+
+    estados = await apply_collection_changes(db, current_user.id, batch.agregar, batch.eliminar)
+    await db.commit()
+
+    resultados = [
+        {"perfume_id": perfume_id, "estado": estado} for perfume_id, estado in estados.items()
+    ]
+    return {
+        "agregados": sum(1 for r in resultados if r["estado"] == "agregado"),
+        "eliminados": sum(1 for r in resultados if r["estado"] == "eliminado"),
+        "resultados": resultados,
+    }
 
 
 @router.post("/collection/{perfume_id}")
@@ -100,51 +558,12 @@ async def add_to_collection(
     current_user: User = Depends(get_current_active_user)
 ):
     """Agregar un perfume a mi colección"""
-    # Verificar que el perfume existe
-    result = await db.execute(select(Perfume).where(Perfume.id == perfume_id))
-    perfume = result.scalar_one_or_none()
-
-    if not perfume:
-        raise HTTPException(status_code=404, detail="Perfume no encontrado")
-
-    if perfume.is_private and perfume.created_by != current_user.id:
-        raise HTTPException(status_code=404, detail="Perfume no encontrado")
-    
-    # Verificar si ya está en la colección
-    existing = await db.execute(
-        select(perfume_collection).where(
-            and_(
-                perfume_collection.c.user_id == current_user.id,
-                perfume_collection.c.perfume_id == perfume_id
-            )
-        )
-    )
-
-    existing_entry = existing.mappings().first()
-    if existing_entry:
-        if existing_entry["removed_at"] is None:
+    # Un único INSERT ... ON CONFLICT DO UPDATE (inserta o reactiva la entrada)
+    agregados = await upsert_collection_entries(db, current_user.id, [perfume_id])
+    if perfume_id not in agregados:
+        if await active_collection_ids(db, current_user.id, [perfume_id]):
             raise HTTPException(status_code=400, detail="El perfume ya está en tu colección")
-
-        await db.execute(
-            perfume_collection.update().where(
-                and_(
-                    perfume_collection.c.user_id == current_user.id,
-                    perfume_collection.c.perfume_id == perfume_id
-                )
-            ).values(
-                removed_at=None,
-                added_at=datetime.utcnow()
-            )
-        )
-    else:
-        # Agregar a la colección
-        await db.execute(
-            perfume_collection.insert().values(
-                user_id=current_user.id,
-                perfume_id=perfume_id,
-                added_at=datetime.utcnow()
-            )
-        )
+        raise HTTPException(status_code=404, detail="Perfume no encontrado")
     await db.commit()
     
     return {"message": "Perfume agregado a tu colección"}
@@ -191,17 +610,13 @@ async def create_perfume(
     )
     db.add(new_perfume)
     await db.flush()  # Para obtener el ID
+    await sync_perfume_tags(db, [new_perfume])
     
     # Agregarlo automáticamente a la colección del usuario
-    await db.execute(
-        perfume_collection.insert().values(
-            user_id=current_user.id,
-            perfume_id=new_perfume.id,
-            added_at=datetime.utcnow()
-        )
-    )
+    await upsert_collection_entries(db, current_user.id, [new_perfume.id])
     
     await db.commit()
     await db.refresh(new_perfume)
+    # Perfume privado: no toca el catálogo público, así que no se invalida el cache de búsqueda
     
     return new_perfume
\ No newline at end of file
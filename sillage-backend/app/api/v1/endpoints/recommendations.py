@@ -1,38 +1,212 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import orjson
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, or_
 
-from app.api.deps import get_db, get_current_subscribed_user
+from app.api.deps import get_db, get_current_subscribed_user, get_current_user_id
+from app.core.config import settings
 from app.models.user import User
 from app.models.perfume import Perfume, perfume_collection
-from app.models.recommendation import Recomendacion
-from app.schemas.recommendation import RecommendationRequest, RecommendationResponse
-from app.services.recommendation_engine import generate_recommendation
+from app.models.recommendation import Recomendacion, RecomendacionJob
+from app.schemas.recommendation import (
+    RecommendationBatchRequest,
+    RecommendationRequest,
+    RecommendationResponse,
+    RecommendationSummary,
+    RecommendationJobResponse,
+)
+from app.services.recommendation_engine import (
+    QuotaExceeded,
+    load_active_collection,
+    recommend_batch,
+    recommend_for_user,
+    stream_recommendation,
+)
+from app.services.recommendation_jobs import FINISHED_STATES, COMPLETED, enqueue_job, recommendation_jobs
+from app.services.request_flight import (
+    FlightTimeout,
+    IdempotencyKeyReused,
+    payload_fingerprint,
+    recommendation_flight_key,
+    run_single_flight,
+)
+from app.services.versions import collection_version, history_version
+from app.utils.etag import make_etag, etag_matches, not_modified, set_etag
+from app.utils.pagination import encode_cursor, decode_cursor, set_next_cursor
+from app.utils.responses import fast_json_response
 
 router = APIRouter()
 
+JOB_POLL_SECONDS = 0.5
+IDEMPOTENCY_KEY_REUSED = "La Idempotency-Key ya se usó con otra solicitud"
 
-@router.post("/", response_model=RecommendationResponse)
+# Columnas del historial (RecommendationSummary) y del perfume recomendado
+HISTORY_COLUMNS = (
+    Recomendacion.id,
+    Recomendacion.fecha_evento,
+    Recomendacion.hora_evento,
+    Recomendacion.lugar_nombre,
+    Recomendacion.ocasion,
+    Recomendacion.expectativa,
+    Recomendacion.vestimenta,
+    Recomendacion.clima_descripcion,
+    Recomendacion.temperatura,
+    Recomendacion.humedad,
+    Recomendacion.perfume_recomendado_id,
+    Recomendacion.explicacion,
+    Recomendacion.es_fallback,
+    Recomendacion.created_at,
+)
+RECOMMENDED_PERFUME_COLUMNS = (
+    Perfume.id,
+    Perfume.nombre,
+    Perfume.marca,
+    Perfume.perfumista,
+    Perfume.notas,
+    Perfume.acordes,
+)
+HISTORY_KEYS = tuple(column.key for column in HISTORY_COLUMNS)
+RECOMMENDED_PERFUME_KEYS = tuple(column.key for column in RECOMMENDED_PERFUME_COLUMNS)
+
+
+def _perfume_summary(perfume: Optional[Perfume]) -> Optional[dict]:
+    if perfume is None:
+        return None
+    return {key: getattr(perfume, key) for key in RECOMMENDED_PERFUME_KEYS}
+
+
+def _recommendation_dict(recommendation: Recomendacion, perfume: Optional[Perfume]) -> dict:
+    """Respuesta completa de una recomendación con su perfume ya cargado"""
+    response_dict = {key: getattr(recommendation, key) for key in HISTORY_KEYS}
+    response_dict["perfume_recomendado"] = _perfume_summary(perfume)
+    response_dict["respuesta_ia"] = recommendation.respuesta_ia
+    return response_dict
+
+
+async def _load_recommendation(db: AsyncSession, recommendation_id: int, user_id: int) -> dict:
+    """Recomendación del usuario con su perfume en una sola consulta (404 si no existe)"""
+    result = await db.execute(
+        select(Recomendacion, Perfume).outerjoin(
+            Perfume,
+            Perfume.id == Recomendacion.perfume_recomendado_id
+        ).where(
+            and_(
+                Recomendacion.id == recommendation_id,
+                Recomendacion.user_id == user_id
+            )
+        )
+    )
+    
+    row = result.first()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Recomendación no encontrada")
+    
+    return _recommendation_dict(*row)
+
+
+def _job_dict(job) -> dict:
+    return {
+        "job_id": job.id,
+        "estado": job.estado,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+@router.post("/", response_model=Union[RecommendationResponse, RecommendationJobResponse])
 async def create_recommendation(
     request_data: RecommendationRequest,
+    response: Response,
+    async_mode: bool = Query(False, alias="async", description="Encolar y responder 202 con el id del trabajo"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=200),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_subscribed_user)
 ):
     """Generar una nueva recomendación de perfume"""
     
     # Verificar que el usuario tiene perfumes en su colección
-    collection_query = select(Perfume).join(
-        perfume_collection,
-        and_(
-            perfume_collection.c.perfume_id == Perfume.id,
-            perfume_collection.c.user_id == current_user.id,
-            perfume_collection.c.removed_at.is_(None)
+    user_perfumes = await load_active_collection(db, current_user.id)
+    
+    if not user_perfumes:
+        raise HTTPException(
+            status_code=400,
+            detail="Debes tener al menos un perfume en tu colección"
+        )
+    
+    if async_mode:
+        # El trabajo se procesa en el pool de workers; el cliente consulta /jobs/{job_id}
+        try:
+            job = await enqueue_job(
+                db, current_user.id, request_data.model_dump(mode="json"), idempotency_key
+            )
+        except IdempotencyKeyReused:
+            raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_REUSED)
+        if job.estado not in FINISHED_STATES:
+            recommendation_jobs.submit(job.id)
+        response.status_code = 202
+        return _job_dict(job)
+    
+    perfumes_by_id = {perfume.id: perfume for perfume in user_perfumes}
+    generated = {}
+
+    async def run_pipeline() -> int:
+        recommendation = await recommend_for_user(
+            db, current_user, user_perfumes, request_data.model_dump()
+        )
+        generated["recommendation"] = recommendation
+        return recommendation.id
+
+    # Reintentos concurrentes (o con la misma Idempotency-Key) esperan al primero
+    flight_key, result_ttl = recommendation_flight_key(
+        current_user.id,
+        request_data.model_dump(),
+        await collection_version(db, current_user.id),
+        idempotency_key
+    )
+    fingerprint = payload_fingerprint(request_data.model_dump(mode="json")) if idempotency_key else None
+    try:
+        recommendation_id, is_leader = await run_single_flight(
+            flight_key, run_pipeline, result_ttl, fingerprint
+        )
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_REUSED)
+    except FlightTimeout:
+        raise HTTPException(
+            status_code=409,
+            detail="Ya hay una recomendación en curso para esta solicitud, reintenta en unos segundos"
         )
+
+    if not is_leader:
+        return await _load_recommendation(db, recommendation_id, current_user.id)
+
+    # El perfume recomendado sale de la colección ya cargada: sin consulta extra
+    recommendation = generated["recommendation"]
+    return _recommendation_dict(
+        recommendation,
+        perfumes_by_id.get(recommendation.perfume_recomendado_id)
     )
+
+
+@router.post("/batch", response_model=List[RecommendationResponse])
+async def create_recommendation_batch(
+    request_data: RecommendationBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_subscribed_user)
+):
+    """Recomendar varios eventos (p. ej. la semana) con una sola llamada a la IA"""
+    
+    if current_user.consultas_restantes < len(request_data.eventos):
+        raise HTTPException(
+            status_code=429,
+            detail=f"No tienes consultas suficientes para {len(request_data.eventos)} eventos"
+        )
     
-    result = await db.execute(collection_query)
-    user_perfumes = result.scalars().all()
+    user_perfumes = await load_active_collection(db, current_user.id)
     
     if not user_perfumes:
         raise HTTPException(
@@ -40,112 +214,162 @@ async def create_recommendation(
             detail="Debes tener al menos un perfume en tu colección"
         )
     
-    # Generar la recomendación
-    recommendation = await generate_recommendation(
-        db=db,
-        user_id=current_user.id,
-        perfumes=user_perfumes,
-        **request_data.dict()
-    )
+    try:
+        recommendations = await recommend_batch(
+            db, current_user, user_perfumes, [evento.model_dump() for evento in request_data.eventos]
+        )
+    except QuotaExceeded:
+        raise HTTPException(
+            status_code=429,
+            detail=f"No tienes consultas suficientes para {len(request_data.eventos)} eventos"
+        )
     
-    # Decrementar consultas restantes
-    current_user.consultas_restantes -= 1
-    await db.commit()
-    
-    # Preparar respuesta con info del perfume
-    response_dict = {
-        "id": recommendation.id,
-        "fecha_evento": recommendation.fecha_evento,
-        "hora_evento": recommendation.hora_evento,
-        "lugar_nombre": recommendation.lugar_nombre,
-        "ocasion": recommendation.ocasion,
-        "expectativa": recommendation.expectativa,
-        "vestimenta": recommendation.vestimenta,
-        "clima_descripcion": recommendation.clima_descripcion,
-        "temperatura": recommendation.temperatura,
-        "humedad": recommendation.humedad,
-        "perfume_recomendado_id": recommendation.perfume_recomendado_id,
-        "perfume_recomendado": None,
-        "explicacion": recommendation.explicacion,
-        "respuesta_ia": recommendation.respuesta_ia,
-        "created_at": recommendation.created_at
-    }
+    perfumes_by_id = {perfume.id: perfume for perfume in user_perfumes}
+    return [
+        _recommendation_dict(recommendation, perfumes_by_id.get(recommendation.perfume_recomendado_id))
+        for recommendation in recommendations
+    ]
+
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+@router.post("/stream", response_class=StreamingResponse)
+async def stream_recommendation_endpoint(
+    request_data: RecommendationRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_subscribed_user)
+):
+    """Generar una recomendación enviando la respuesta de la IA por Server-Sent Events"""
+    
+    user_perfumes = await load_active_collection(db, current_user.id)
     
-    # Si hay perfume recomendado, buscar sus datos
-    if recommendation.perfume_recomendado_id:
-        perfume_result = await db.execute(
-            select(Perfume).where(Perfume.id == recommendation.perfume_recomendado_id)
+    if not user_perfumes:
+        raise HTTPException(
+            status_code=400,
+            detail="Debes tener al menos un perfume en tu colección"
         )
-        perfume = perfume_result.scalar_one_or_none()
-        if perfume:
-            response_dict["perfume_recomendado"] = {
-                "id": perfume.id,
-                "nombre": perfume.nombre,
-                "marca": perfume.marca,
-                "perfumista": perfume.perfumista,
-                "notas": perfume.notas,
-                "acordes": perfume.acordes
-            }
     
-    return response_dict
+    async def events():
+        perfume = None
+        try:
+            async for event, data in stream_recommendation(
+                db, current_user, user_perfumes, request_data.model_dump()
+            ):
+                if event == "perfume":
+                    perfume = data
+                    yield _sse(event, _perfume_summary(data))
+                elif event == "texto":
+                    yield _sse(event, {"texto": data})
+                elif event == "fin":
+                    yield _sse(event, _recommendation_dict(data, perfume))
+                else:
+                    yield _sse(event, data)
+        except Exception as e:
+            print(f"❌ Error en recomendación en streaming: {e}")
+            yield _sse("error", {"detail": "No se pudo generar la recomendación"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
-@router.get("/history", response_model=List[RecommendationResponse])
+@router.get("/history", response_model=List[RecommendationSummary])
 async def get_recommendation_history(
-    limit: int = 10,
+    request: Request,
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (X-Next-Cursor)"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_subscribed_user)
 ):
     """Obtener historial de recomendaciones del usuario"""
-    
-    query = select(Recomendacion).where(
-        Recomendacion.user_id == current_user.id
+    etag = make_etag(current_user.id, limit, cursor, await history_version(db, current_user.id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    conditions = [Recomendacion.user_id == current_user.id]
+    position = decode_cursor(cursor, "c")
+    if position:
+        conditions.append(
+            or_(
+                Recomendacion.created_at < position["c"],
+                and_(
+                    Recomendacion.created_at == position["c"],
+                    Recomendacion.id < position["i"]
+                )
+            )
+        )
+
+    # Solo las columnas del resumen (sin prompt ni respuesta_ia), con el perfume
+    # recomendado en la misma consulta (LEFT JOIN)
+    query = select(*HISTORY_COLUMNS, *RECOMMENDED_PERFUME_COLUMNS).outerjoin(
+        Perfume,
+        Perfume.id == Recomendacion.perfume_recomendado_id
+    ).where(
+        and_(*conditions)
     ).order_by(
-        Recomendacion.created_at.desc()
+        Recomendacion.created_at.desc(),
+        Recomendacion.id.desc()
     ).limit(limit)
     
     result = await db.execute(query)
-    recommendations = result.scalars().all()
-    
-    # Preparar respuesta con info de perfumes
+    split = len(HISTORY_KEYS)
     response_list = []
-    for rec in recommendations:
-        rec_dict = {
-            "id": rec.id,
-            "fecha_evento": rec.fecha_evento,
-            "hora_evento": rec.hora_evento,
-            "lugar_nombre": rec.lugar_nombre,
-            "ocasion": rec.ocasion,
-            "expectativa": rec.expectativa,
-            "vestimenta": rec.vestimenta,
-            "clima_descripcion": rec.clima_descripcion,
-            "temperatura": rec.temperatura,
-            "humedad": rec.humedad,
-            "perfume_recomendado_id": rec.perfume_recomendado_id,
-            "perfume_recomendado": None,
-            "explicacion": rec.explicacion,
-            "respuesta_ia": rec.respuesta_ia,
-            "created_at": rec.created_at
-        }
-        
-        if rec.perfume_recomendado_id:
-            perfume_result = await db.execute(
-                select(Perfume).where(Perfume.id == rec.perfume_recomendado_id)
-            )
-            perfume = perfume_result.scalar_one_or_none()
-            if perfume:
-                rec_dict["perfume_recomendado"] = {
-                    "id": perfume.id,
-                    "nombre": perfume.nombre,
-                    "marca": perfume.marca,
-                    "perfumista": perfume.perfumista,
-                    "notas": perfume.notas,
-                    "acordes": perfume.acordes
-                }
-        
+    for row in result:
+        rec_dict = dict(zip(HISTORY_KEYS, row[:split]))
+        perfume = row[split:]
+        rec_dict["perfume_recomendado"] = (
+            dict(zip(RECOMMENDED_PERFUME_KEYS, perfume)) if perfume[0] is not None else None
+        )
         response_list.append(rec_dict)
+
+    if len(response_list) == limit:
+        last = response_list[-1]
+        set_next_cursor(response, encode_cursor(c=last["created_at"], i=last["id"]))
     
-    return response_list
+    return fast_json_response(response_list, response)
+
+
+@router.get("/jobs/{job_id}", response_model=RecommendationJobResponse)
+async def get_recommendation_job(
+    job_id: str,
+    wait: int = Query(0, ge=0, le=25, description="Segundos a esperar a que el trabajo termine"),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Estado de un trabajo de recomendación (long-polling con `wait`)"""
+    query = select(
+        RecomendacionJob.id,
+        RecomendacionJob.estado,
+        RecomendacionJob.error,
+        RecomendacionJob.recomendacion_id,
+        RecomendacionJob.created_at,
+        RecomendacionJob.finished_at,
+    ).where(
+        and_(RecomendacionJob.id == job_id, RecomendacionJob.user_id == user_id)
+    )
+
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        job = (await db.execute(query)).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+        if job.estado in FINISHED_STATES or asyncio.get_running_loop().time() >= deadline:
+            break
+        # Liberar la conexión mientras se espera
+        await db.rollback()
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+    response_dict = _job_dict(job)
+    response_dict["recomendacion"] = None
+    if job.estado == COMPLETED and job.recomendacion_id is not None:
+        response_dict["recomendacion"] = await _load_recommendation(db, job.recomendacion_id, user_id)
+    return response_dict
 
 
 @router.get("/{recommendation_id}", response_model=RecommendationResponse)
@@ -156,52 +380,4 @@ async def get_recommendation(
 ):
     """Obtener una recomendación específica"""
     
-    result = await db.execute(
-        select(Recomendacion).where(
-            and_(
-                Recomendacion.id == recommendation_id,
-                Recomendacion.user_id == current_user.id
-            )
-        )
-    )
-    
-    recommendation = result.scalar_one_or_none()
-    
-    if not recommendation:
-        raise HTTPException(status_code=404, detail="Recomendación no encontrada")
-    
-    # Preparar respuesta con info del perfume
-    response_dict = {
-        "id": recommendation.id,
-        "fecha_evento": recommendation.fecha_evento,
-        "hora_evento": recommendation.hora_evento,
-        "lugar_nombre": recommendation.lugar_nombre,
-        "ocasion": recommendation.ocasion,
-        "expectativa": recommendation.expectativa,
-        "vestimenta": recommendation.vestimenta,
-        "clima_descripcion": recommendation.clima_descripcion,
-        "temperatura": recommendation.temperatura,
-        "humedad": recommendation.humedad,
-        "perfume_recomendado_id": recommendation.perfume_recomendado_id,
-        "perfume_recomendado": None,
-        "explicacion": recommendation.explicacion,
-        "respuesta_ia": recommendation.respuesta_ia,
-        "created_at": recommendation.created_at
-    }
-    
-    if recommendation.perfume_recomendado_id:
-        perfume_result = await db.execute(
-            select(Perfume).where(Perfume.id == recommendation.perfume_recomendado_id)
-        )
-        perfume = perfume_result.scalar_one_or_none()
-        if perfume:
-            response_dict["perfume_recomendado"] = {
-                "id": perfume.id,
-                "nombre": perfume.nombre,
-                "marca": perfume.marca,
-                "perfumista": perfume.perfumista,
-                "notas": perfume.notas,
-                "acordes": perfume.acordes
-            }
-    
-    return response_dict
\ No newline at end of file
+    return await _load_recommendation(db, recommendation_id, current_user.id)
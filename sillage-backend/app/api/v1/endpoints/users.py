@@ -1,19 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 
 from app.api.deps import get_db, get_current_active_user
 from app.models.user import User
 from app.schemas.user import User as UserSchema, UserUpdate
+from app.utils.etag import make_etag, etag_matches, not_modified, set_etag
 
 router = APIRouter()
 
 
 @router.get("/me", response_model=UserSchema)
 async def get_current_user_profile(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_active_user)
 ):
     """Obtener perfil del usuario actual"""
+    etag = make_etag(
+        current_user.id,
+        current_user.updated_at,
+        current_user.email,
+        current_user.first_name,
+        current_user.last_name,
+        current_user.is_active,
+        current_user.is_verified,
+        current_user.suscrito,
+        current_user.consultas_restantes,
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return current_user
 
 
@@ -29,6 +29,37 @@ class Settings(BaseSettings):
     FLOW_API_URL: str
     FLOW_SANDBOX: bool = False
     
+    # Catálogo en memoria
+    CATALOG_REFRESH_SECONDS: int = 60
+    # Solape del refresco incremental y de /catalog/delta: filas confirmadas tarde con un now() anterior a la marca de agua
+    CATALOG_REFRESH_LOOKBACK_SECONDS: int = 300
+    SEARCH_CACHE_TTL_SECONDS: int = 600
+    SIMILARITY_INDEX_PATH: str = "data/similarity_index.npz"
+    CATALOG_DELTA_MAX_ROWS: int = 5000
+    
+    # Clima
+    WEATHER_GEOHASH_PRECISION: int = 5
+    WEATHER_CACHE_TTL_SECONDS: int = 10800  # OpenWeather actualiza /forecast cada 3 horas
+    
+    # Cache de recomendaciones
+    RECOMMENDATION_CACHE_TTL_SECONDS: int = 1800
+    RECOMMENDATION_CACHE_HIT_CONSUMES_QUOTA: bool = False
+    RECOMMENDATION_FLIGHT_LOCK_SECONDS: int = 60
+    RECOMMENDATION_FLIGHT_RESULT_SECONDS: int = 30
+    RECOMMENDATION_IDEMPOTENCY_TTL_SECONDS: int = 86400
+    # Máximo de perfumes de la colección que se incluyen en el prompt (pre-ranking local)
+    RECOMMENDATION_PROMPT_MAX_PERFUMES: int = 30
+    # Salida JSON con ids cortos de perfume (el texto libre queda como respaldo)
+    RECOMMENDATION_STRUCTURED_OUTPUT: bool = True
+    # Presupuesto de latencia de Gemini: pasado este tiempo responde el recomendador local
+    RECOMMENDATION_LLM_BUDGET_SECONDS: float = 8.0
+    RECOMMENDATION_FALLBACK_CONSUMES_QUOTA: bool = False
+    # Modo asíncrono: workers por proceso (independiente de la concurrencia web)
+    RECOMMENDATION_WORKERS: int = 4
+    RECOMMENDATION_JOB_STALE_SECONDS: int = 120
+    RECOMMENDATION_JOB_MAX_ATTEMPTS: int = 3
+    RECOMMENDATION_JOB_SWEEP_SECONDS: int = 30
+    
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8000
@@ -31,4 +31,9 @@ async def get_db() -> AsyncSession:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+
+def get_dialect_name(session) -> str:
+    """Obtener el dialecto SQL ('postgresql', 'sqlite', ...) de una sesión"""
+    return session.get_bind().dialect.name
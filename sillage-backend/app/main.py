@@ -3,7 +3,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.catalog import catalog
+from app.services.http_clients import http_clients
+from app.services.recommendation_jobs import recommendation_jobs
+from app.services.resilience import guards, metrics
+from app.services.search_cache import get_catalog_version
+from app.services.similarity import similarity_index
 from app.utils.cache import cache
+from app.utils.pagination import NEXT_CURSOR_HEADER
 from app.api.v1.api import api_router  # NUEVO
 
 
@@ -13,9 +21,35 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting Sillage API...")
     await cache.connect()
     print("✅ Redis connected")
+    http_clients.start()
+    print("✅ HTTP clients ready")
+    if similarity_index.load():
+        print(f"✅ Índice de similitud cargado desde disco ({len(similarity_index)} perfumes)")
+    catalog.add_listener(similarity_index.on_catalog_change)
+    try:
+        async with AsyncSessionLocal() as db:
+            await catalog.load(db)
+        print(f"✅ Catálogo en memoria cargado ({len(catalog)} perfumes)")
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el catálogo en memoria: {e}")
+    catalog.start(
+        AsyncSessionLocal,
+        settings.CATALOG_REFRESH_SECONDS,
+        version_source=get_catalog_version
+    )
+    recommendation_jobs.start(
+        AsyncSessionLocal,
+        settings.RECOMMENDATION_WORKERS,
+        settings.RECOMMENDATION_JOB_SWEEP_SECONDS
+    )
+    print(f"✅ Workers de recomendaciones iniciados ({settings.RECOMMENDATION_WORKERS})")
     yield
     # Shutdown
     print("👋 Shutting down...")
+    await recommendation_jobs.stop()
+    await catalog.stop()
+    await similarity_index.wait_saved()
+    await http_clients.close()
     await cache.disconnect()
 
 
@@ -32,6 +66,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 # Incluir router de API v1 - NUEVO
@@ -49,5 +84,10 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        # Estado de los circuitos y contadores de reintentos/rechazos por proveedor
+        "providers": {
+            "circuitos": guards.states(),
+            "eventos": metrics.snapshot()
+        }
     }
\ No newline at end of file
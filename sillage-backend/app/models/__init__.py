@@ -1,7 +1,7 @@
 from app.core.database import Base
 from app.models.user import User
-from app.models.perfume import Perfume, perfume_collection
-from app.models.recommendation import Recomendacion
+from app.models.perfume import Perfume, perfume_collection, Nota, Acorde, perfume_nota, perfume_acorde
+from app.models.recommendation import Recomendacion, RecomendacionJob
 from app.models.subscription import Suscripcion, HistorialPago
 
 # Esto es importante para que Alembic detecte todos los modelos
@@ -10,7 +10,12 @@ __all__ = [
     "User", 
     "Perfume", 
     "perfume_collection",
+    "Nota",
+    "Acorde",
+    "perfume_nota",
+    "perfume_acorde",
     "Recomendacion", 
+    "RecomendacionJob",
     "Suscripcion", 
     "HistorialPago"
 ]
\ No newline at end of file
@@ -1,19 +1,65 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Table, Boolean
+from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Table, Boolean, Index, event
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
+from app.utils.text import build_search_text
 
 
 # Tabla intermedia para la relación muchos a muchos
 perfume_collection = Table(
     'perfume_collections',
     Base.metadata,
-    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
-    Column('perfume_id', Integer, ForeignKey('perfumes.id', ondelete='CASCADE')),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    Column('perfume_id', Integer, ForeignKey('perfumes.id', ondelete='CASCADE'), primary_key=True),
     Column('added_at', DateTime(timezone=True), server_default=func.now()),
     Column('removed_at', DateTime(timezone=True), nullable=True)
 )
 
+# Índice parcial de filas activas en el orden de listado de la colección
+Index(
+    'ix_perfume_collections_active',
+    perfume_collection.c.user_id,
+    perfume_collection.c.added_at.desc(),
+    perfume_collection.c.perfume_id.desc(),
+    postgresql_where=perfume_collection.c.removed_at.is_(None),
+    sqlite_where=perfume_collection.c.removed_at.is_(None),
+)
+
+
+class Nota(Base):
+    __tablename__ = "notas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    nombre = Column(String(100), nullable=False)
+    # Forma normalizada (minúsculas, sin acentos) usada para buscar
+    clave = Column(String(100), nullable=False, unique=True, index=True)
+
+
+class Acorde(Base):
+    __tablename__ = "acordes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    nombre = Column(String(100), nullable=False)
+    clave = Column(String(100), nullable=False, unique=True, index=True)
+
+
+# Índice invertido perfume <-> nota / acorde
+perfume_nota = Table(
+    'perfume_notas',
+    Base.metadata,
+    Column('perfume_id', Integer, ForeignKey('perfumes.id', ondelete='CASCADE'), primary_key=True),
+    Column('nota_id', Integer, ForeignKey('notas.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_perfume_notas_nota_id', 'nota_id', 'perfume_id')
+)
+
+perfume_acorde = Table(
+    'perfume_acordes',
+    Base.metadata,
+    Column('perfume_id', Integer, ForeignKey('perfumes.id', ondelete='CASCADE'), primary_key=True),
+    Column('acorde_id', Integer, ForeignKey('acordes.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_perfume_acordes_acorde_id', 'acorde_id', 'perfume_id')
+)
+
 
 class Perfume(Base):
     __tablename__ = "perfumes"
@@ -23,6 +69,9 @@ class Perfume(Base):
     marca = Column(String(100), nullable=False, index=True)
     perfumista = Column(String(100), nullable=True)
 
+    # Nombre + marca normalizados (minúsculas, sin acentos) para búsqueda por trigramas
+    search_text = Column(String(320), nullable=True)
+
     # Datos JSON para notas y acordes
     notas = Column(JSON, nullable=True, default=None)
     acordes = Column(JSON, nullable=True, default=None)
@@ -35,4 +84,21 @@ class Perfume(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relaciones (se configurarán después)
-    # users = relationship("User", secondary=perfume_collection, back_populates="perfumes")
\ No newline at end of file
+    # users = relationship("User", secondary=perfume_collection, back_populates="perfumes")
+
+    __table_args__ = (
+        # Índice GIN de trigramas (solo PostgreSQL, requiere pg_trgm)
+        Index(
+            "ix_perfumes_search_text_trgm",
+            "search_text",
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+@event.listens_for(Perfume, "before_insert")
+@event.listens_for(Perfume, "before_update")
+def _sync_search_text(mapper, connection, target):
+    """Mantener search_text sincronizado con nombre y marca"""
+    target.search_text = build_search_text(target.nombre, target.marca)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Date, Time, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Date, Time, Text, Index, JSON, Boolean
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -36,6 +36,8 @@ class Recomendacion(Base):
     # IA
     prompt = Column(Text)
     respuesta_ia = Column(Text)
+    # Elegida por el recomendador local (la IA falló o no respondió a tiempo)
+    es_fallback = Column(Boolean, nullable=False, default=False, server_default="false")
     
     # Resultado
     perfume_recomendado_id = Column(Integer, ForeignKey("perfumes.id", ondelete="SET NULL"), nullable=True)
@@ -43,7 +45,37 @@ class Recomendacion(Base):
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Historial por usuario en orden de keyset (created_at, id) descendente
+    __table_args__ = (
+        Index("ix_recomendaciones_user_created", user_id, created_at.desc(), id.desc()),
+    )
     
     # Relaciones (se configurarán después)
     # user = relationship("User", back_populates="recomendaciones")
-    # perfume_recomendado = relationship("Perfume")
\ No newline at end of file
+    # perfume_recomendado = relationship("Perfume")
+
+
+class RecomendacionJob(Base):
+    """Solicitud de recomendación en modo asíncrono (procesada por el pool de workers)"""
+    __tablename__ = "recomendacion_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # pendiente -> en_proceso -> completado | error
+    estado = Column(String(20), nullable=False, default="pendiente")
+    payload = Column(JSON, nullable=False)
+    intentos = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    recomendacion_id = Column(Integer, ForeignKey("recomendaciones.id", ondelete="SET NULL"), nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Los workers reclaman trabajos pendientes en orden de llegada
+    __table_args__ = (
+        Index("ix_recomendacion_jobs_estado_created", estado, created_at),
+    )
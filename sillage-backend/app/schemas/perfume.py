@@ -38,6 +38,52 @@ class Perfume(PerfumeInDB):
     pass
 
 
+class PerfumeSuggestion(BaseModel):
+    id: int
+    nombre: str
+    marca: str
+
+
+class FacetCount(BaseModel):
+    valor: str
+    total: int
+
+
+class PerfumeFacets(BaseModel):
+    total: int
+    marcas: List[FacetCount]
+    acordes: List[FacetCount]
+    notas: List[FacetCount]
+
+
+class CatalogPerfume(PerfumeBase):
+    id: int
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+
+class CatalogDelta(BaseModel):
+    version: Optional[str]
+    perfumes: List[CatalogPerfume]
+    eliminados: List[int]
+
+
+class CollectionBatchRequest(BaseModel):
+    agregar: List[int] = Field(default_factory=list, max_length=500)
+    eliminar: List[int] = Field(default_factory=list, max_length=500)
+
+
+class CollectionBatchItem(BaseModel):
+    perfume_id: int
+    estado: str  # agregado, ya_en_coleccion, eliminado, no_en_coleccion, no_encontrado
+
+
+class CollectionBatchResult(BaseModel):
+    agregados: int
+    eliminados: int
+    resultados: List[CollectionBatchItem]
+
+
 class PerfumeCollection(BaseModel):
     perfume: Perfume
     added_at: datetime
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import date, time, datetime
 from pydantic import BaseModel, Field, validator
 
@@ -29,7 +29,12 @@ class RecommendationRequest(BaseModel):
         return v
 
 
-class RecommendationResponse(BaseModel):
+class RecommendationBatchRequest(BaseModel):
+    # Cada evento se valida como una solicitud individual (ventana de 5 días)
+    eventos: List[RecommendationRequest] = Field(..., min_length=1, max_length=10)
+
+
+class RecommendationSummary(BaseModel):
     id: int
     fecha_evento: date
     hora_evento: time
@@ -43,8 +48,21 @@ class RecommendationResponse(BaseModel):
     perfume_recomendado_id: Optional[int]
     perfume_recomendado: Optional[dict]
     explicacion: Optional[str]
-    respuesta_ia: str
+    es_fallback: bool = False
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class RecommendationResponse(RecommendationSummary):
+    respuesta_ia: str
+
+
+class RecommendationJobResponse(BaseModel):
+    job_id: str
+    estado: str
+    error: Optional[str] = None
+    recomendacion: Optional[RecommendationResponse] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
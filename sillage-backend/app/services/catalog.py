@@ -0,0 +1,458 @@
+import asyncio
+import heapq
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, or_
+
+from app.core.config import settings
+from app.models.perfume import Perfume
+from app.utils.text import normalize_text, build_search_text
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+def _intern_list(values: Optional[Iterable[str]]) -> Optional[Tuple[str, ...]]:
+    if not values:
+        return None
+    return tuple(sys.intern(str(v)) for v in values)
+
+
+def match_score(search_text: str, q_norm: str) -> Optional[Tuple[int, int]]:
+    """Puntaje de coincidencia (menor es mejor) o None si no coincide.
+
+    Cada palabra de la búsqueda debe ser prefijo de alguna palabra del texto.
+    """
+    words = search_text.split(" ")
+    for token in q_norm.split(" "):
+        if not any(word.startswith(token) for word in words):
+            return None
+    position = search_text.find(q_norm)
+    if position == 0:
+        return (0, len(search_text))
+    if position > 0:
+        return (1, position)
+    return (2, len(search_text))
+
+
+def sort_key(search_text: str, perfume_id: int, q_norm: str) -> Optional[tuple]:
+    """Clave de orden de un resultado de búsqueda (None si no coincide)"""
+    if not q_norm:
+        return (perfume_id,)
+    score = match_score(search_text, q_norm)
+    if score is None:
+        return None
+    return (score, perfume_id)
+
+
+class FacetCounter:
+    """Conteo de perfumes por marca, acorde y nota, agrupado por forma normalizada"""
+
+    FACETS = ("marcas", "acordes", "notas")
+
+    def __init__(self):
+        self.total = 0
+        self.counts: Dict[str, Counter] = {facet: Counter() for facet in self.FACETS}
+        self.labels: Dict[str, Dict[str, str]] = {facet: {} for facet in self.FACETS}
+
+    def _count(self, facet: str, values: Iterable[str], normalize: Callable[[str], str]) -> None:
+        counts = self.counts[facet]
+        labels = self.labels[facet]
+        for value in values:
+            clave = normalize(value)
+            if not clave:
+                continue
+            counts[clave] += 1
+            labels.setdefault(clave, value)
+
+    def add(
+        self,
+        marca: Optional[str],
+        acordes: Optional[Iterable[str]],
+        notas: Optional[Iterable[str]],
+        normalize: Callable[[str], str] = normalize_text,
+    ) -> None:
+        """Contar un perfume (cada valor una sola vez por perfume)"""
+        self.total += 1
+        self._count("marcas", [marca] if marca else [], normalize)
+        self._count("acordes", {normalize(a): a for a in acordes or ()}.values(), normalize)
+        self._count("notas", {normalize(n): n for n in notas or ()}.values(), normalize)
+
+    def copy(self) -> "FacetCounter":
+        clone = FacetCounter()
+        clone.total = self.total
+        for facet in self.FACETS:
+            clone.counts[facet] = self.counts[facet].copy()
+            clone.labels[facet] = dict(self.labels[facet])
+        return clone
+
+    def top(self, limit: int) -> dict:
+        """Los `limit` valores más frecuentes de cada faceta"""
+        result = {"total": self.total}
+        for facet in self.FACETS:
+            labels = self.labels[facet]
+            items = sorted(self.counts[facet].items(), key=lambda item: (-item[1], item[0]))
+            result[facet] = [
+                {"valor": labels[clave], "total": total} for clave, total in items[:limit]
+            ]
+        return result
+
+
+class CatalogReadModel:
+    """Modelo de lectura en memoria del catálogo público de perfumes.
+
+    Las columnas se guardan en listas/arrays paralelos (una posición por fila),
+    con marcas, perfumistas, notas y acordes internados para compartir memoria.
+    El índice de prefijos es una lista ordenada de palabras normalizadas.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.watermark: Optional[datetime] = None
+        self.generation = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable] = []
+        self._reset()
+
+    def _reset(self):
+        self._ids = array("i")
+        self._nombres: List[str] = []
+        self._marcas: List[str] = []
+        self._perfumistas: List[Optional[str]] = []
+        self._created_by: List[Optional[int]] = []
+        self._notas: List[Optional[Tuple[str, ...]]] = []
+        self._acordes: List[Optional[Tuple[str, ...]]] = []
+        self._created_at: List[Optional[datetime]] = []
+        self._updated_at: List[Optional[datetime]] = []
+        self._search_texts: List[str] = []
+        self._row_by_id: Dict[int, int] = {}
+        self._normalized: Dict[str, str] = {}
+        self._order = array("i")
+        self._prefix_keys: List[str] = []
+        self._prefix_rows = array("i")
+        self.facets = FacetCounter()
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    # ------------------------------------------------------------------
+    # Carga y refresco
+    # ------------------------------------------------------------------
+
+    async def load(self, db) -> None:
+        """Carga completa del catálogo público"""
+        async with self._lock:
+            result = await db.execute(
+                select(Perfume).where(Perfume.is_private.is_(False)).order_by(Perfume.id)
+            )
+            self._reset()
+            self.watermark = None
+            self._apply(result.scalars().all(), full=True)
+            self.ready = True
+
+    async def refresh(self, db) -> int:
+        """Refresco incremental usando created_at/updated_at como marca de agua.
+
+        Los timestamps salen de now() (inicio de la transacción): una transacción
+        larga confirma filas con fechas anteriores a la marca ya alcanzada. Por eso
+        se relee una ventana de solape; aplicar filas sin cambios no hace nada.
+        """
+        if not self.ready:
+            await self.load(db)
+            return len(self)
+
+        async with self._lock:
+            query = select(Perfume).order_by(Perfume.id)
+            if self.watermark is not None:
+                since = self.watermark - timedelta(seconds=settings.CATALOG_REFRESH_LOOKBACK_SECONDS)
+                query = query.where(
+                    or_(
+                        Perfume.created_at >= since,
+                        Perfume.updated_at >= since
+                    )
+                )
+            result = await db.execute(query)
+            return self._apply(result.scalars().all())
+
+    def add_listener(self, callback: Callable) -> None:
+        """Registrar callback(upserted, removed_ids, full) para cambios del catálogo"""
+        self._listeners.append(callback)
+
+    def _apply(self, perfumes: Sequence[Perfume], full: bool = False) -> int:
+        changed = 0
+        upserted: List[Perfume] = []
+        removed: List[int] = []
+        for perfume in perfumes:
+            for ts in (perfume.created_at, perfume.updated_at):
+                if ts is not None and (self.watermark is None or ts > self.watermark):
+                    self.watermark = ts
+
+            row = self._row_by_id.get(perfume.id)
+            if perfume.is_private:
+                if row is not None:
+                    del self._row_by_id[perfume.id]
+                    removed.append(perfume.id)
+                    changed += 1
+                continue
+
+            if row is not None and self._updated_at[row] == perfume.updated_at \
+                    and self._created_at[row] == perfume.created_at:
+                continue
+
+            values = (
+                perfume.nombre,
+                _intern(perfume.marca),
+                _intern(perfume.perfumista),
+                perfume.created_by,
+                _intern_list(perfume.notas),
+                _intern_list(perfume.acordes),
+                perfume.created_at,
+                perfume.updated_at,
+                perfume.search_text or build_search_text(perfume.nombre, perfume.marca),
+            )
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(perfume.id)
+                for column, value in zip(self._columns(), values):
+                    column.append(value)
+                self._row_by_id[perfume.id] = row
+            else:
+                for column, value in zip(self._columns(), values):
+                    column[row] = value
+            upserted.append(perfume)
+            changed += 1
+
+        if changed:
+            self._rebuild_indexes()
+            self.generation += 1
+        if changed or full:
+            for listener in self._listeners:
+                try:
+                    listener(upserted, removed, full)
+                except Exception as e:
+                    print(f"Error al notificar cambios del catálogo: {e}")
+        return changed
+
+    def _columns(self):
+        return (
+            self._nombres, self._marcas, self._perfumistas, self._created_by, self._notas,
+            self._acordes, self._created_at, self._updated_at, self._search_texts,
+        )
+
+    def _rebuild_indexes(self) -> None:
+        alive_rows = list(self._row_by_id.values())
+        alive_rows.sort(key=lambda row: self._ids[row])
+        self._order = array("i", alive_rows)
+
+        # Agregados precalculados del catálogo completo (sin filtros)
+        facets = FacetCounter()
+        for row in alive_rows:
+            facets.add(self._marcas[row], self._acordes[row], self._notas[row], self._normalize)
+        self.facets = facets
+
+        pairs = []
+        for row in alive_rows:
+            for word in set(self._search_texts[row].split(" ")):
+                if word:
+                    pairs.append((sys.intern(word), row))
+        pairs.sort()
+        self._prefix_keys = [word for word, _ in pairs]
+        self._prefix_rows = array("i", (row for _, row in pairs))
+
+    async def _refresh_loop(self, session_factory, interval: int, version_source=None) -> None:
+        # Con una fuente de versión (Redis) se recarga completo en cuanto cambia el catálogo;
+        # sin cambios de versión, refresco incremental cada `interval`
+        step = min(interval, 5) if version_source else interval
+        last_version = await version_source() if version_source else None
+        elapsed = 0
+        while True:
+            await asyncio.sleep(step)
+            elapsed += step
+            version = await version_source() if version_source else None
+            if version == last_version and elapsed < interval:
+                continue
+            try:
+                async with session_factory() as db:
+                    if version != last_version:
+                        await self.load(db)
+                    else:
+                        await self.refresh(db)
+                last_version = version
+                elapsed = 0
+            except Exception as e:
+                print(f"Error al refrescar catálogo en memoria: {e}")
+
+    def start(self, session_factory, interval: int, version_source=None) -> None:
+        """Iniciar el refresco periódico en segundo plano"""
+        if self._task is None:
+            self._task = asyncio.create_task(
+                self._refresh_loop(session_factory, interval, version_source)
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def _prefix_candidates(self, token: str) -> List[int]:
+        start = bisect_left(self._prefix_keys, token)
+        rows = []
+        for i in range(start, len(self._prefix_keys)):
+            if not self._prefix_keys[i].startswith(token):
+                break
+            rows.append(self._prefix_rows[i])
+        return rows
+
+    def _normalize(self, value: str) -> str:
+        # Marcas y acordes están internados: el vocabulario es pequeño
+        normalized = self._normalized.get(value)
+        if normalized is None:
+            normalized = self._normalized[value] = normalize_text(value)
+        return normalized
+
+    def _candidates(self, q_norm: str, after: Optional[tuple] = None) -> Iterable[int]:
+        if not q_norm:
+            # Sin texto el orden es por id: se retoma justo después del cursor
+            start = 0
+            if after is not None:
+                start = bisect_right(self._order, after[0], key=lambda row: self._ids[row])
+            return islice(self._order, start, None)
+        # La palabra más larga de la búsqueda es la más selectiva
+        token = max(q_norm.split(" "), key=len)
+        return set(self._prefix_candidates(token))
+
+    def _matching(
+        self,
+        q: Optional[str],
+        marca: Optional[str],
+        acorde: Optional[str],
+        nota: Optional[str],
+        after: Optional[tuple] = None,
+    ) -> Iterator[Tuple[tuple, int]]:
+        """Recorrer (clave de orden, fila) de las filas que cumplen los filtros"""
+        q_norm = normalize_text(q)
+        marca_norm = normalize_text(marca)
+        acorde_norm = normalize_text(acorde)
+        nota_norm = normalize_text(nota)
+
+        for row in self._candidates(q_norm, after):
+            if marca_norm and marca_norm not in self._normalize(self._marcas[row]):
+                continue
+            if acorde_norm and not any(
+                self._normalize(a) == acorde_norm for a in (self._acordes[row] or ())
+            ):
+                continue
+            if nota_norm and not any(
+                self._normalize(n) == nota_norm for n in (self._notas[row] or ())
+            ):
+                continue
+            key = sort_key(self._search_texts[row], self._ids[row], q_norm)
+            if key is not None and (after is None or key > after):
+                yield key, row
+
+    def search_ranked(
+        self,
+        q: Optional[str] = None,
+        marca: Optional[str] = None,
+        acorde: Optional[str] = None,
+        nota: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[tuple] = None,
+    ) -> List[Tuple[tuple, dict]]:
+        """Buscar en el catálogo público; devuelve pares (clave de orden, perfume).
+
+        `after` es la clave de orden de la última fila de la página anterior.
+        """
+        matches = self._matching(q, marca, acorde, nota, after)
+        if normalize_text(q):
+            scored = heapq.nsmallest(limit, matches)
+        else:
+            # Sin texto el orden es por id, que ya es el orden de recorrido
+            scored = list(islice(matches, limit))
+        return [(key, self.to_dict(row)) for key, row in scored]
+
+    def facet_counts(
+        self,
+        q: Optional[str] = None,
+        marca: Optional[str] = None,
+        acorde: Optional[str] = None,
+        nota: Optional[str] = None,
+    ) -> FacetCounter:
+        """Conteos de facetas en una sola pasada sobre las filas que coinciden"""
+        if not (normalize_text(q) or marca or acorde or nota):
+            return self.facets.copy()
+
+        counter = FacetCounter()
+        for _, row in self._matching(q, marca, acorde, nota):
+            counter.add(self._marcas[row], self._acordes[row], self._notas[row], self._normalize)
+        return counter
+
+    def search(
+        self,
+        q: Optional[str] = None,
+        marca: Optional[str] = None,
+        acorde: Optional[str] = None,
+        nota: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[dict]:
+        """Buscar en el catálogo público (coincidencia por prefijos de palabra)"""
+        return [perfume for _, perfume in self.search_ranked(q, marca, acorde, nota, limit)]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[dict]:
+        """Sugerencias {id, nombre, marca} para un prefijo"""
+        q_norm = normalize_text(prefix)
+        if not q_norm:
+            return []
+        scored = []
+        for row in self._candidates(q_norm):
+            score = match_score(self._search_texts[row], q_norm)
+            if score is not None:
+                scored.append((score, self._ids[row], row))
+        scored.sort()
+        return [
+            {"id": self._ids[row], "nombre": self._nombres[row], "marca": self._marcas[row]}
+            for _, _, row in scored[:limit]
+        ]
+
+    def all(self) -> Iterator[dict]:
+        """Todos los perfumes públicos en orden de id"""
+        return (self.to_dict(row) for row in self._order)
+
+    def get(self, perfume_id: int) -> Optional[dict]:
+        """Perfume público por id (None si no está en el catálogo)"""
+        row = self._row_by_id.get(perfume_id)
+        return self.to_dict(row) if row is not None else None
+
+    def to_dict(self, row: int) -> dict:
+        return {
+            "id": self._ids[row],
+            "nombre": self._nombres[row],
+            "marca": self._marcas[row],
+            "perfumista": self._perfumistas[row],
+            "notas": list(self._notas[row]) if self._notas[row] is not None else None,
+            "acordes": list(self._acordes[row]) if self._acordes[row] is not None else None,
+            "is_private": False,
+            "created_by": self._created_by[row],
+            "created_at": self._created_at[row],
+            "updated_at": self._updated_at[row],
+        }
+
+
+# Instancia global
+catalog = CatalogReadModel()
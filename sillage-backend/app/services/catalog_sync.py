@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, or_
+
+from app.core.config import settings
+from app.models.perfume import Perfume
+from app.services.catalog import catalog
+
+# Columnas del snapshot; cada perfume se envía como una lista en este orden
+SNAPSHOT_FIELDS = (
+    "id", "nombre", "marca", "perfumista", "notas", "acordes", "created_at", "updated_at",
+)
+
+
+class DeltaTooLarge(Exception):
+    """Hay más cambios que CATALOG_DELTA_MAX_ROWS: el cliente debe bajar el snapshot"""
+
+
+@dataclass
+class CatalogSnapshot:
+    version: Optional[str]
+    total: int
+    etag: str
+    body: bytes  # JSON comprimido con gzip
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value)}")
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite devuelve fechas sin zona; se asumen en UTC como en PostgreSQL
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _version(watermark: Optional[datetime]) -> Optional[str]:
+    return _as_utc(watermark).isoformat() if watermark else None
+
+
+def _watermark(perfumes: Iterable, current: Optional[datetime] = None) -> Optional[datetime]:
+    for perfume in perfumes:
+        for ts in (perfume.created_at, perfume.updated_at):
+            if ts is not None and (current is None or _as_utc(ts) > current):
+                current = _as_utc(ts)
+    return current
+
+
+def build_snapshot(perfumes: Iterable[dict], watermark: Optional[datetime]) -> CatalogSnapshot:
+    """Serializar el catálogo como JSON columnar comprimido"""
+    rows = [[perfume[field] for field in SNAPSHOT_FIELDS] for perfume in perfumes]
+    raw = json.dumps(
+        {
+            "version": _version(watermark),
+            "campos": SNAPSHOT_FIELDS,
+            "perfumes": rows,
+        },
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=_json_default,
+    ).encode("utf-8")
+    return CatalogSnapshot(
+        version=_version(watermark),
+        total=len(rows),
+        etag=f'"{hashlib.sha1(raw).hexdigest()[:20]}"',
+        body=gzip.compress(raw, compresslevel=6, mtime=0),
+    )
+
+
+_cached: Optional[Tuple[int, CatalogSnapshot]] = None
+
+
+async def get_catalog_snapshot(db) -> CatalogSnapshot:
+    """Snapshot del catálogo público; desde memoria se reconstruye solo si cambió"""
+    global _cached
+    if catalog.ready:
+        if _cached is None or _cached[0] != catalog.generation:
+            _cached = (catalog.generation, build_snapshot(catalog.all(), catalog.watermark))
+        return _cached[1]
+
+    result = await db.execute(
+        select(Perfume).where(Perfume.is_private.is_(False)).order_by(Perfume.id)
+    )
+    perfumes = result.scalars().all()
+    return build_snapshot(
+        ({field: getattr(p, field) for field in SNAPSHOT_FIELDS} for p in perfumes),
+        _watermark(perfumes),
+    )
+
+
+async def get_catalog_delta(db, since: datetime) -> dict:
+    """Perfumes públicos creados/actualizados desde `since` e ids que dejaron de ser públicos"""
+    since = _as_utc(since)
+    # Ventana de solape: filas confirmadas tarde con un now() anterior a la versión ya
+    # entregada. Reenviarlas es inocuo porque el cliente aplica por id.
+    window = since - timedelta(seconds=settings.CATALOG_REFRESH_LOOKBACK_SECONDS)
+    result = await db.execute(
+        select(Perfume)
+        .where(or_(Perfume.created_at >= window, Perfume.updated_at >= window))
+        .order_by(Perfume.id)
+        .limit(settings.CATALOG_DELTA_MAX_ROWS + 1)
+    )
+    changed = result.scalars().all()
+    if len(changed) > settings.CATALOG_DELTA_MAX_ROWS:
+        raise DeltaTooLarge()
+
+    publicos = [perfume for perfume in changed if not perfume.is_private]
+    perfumes: List[dict] = [
+        {field: getattr(perfume, field) for field in SNAPSHOT_FIELDS} for perfume in publicos
+    ]
+    eliminados: List[int] = [
+        # Solo los que pasaron a privados; los creados como privados nunca se publicaron
+        perfume.id for perfume in changed
+        if perfume.is_private and perfume.updated_at is not None and _as_utc(perfume.updated_at) >= window
+    ]
+
+    return {
+        # La versión sale solo de filas que el cliente puede ver y nunca retrocede
+        "version": _version(_watermark(publicos, since)),
+        "perfumes": perfumes,
+        "eliminados": eliminados,
+    }
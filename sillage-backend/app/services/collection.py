@@ -0,0 +1,109 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import select, and_, or_, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.core.database import get_dialect_name
+from app.models.perfume import Perfume, perfume_collection
+
+
+def _unique(ids: Sequence[int]) -> List[int]:
+    return list(dict.fromkeys(ids))
+
+
+async def upsert_collection_entries(
+    db,
+    user_id: int,
+    perfume_ids: Sequence[int],
+    added_at: Optional[datetime] = None,
+) -> Set[int]:
+    """Agregar (o reactivar) perfumes visibles con un único INSERT ... ON CONFLICT DO UPDATE.
+
+    Devuelve los ids agregados; los que faltan ya estaban activos o no son visibles.
+    """
+    if not perfume_ids:
+        return set()
+    insert = pg_insert if get_dialect_name(db) == "postgresql" else sqlite_insert
+    visibles = select(
+        literal(user_id), Perfume.id, literal(added_at or datetime.utcnow())
+    ).where(
+        and_(
+            Perfume.id.in_(_unique(perfume_ids)),
+            or_(Perfume.is_private.is_(False), Perfume.created_by == user_id)
+        )
+    )
+    stmt = insert(perfume_collection).from_select(
+        ["user_id", "perfume_id", "added_at"], visibles
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[perfume_collection.c.user_id, perfume_collection.c.perfume_id],
+        set_={"removed_at": None, "added_at": stmt.excluded.added_at},
+        where=perfume_collection.c.removed_at.is_not(None),
+    ).returning(perfume_collection.c.perfume_id)
+    result = await db.execute(stmt)
+    return set(result.scalars().all())
+
+
+async def active_collection_ids(db, user_id: int, perfume_ids: Sequence[int]) -> Set[int]:
+    """Ids que ya están activos en la colección (búsqueda por clave primaria)"""
+    if not perfume_ids:
+        return set()
+    result = await db.execute(
+        select(perfume_collection.c.perfume_id).where(
+            and_(
+                perfume_collection.c.user_id == user_id,
+                perfume_collection.c.perfume_id.in_(list(perfume_ids)),
+                perfume_collection.c.removed_at.is_(None)
+            )
+        )
+    )
+    return set(result.scalars().all())
+
+
+async def apply_collection_changes(
+    db,
+    user_id: int,
+    agregar: Sequence[int],
+    eliminar: Sequence[int],
+) -> Dict[int, str]:
+    """Agregar/eliminar varios perfumes de la colección con operaciones por conjunto.
+
+    No hace commit: el llamador confirma todo en una sola transacción.
+    Devuelve el estado de cada id.
+    """
+    agregar, eliminar = _unique(agregar), _unique(eliminar)
+    estados: Dict[int, str] = {}
+    now = datetime.utcnow()
+
+    if agregar:
+        agregados = await upsert_collection_entries(db, user_id, agregar, now)
+        pendientes = [perfume_id for perfume_id in agregar if perfume_id not in agregados]
+        ya_activos = await active_collection_ids(db, user_id, pendientes)
+        for perfume_id in agregar:
+            if perfume_id in agregados:
+                estados[perfume_id] = "agregado"
+            elif perfume_id in ya_activos:
+                estados[perfume_id] = "ya_en_coleccion"
+            else:
+                estados[perfume_id] = "no_encontrado"
+
+    if eliminar:
+        result = await db.execute(
+            perfume_collection.update()
+            .where(
+                and_(
+                    perfume_collection.c.user_id == user_id,
+                    perfume_collection.c.perfume_id.in_(eliminar),
+                    perfume_collection.c.removed_at.is_(None)
+                )
+            )
+            .values(removed_at=now)
+            .returning(perfume_collection.c.perfume_id)
+        )
+        eliminados = set(result.scalars().all())
+        for perfume_id in eliminar:
+            estados[perfume_id] = "eliminado" if perfume_id in eliminados else "no_en_coleccion"
+
+    return estados
@@ -1,12 +1,157 @@
 import httpx
+import json
 import random
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from app.core.config import settings
 from app.models.perfume import Perfume
+from app.services.http_clients import http_clients
+from app.services.resilience import guards
 
 
-def build_prompt(
-    perfumes: List[Perfume],
+class StreamInterrupted(Exception):
+    """El stream de Gemini se cortó antes de terminar (la respuesta quedó incompleta)"""
+
+
+# Estación por mes (hemisferio sur)
+ESTACIONES = {
+    1: "verano", 2: "verano", 3: "otoño", 4: "otoño",
+    5: "invierno", 6: "invierno", 7: "invierno",
+    8: "primavera", 9: "primavera", 10: "primavera",
+    11: "verano", 12: "verano"
+}
+
+
+def estacion_del_mes(mes: int) -> str:
+    return ESTACIONES.get(mes, "desconocida")
+
+
+def momento_del_dia(hora: int) -> str:
+    return "mañana" if hora < 12 else "tarde" if hora < 19 else "noche"
+
+
+# Esquema de respuesta del modo estructurado (subconjunto OpenAPI que acepta Gemini)
+RECOMMENDATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "perfume_id": {"type": "STRING"},
+        "explicacion": {"type": "STRING"},
+        "alternativas": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["perfume_id", "explicacion"],
+}
+
+
+class StructuredRecommendation(BaseModel):
+    """Respuesta estructurada de Gemini (validación estricta)"""
+    model_config = ConfigDict(extra="forbid", strict=True)
+
+    perfume_id: str
+    explicacion: str = Field(..., min_length=1)
+    alternativas: List[str] = Field(default_factory=list, max_length=5)
+
+
+BATCH_RECOMMENDATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "recomendaciones": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "evento": {"type": "INTEGER"},
+                    **RECOMMENDATION_SCHEMA["properties"],
+                },
+                "required": ["evento", "perfume_id", "explicacion"],
+            },
+        },
+    },
+    "required": ["recomendaciones"],
+}
+
+
+class StructuredEventRecommendation(StructuredRecommendation):
+    evento: int
+
+
+class StructuredBatchRecommendation(BaseModel):
+    """Respuesta estructurada de Gemini para varios eventos"""
+    model_config = ConfigDict(extra="forbid", strict=True)
+
+    recomendaciones: List[StructuredEventRecommendation]
+
+
+def short_perfume_ids(perfumes: List[Perfume]) -> Dict[str, Perfume]:
+    """Ids cortos y estables para el prompt ("P1", "P2"...) según el orden de la lista"""
+    return {f"P{i}": perfume for i, perfume in enumerate(perfumes, 1)}
+
+
+def parse_structured_recommendation(
+    text: Optional[str],
+    short_ids: Dict[str, Perfume]
+) -> Optional[Tuple[Perfume, str, List[Perfume]]]:
+    """Validar la respuesta JSON: (perfume, explicación, alternativas) o None si no cumple"""
+    if not text:
+        return None
+    try:
+        data = StructuredRecommendation.model_validate_json(text)
+    except ValidationError:
+        return None
+    return _resolve_ids(data, short_ids)
+
+
+def _short_id(value: str) -> str:
+    # El prompt muestra los ids como "[P3]": se aceptan con corchetes, espacios o en minúscula
+    return value.strip().strip("[]").strip().upper()
+
+
+def _resolve_ids(
+    data: StructuredRecommendation,
+    short_ids: Dict[str, Perfume]
+) -> Optional[Tuple[Perfume, str, List[Perfume]]]:
+    perfume = short_ids.get(_short_id(data.perfume_id))
+    if perfume is None:
+        return None
+    alternativas = [
+        short_ids[_short_id(alt)] for alt in data.alternativas
+        if _short_id(alt) in short_ids and short_ids[_short_id(alt)] is not perfume
+    ]
+    return perfume, data.explicacion.strip(), alternativas
+
+
+def parse_batch_recommendations(
+    text: Optional[str],
+    short_ids: Dict[str, Perfume],
+    total: int
+) -> Dict[int, Tuple[Perfume, str, List[Perfume]]]:
+    """Respuestas válidas por número de evento (1..total); las inválidas se omiten"""
+    if not text:
+        return {}
+    try:
+        data = StructuredBatchRecommendation.model_validate_json(text)
+    except ValidationError:
+        return {}
+    resultado = {}
+    for item in data.recomendaciones:
+        if not 1 <= item.evento <= total or item.evento in resultado:
+            continue
+        parsed = _resolve_ids(item, short_ids)
+        if parsed is not None:
+            resultado[item.evento] = parsed
+    return resultado
+
+
+def _perfume_line(perfume: Perfume, short_id: Optional[str] = None) -> str:
+    return (
+        (f"- [{short_id}] " if short_id else "- ")
+        + f"{perfume.nombre} ({perfume.marca})"
+        + (f", perfumista: {perfume.perfumista}" if perfume.perfumista else "")
+        + (f", acordes: {', '.join(perfume.acordes)}" if perfume.acordes else "")
+        + (f", notas: {', '.join(perfume.notas[:5])}" if perfume.notas else "")
+    )
+
+
+def _event_context(
     fecha_evento,
     hora_evento,
     lugar_nombre: str,
@@ -19,51 +164,65 @@ def build_prompt(
     humedad: float,
     clima_descripcion: str
 ) -> str:
-    """Construir el prompt para Gemini"""
-    
-    # Determinar estación (hemisferio sur)
-    mes = fecha_evento.month
-    estaciones = {
-        1: "verano", 2: "verano", 3: "otoño", 4: "otoño",
-        5: "invierno", 6: "invierno", 7: "invierno",
-        8: "primavera", 9: "primavera", 10: "primavera",
-        11: "verano", 12: "verano"
-    }
-    estacion = estaciones.get(mes, "desconocida")
-    
-    # Determinar momento del día
-    hora = hora_evento.hour
-    momento_dia = "mañana" if hora < 12 else "tarde" if hora < 19 else "noche"
-    
-    # Mezclar perfumes aleatoriamente
-    perfumes_lista = list(perfumes)
-    random.shuffle(perfumes_lista)
-    
-    # Formatear lista de perfumes
-    perfumes_text = "\n".join([
-        f"- {p.nombre} ({p.marca})"
-        + (f", perfumista: {p.perfumista}" if p.perfumista else "")
-        + (f", acordes: {', '.join(p.acordes)}" if p.acordes else "")
-        + (f", notas: {', '.join(p.notas[:5])}" if p.notas else "")
-        for p in perfumes_lista
-    ])
-    
-    prompt = f"""Eres un experto perfumista. Recomienda el perfume MÁS ADECUADO de esta colección para el siguiente contexto:
-
-## CONTEXTO DEL EVENTO
-- Lugar: {lugar_nombre} ({lugar_tipo})
+    estacion = estacion_del_mes(fecha_evento.month)
+    momento_dia = momento_del_dia(hora_evento.hour)
+    return f"""- Lugar: {lugar_nombre} ({lugar_tipo})
 - Descripción: {lugar_descripcion}
 - Fecha y hora: {fecha_evento} {hora_evento} ({momento_dia})
 - Clima: {clima_descripcion}, {temperatura}°C, {humedad}% humedad
 - Estación: {estacion}
 - Ocasión: {ocasion}
 - Expectativa: {expectativa}
-- Vestimenta: {vestimenta}
+- Vestimenta: {vestimenta}"""
 
-## PERFUMES DISPONIBLES
-{perfumes_text}
 
-## INSTRUCCIONES
+def _perfumes_text(perfumes: List[Perfume], structured: bool) -> str:
+    # Mezclar perfumes aleatoriamente (los ids cortos no cambian con el orden)
+    ids_por_perfume = {id(p): short_id for short_id, p in short_perfume_ids(perfumes).items()}
+    perfumes_lista = list(perfumes)
+    random.shuffle(perfumes_lista)
+    
+    return "\n".join([
+        _perfume_line(p, ids_por_perfume[id(p)] if structured else None)
+        for p in perfumes_lista
+    ])
+
+
+def build_prompt(
+    perfumes: List[Perfume],
+    fecha_evento,
+    hora_evento,
+    lugar_nombre: str,
+    lugar_tipo: str,
+    lugar_descripcion: str,
+    ocasion: str,
+    expectativa: str,
+    vestimenta: str,
+    temperatura: float,
+    humedad: float,
+    clima_descripcion: str,
+    structured: bool = False
+) -> str:
+    """Construir el prompt para Gemini (`structured`: perfumes con id corto y respuesta JSON)"""
+    
+    contexto = _event_context(
+        fecha_evento, hora_evento, lugar_nombre, lugar_tipo, lugar_descripcion, ocasion,
+        expectativa, vestimenta, temperatura, humedad, clima_descripcion
+    )
+    perfumes_text = _perfumes_text(perfumes, structured)
+    
+    if structured:
+        instrucciones = """## INSTRUCCIONES
+1. Analiza el contexto completo
+2. Considera especialmente el clima, la hora y el tipo de lugar
+3. Elige UN SOLO perfume de la lista y indica su id sin corchetes (por ejemplo "P3")
+4. Explica brevemente (3-4 líneas) por qué es ideal para este contexto
+5. Opcionalmente indica hasta 2 alternativas (ids de la lista)
+
+Responde solo con JSON: {"perfume_id": "...", "explicacion": "...", "alternativas": ["..."]}
+"""
+    else:
+        instrucciones = """## INSTRUCCIONES
 1. Analiza el contexto completo
 2. Considera especialmente el clima, la hora y el tipo de lugar
 3. Elige UN SOLO perfume de la lista
@@ -75,14 +234,63 @@ FORMATO DE RESPUESTA:
 [Explicación breve de por qué es perfecto para esta ocasión]
 """
     
+    prompt = f"""Eres un experto perfumista. Recomienda el perfume MÁS ADECUADO de esta colección para el siguiente contexto:
+
+## CONTEXTO DEL EVENTO
+{contexto}
+
+## PERFUMES DISPONIBLES
+{perfumes_text}
+
+{instrucciones}"""
+    
     return prompt
 
 
-async def get_ai_recommendation(prompt: str) -> str:
-    """Llamar a Gemini AI para obtener recomendación"""
+def build_batch_prompt(perfumes: List[Perfume], eventos: List[Dict]) -> str:
+    """Prompt combinado para varios eventos (siempre con ids cortos y respuesta JSON).
+
+    Cada evento trae los argumentos de contexto de build_prompt.
+    """
+    bloques = "\n\n".join(
+        f"### EVENTO {numero}\n{_event_context(**evento)}"
+        for numero, evento in enumerate(eventos, 1)
+    )
+    return f"""Eres un experto perfumista. Para CADA uno de los siguientes eventos recomienda el perfume MÁS ADECUADO de esta colección:
+
+## EVENTOS
+{bloques}
+
+## PERFUMES DISPONIBLES
+{_perfumes_text(perfumes, True)}
+
+## INSTRUCCIONES
+1. Analiza cada evento por separado (clima, hora y tipo de lugar)
+2. Para cada evento elige UN SOLO perfume de la lista y indica su id sin corchetes (por ejemplo "P3")
+3. Puedes repetir perfume entre eventos si es lo más adecuado
+4. Explica brevemente (2-3 líneas) por qué es ideal para ese evento
+5. Opcionalmente indica hasta 2 alternativas por evento (ids de la lista)
+
+Responde solo con JSON: {{"recomendaciones": [{{"evento": 1, "perfume_id": "...", "explicacion": "...", "alternativas": ["..."]}}]}}
+"""
+
+
+def _candidate_text(data: dict) -> str:
+    return data.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+
+
+async def get_ai_recommendation(
+    prompt: str,
+    client: Optional[httpx.AsyncClient] = None,
+    response_schema: Optional[Dict] = None
+) -> Optional[str]:
+    """Llamar a Gemini AI para obtener recomendación (None si falla).
+
+    Con `response_schema` se pide salida JSON que cumpla el esquema.
+    """
     
     api_key = settings.GEMINI_API_KEY
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
+    url = "/v1beta/models/gemini-2.0-flash:generateContent"
     
     payload = {
         "contents": [
@@ -91,15 +299,59 @@ async def get_ai_recommendation(prompt: str) -> str:
             }
         ]
     }
+    if response_schema:
+        payload["generationConfig"] = {
+            "responseMimeType": "application/json",
+            "responseSchema": response_schema
+        }
     
+    client = client or http_clients.get("gemini")
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            
-            data = response.json()
-            return data.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-            
+        # Reintentos, bulkhead y circuit breaker: con Gemini caído se falla al instante
+        response = await guards.get("gemini").request(
+            lambda: client.post(url, params={"key": api_key}, json=payload)
+        )
+        response.raise_for_status()
+        
+        return _candidate_text(response.json())
+        
     except Exception as e:
         print(f"Error al llamar Gemini: {e}")
-        return "No se pudo generar una recomendación en este momento."
\ No newline at end of file
+        return None
+
+
+async def stream_ai_recommendation(
+    prompt: str,
+    client: Optional[httpx.AsyncClient] = None
+) -> AsyncIterator[str]:
+    """Llamar a Gemini en modo streaming (SSE) y producir los fragmentos de texto.
+
+    Si falla (al inicio o a mitad de camino) lanza StreamInterrupted: el texto
+    recibido hasta ese momento está incompleto y no debe usarse.
+    """
+    
+    url = "/v1beta/models/gemini-2.0-flash:streamGenerateContent"
+    payload = {
+        "contents": [
+            {
+                "parts": [{"text": prompt}]
+            }
+        ]
+    }
+    
+    client = client or http_clients.get("gemini")
+    try:
+        async with guards.get("gemini").stream(), client.stream(
+            "POST", url, params={"key": settings.GEMINI_API_KEY, "alt": "sse"}, json=payload
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                text = _candidate_text(json.loads(line[5:]))
+                if text:
+                    yield text
+    
+    except Exception as e:
+        print(f"Error al llamar Gemini (streaming): {e}")
+        raise StreamInterrupted(str(e)) from e
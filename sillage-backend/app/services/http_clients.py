@@ -0,0 +1,84 @@
+from typing import Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# Configuración por proveedor: límites de conexiones, timeouts y resiliencia
+# (concurrencia máxima, reintentos y circuit breaker; ver app/services/resilience.py)
+PROVIDERS = {
+    "openweather": {
+        "base_url": "https://api.openweathermap.org",
+        "timeout": httpx.Timeout(10.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+        "resilience": {
+            "max_concurrent": 20,
+            "queue_timeout": 1.0,
+            "max_retries": 2,
+            "failure_threshold": 5,
+            "reset_seconds": 30.0,
+        },
+    },
+    "gemini": {
+        "base_url": "https://generativelanguage.googleapis.com",
+        "timeout": httpx.Timeout(30.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+        "resilience": {
+            "max_concurrent": 10,
+            "queue_timeout": 2.0,
+            "max_retries": 1,
+            "failure_threshold": 5,
+            "reset_seconds": 30.0,
+            # Una llamada cortada por el presupuesto de latencia tras 5s cuenta como fallo
+            "slow_call_seconds": 5.0,
+        },
+    },
+}
+
+
+class HttpClients:
+    """Clientes httpx de larga vida (uno por proveedor) con pool y keep-alive"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, httpx.AsyncBaseTransport] = {}
+
+    def _create(self, provider: str) -> httpx.AsyncClient:
+        config = PROVIDERS[provider]
+        transport = self._transports.get(provider)
+        return httpx.AsyncClient(
+            base_url=config["base_url"],
+            timeout=config["timeout"],
+            limits=config["limits"],
+            http2=HTTP2_AVAILABLE and transport is None,
+            transport=transport,
+        )
+
+    def start(self, transports: Optional[Dict[str, httpx.AsyncBaseTransport]] = None) -> None:
+        """Crear los clientes; `transports` permite inyectar transportes locales en tests"""
+        self._transports = dict(transports or {})
+        for provider in PROVIDERS:
+            if provider not in self._clients:
+                self._clients[provider] = self._create(provider)
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        """Cliente del proveedor (se crea si aún no existe, p. ej. en scripts)"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._clients[provider] = self._create(provider)
+        return client
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
+        self._transports = {}
+
+
+# Instancia global
+http_clients = HttpClients()
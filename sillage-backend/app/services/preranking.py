@@ -0,0 +1,169 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.models.perfume import Perfume
+from app.utils.text import normalize_text
+
+# Ejes de perfil olfativo sobre los que se comparan perfumes y contexto
+AXES = ("fresco", "calido", "floral", "amaderado", "dulce")
+_AXIS = {axis: i for i, axis in enumerate(AXES)}
+
+# Peso de acordes y notas al construir el perfil de un perfume
+ACORDE_WEIGHT = 2.0
+NOTA_WEIGHT = 1.0
+
+# Términos normalizados (acordes y notas) -> eje
+LEXICON = {
+    "fresco": (
+        "fresco", "citrico", "acuatico", "marino", "ozonico", "verde", "aromatico",
+        "aldehidico", "bergamota", "limon", "lima", "pomelo", "mandarina", "naranja",
+        "menta", "lavanda", "jengibre", "te verde", "neroli", "pepino", "salvia",
+    ),
+    "calido": (
+        "oriental", "ambar", "ambarado", "especiado", "cuero", "tabaco", "incienso",
+        "resinoso", "ahumado", "animalico", "oud", "canela", "pimienta", "cardamomo",
+        "clavo", "benjui", "almizcle", "trufa",
+    ),
+    "floral": (
+        "floral", "floral blanco", "rosa", "jazmin", "iris", "violeta", "tuberosa",
+        "peonia", "orquidea", "orquidea negra", "azahar", "ylang-ylang", "lirio",
+    ),
+    "amaderado": (
+        "amaderado", "cedro", "sandalo", "vetiver", "pachuli", "abedul", "musgo",
+        "musgo de roble", "guayaco", "ambroxan", "terroso",
+    ),
+    "dulce": (
+        "dulce", "gourmand", "vainilla", "praline", "caramelo", "miel", "haba tonka",
+        "chocolate", "cafe", "frutado", "pina", "pera", "manzana", "grosella negra",
+        "frambuesa", "coco",
+    ),
+}
+_TERM_AXIS = {term: _AXIS[axis] for axis, terms in LEXICON.items() for term in terms}
+
+# Preferencia de cada eje según la estación (hemisferio sur)
+SEASON_PROFILE = {
+    "verano": {"fresco": 1.0, "floral": 0.3, "calido": -0.8, "dulce": -0.4},
+    "primavera": {"fresco": 0.5, "floral": 0.8},
+    "otoño": {"amaderado": 0.8, "calido": 0.4, "fresco": -0.2},
+    "invierno": {"calido": 1.0, "dulce": 0.5, "amaderado": 0.5, "fresco": -0.6},
+}
+DAYTIME_PROFILE = {
+    "mañana": {"fresco": 0.6, "floral": 0.2, "calido": -0.3},
+    "tarde": {"floral": 0.3, "amaderado": 0.2},
+    "noche": {"calido": 0.6, "dulce": 0.3, "amaderado": 0.3, "fresco": -0.3},
+}
+VENUE_PROFILE = {
+    # En espacios cerrados se penalizan los perfumes de mucha proyección
+    "cerrado": {"calido": -0.3, "dulce": -0.2, "floral": 0.1},
+    "abierto": {"fresco": 0.3, "calido": 0.2},
+}
+
+
+def _add(vector: np.ndarray, profile: Dict[str, float], scale: float = 1.0) -> None:
+    for axis, weight in profile.items():
+        vector[_AXIS[axis]] += weight * scale
+
+
+def context_vector(
+    estacion: str,
+    momento_dia: str,
+    lugar_tipo: str,
+    temperatura: float,
+    humedad: float,
+) -> np.ndarray:
+    """Preferencia del contexto del evento sobre los ejes olfativos"""
+    vector = np.zeros(len(AXES))
+    _add(vector, SEASON_PROFILE.get(estacion, {}))
+    _add(vector, DAYTIME_PROFILE.get(momento_dia, {}))
+    _add(vector, VENUE_PROFILE.get(lugar_tipo, {}))
+
+    # Calor: frescos arriba, cálidos y dulces abajo (y al revés con frío)
+    calor = float(np.clip((temperatura - 18.0) / 10.0, -1.5, 1.5))
+    _add(vector, {"fresco": 1.0, "calido": -1.0, "dulce": -0.5}, calor)
+
+    # La humedad alta amplifica los perfumes densos
+    if humedad >= 70:
+        _add(vector, {"calido": -0.4, "dulce": -0.4, "fresco": 0.2})
+    return vector
+
+
+def perfume_profiles(perfumes: List[Perfume]) -> np.ndarray:
+    """Matriz perfume × eje con filas normalizadas (ceros si no hay términos conocidos)"""
+    profiles = np.zeros((len(perfumes), len(AXES)))
+    for row, perfume in enumerate(perfumes):
+        for values, weight in ((perfume.acordes, ACORDE_WEIGHT), (perfume.notas, NOTA_WEIGHT)):
+            for value in values or ():
+                axis = _TERM_AXIS.get(normalize_text(value))
+                if axis is not None:
+                    profiles[row, axis] += weight
+    norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+    np.divide(profiles, norms, out=profiles, where=norms > 0)
+    return profiles
+
+
+def score_perfumes(perfumes: List[Perfume], context: np.ndarray) -> np.ndarray:
+    """Afinidad de cada perfume con el contexto (producto matriz-vector)"""
+    return perfume_profiles(perfumes) @ context
+
+
+def prerank_perfumes(
+    perfumes: List[Perfume],
+    top_k: int,
+    estacion: str,
+    momento_dia: str,
+    lugar_tipo: str,
+    temperatura: float,
+    humedad: float,
+) -> List[Perfume]:
+    """Los `top_k` perfumes más afines al contexto, de mayor a menor puntaje.
+
+    Determinista: los empates se resuelven por id. Con colecciones pequeñas
+    (<= top_k) se devuelven todos.
+    """
+    if len(perfumes) <= top_k:
+        return list(perfumes)
+    scores = score_perfumes(
+        perfumes, context_vector(estacion, momento_dia, lugar_tipo, temperatura, humedad)
+    )
+    ids = np.array([perfume.id for perfume in perfumes])
+    order = np.lexsort((ids, -scores))[:top_k]
+    return [perfumes[i] for i in order]
+
+
+# Motivo legible del eje que más aporta a la elección local
+AXIS_REASONS = {
+    "fresco": "su perfil fresco acompaña bien el calor y la luz del día",
+    "calido": "su perfil cálido y especiado luce en noches y días fríos",
+    "floral": "su perfil floral es versátil para la estación",
+    "amaderado": "su base amaderada da elegancia sin saturar",
+    "dulce": "su perfil dulce resulta envolvente con temperaturas bajas",
+}
+
+
+def local_recommendation(
+    perfumes: List[Perfume],
+    estacion: str,
+    momento_dia: str,
+    lugar_tipo: str,
+    temperatura: float,
+    humedad: float,
+) -> Tuple[Perfume, str]:
+    """Recomendación sin red: el perfume más afín y un texto con el formato de la IA"""
+    context = context_vector(estacion, momento_dia, lugar_tipo, temperatura, humedad)
+    scores = score_perfumes(perfumes, context)
+    ids = np.array([perfume.id for perfume in perfumes])
+    best = int(np.lexsort((ids, -scores))[0])
+    perfume = perfumes[best]
+
+    contributions = perfume_profiles([perfume])[0] * context
+    if contributions.max() > 0:
+        motivo = AXIS_REASONS[AXES[int(contributions.argmax())]]
+    else:
+        motivo = "es la opción más equilibrada de tu colección para este contexto"
+    texto = (
+        f"{perfume.nombre}\n"
+        f"Para un lugar {lugar_tipo} en {estacion}, de {momento_dia}, con {temperatura:.0f}°C "
+        f"y {humedad:.0f}% de humedad: {motivo}."
+    )
+    return perfume, texto
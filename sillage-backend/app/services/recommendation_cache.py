@@ -0,0 +1,62 @@
+import hashlib
+import json
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.utils.cache import cache
+from app.utils.geohash import encode
+from app.utils.text import normalize_text
+
+RECOMMENDATION_KEY_PREFIX = "recommendations:cache"
+
+# Campos de texto libre del contexto (se normalizan: mayúsculas, tildes, espacios)
+CONTEXT_TEXT_FIELDS = (
+    "lugar_nombre", "lugar_tipo", "lugar_descripcion", "ocasion", "expectativa", "vestimenta",
+)
+
+
+def weather_bucket(weather: Dict) -> list:
+    """Clima discretizado: pequeñas variaciones no cambian la recomendación"""
+    return [
+        normalize_text(weather["descripcion"]),
+        round(weather["temperatura"]),
+        int(weather["humedad"] // 10),
+    ]
+
+
+def recommendation_cache_key(
+    user_id: int,
+    context: Dict,
+    weather: Dict,
+    collection_version: tuple,
+) -> str:
+    """Huella canónica del contexto, el clima y la versión de la colección del usuario"""
+    canonical = {
+        field: normalize_text(context.get(field) or "") for field in CONTEXT_TEXT_FIELDS
+    }
+    canonical.update(
+        fecha=context["fecha_evento"].isoformat(),
+        hora=context["hora_evento"].strftime("%H:%M"),
+        zona=encode(context["latitud"], context["longitud"], 6),
+        clima=weather_bucket(weather),
+        coleccion=collection_version,
+    )
+    raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return f"{RECOMMENDATION_KEY_PREFIX}:{user_id}:{digest}"
+
+
+async def get_cached_recommendation_id(key: str) -> Optional[int]:
+    try:
+        value = await cache.get(key)
+    except Exception as e:
+        print(f"Error al leer cache de recomendaciones: {e}")
+        return None
+    return int(value) if value is not None else None
+
+
+async def set_cached_recommendation_id(key: str, recommendation_id: int) -> None:
+    try:
+        await cache.set(key, recommendation_id, expire=settings.RECOMMENDATION_CACHE_TTL_SECONDS)
+    except Exception as e:
+        print(f"Error al guardar cache de recomendaciones: {e}")
@@ -1,44 +1,204 @@
-import re
-from typing import Optional, List
+import asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, and_, update
 
-from app.models.perfume import Perfume
+from app.core.config import settings
+from app.models.perfume import Perfume, perfume_collection
 from app.models.recommendation import Recomendacion
+from app.models.user import User
 from app.services.weather import get_weather_data
-from app.services.gemini import build_prompt, get_ai_recommendation
+from app.services.gemini import (
+    BATCH_RECOMMENDATION_SCHEMA,
+    RECOMMENDATION_SCHEMA,
+    build_batch_prompt,
+    build_prompt,
+    estacion_del_mes,
+    get_ai_recommendation,
+    momento_del_dia,
+    parse_batch_recommendations,
+    parse_structured_recommendation,
+    short_perfume_ids,
+    stream_ai_recommendation,
+    StreamInterrupted,
+)
+from app.services.preranking import local_recommendation, prerank_perfumes
+from app.services.recommendation_cache import (
+    get_cached_recommendation_id,
+    recommendation_cache_key,
+    set_cached_recommendation_id,
+)
+from app.services.versions import collection_version
+from app.utils.name_matcher import NameMatcher
 
 
-def extract_perfume_name(ai_response: str, perfumes: List[Perfume]) -> Optional[Perfume]:
-    """Extraer el perfume recomendado de la respuesta de la IA"""
-    
-    # Intentar encontrar el nombre del perfume al inicio de la respuesta
-    lines = ai_response.strip().split('\n')
-    if not lines:
-        return None
+# Matchers compilados por colección (user_id, versión de la colección)
+MATCHER_CACHE_SIZE = 256
+_matchers: "OrderedDict[tuple, NameMatcher[int]]" = OrderedDict()
+
+
+def collection_matcher(user_id: int, version: tuple, perfumes: List[Perfume]) -> NameMatcher[int]:
+    """Matcher de nombres de la colección (se compila solo cuando la colección cambia)"""
+    key = (user_id, version)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = _matchers[key] = NameMatcher((perfume.nombre, perfume.id) for perfume in perfumes)
+        if len(_matchers) > MATCHER_CACHE_SIZE:
+            _matchers.popitem(last=False)
+    else:
+        _matchers.move_to_end(key)
+    return matcher
+
+
+def extract_perfume_name(
+    ai_response: str,
+    perfumes: List[Perfume],
+    matcher: Optional[NameMatcher[int]] = None,
+) -> Optional[Perfume]:
+    """Extraer el perfume recomendado de la respuesta de la IA (el nombre más largo que aparezca)"""
+    if matcher is None:
+        matcher = NameMatcher((perfume.nombre, perfume.id) for perfume in perfumes)
+    return _find_perfume(perfumes, matcher.match(ai_response))
+
+
+DEFAULT_WEATHER = {
+    'descripcion': 'información no disponible',
+    'temperatura': 20.0,
+    'humedad': 60.0
+}
+
+
+async def _weather_and_cache_key(
+    user_id: int, context: Dict, version: tuple
+) -> Tuple[Dict, str]:
+    """Clima del evento y clave de cache de la recomendación"""
+    weather_data = await get_weather_data(
+        context["latitud"], context["longitud"], context["fecha_evento"], context["hora_evento"]
+    )
     
-    first_line = lines[0].strip()
+    if not weather_data:
+        weather_data = dict(DEFAULT_WEATHER)
     
-    # Limpiar el texto de posibles asteriscos o caracteres especiales
-    first_line = re.sub(r'[\*\#\-\:]', '', first_line).strip()
+    # Misma solicitud, mismo clima y misma colección: reutilizar el resultado previo
+    cache_key = recommendation_cache_key(
+        user_id, context, weather_data, version
+    )
+    return weather_data, cache_key
+
+
+async def _cached_recommendation(
+    db: AsyncSession, cache_key: str, user_id: int
+) -> Optional[Recomendacion]:
+    cached_id = await get_cached_recommendation_id(cache_key)
+    if cached_id is None:
+        return None
+    result = await db.execute(
+        select(Recomendacion).where(
+            and_(Recomendacion.id == cached_id, Recomendacion.user_id == user_id)
+        )
+    )
+    return result.scalar_one_or_none()
+
+
+def _event_profile(context: Dict, weather_data: Dict) -> Dict:
+    return {
+        "estacion": estacion_del_mes(context["fecha_evento"].month),
+        "momento_dia": momento_del_dia(context["hora_evento"].hour),
+        "lugar_tipo": context["lugar_tipo"],
+        "temperatura": weather_data['temperatura'],
+        "humedad": weather_data['humedad'],
+    }
+
+
+def _candidates(perfumes: List[Perfume], context: Dict, weather_data: Dict) -> List[Perfume]:
+    """Pre-ranking local: solo los perfumes más afines al contexto llegan al prompt"""
+    return prerank_perfumes(
+        perfumes,
+        settings.RECOMMENDATION_PROMPT_MAX_PERFUMES,
+        **_event_profile(context, weather_data)
+    )
+
+
+def _local_fallback(perfumes: List[Perfume], context: Dict, weather_data: Dict) -> Tuple[Perfume, str]:
+    """Recomendador local por reglas (sin red) para cuando la IA falla o se demora"""
+    return local_recommendation(perfumes, **_event_profile(context, weather_data))
+
+
+def _prompt_context(context: Dict, weather_data: Dict) -> Dict:
+    return dict(
+        fecha_evento=context["fecha_evento"],
+        hora_evento=context["hora_evento"],
+        lugar_nombre=context["lugar_nombre"],
+        lugar_tipo=context["lugar_tipo"],
+        lugar_descripcion=context["lugar_descripcion"],
+        ocasion=context["ocasion"],
+        expectativa=context["expectativa"],
+        vestimenta=context["vestimenta"],
+        temperatura=weather_data['temperatura'],
+        humedad=weather_data['humedad'],
+        clima_descripcion=weather_data['descripcion'],
+    )
+
+
+def _build_prompt(
+    perfumes: List[Perfume], context: Dict, weather_data: Dict, structured: bool = False
+) -> str:
+    return build_prompt(perfumes, **_prompt_context(context, weather_data), structured=structured)
+
+
+def _new_recommendation(
+    user_id: int,
+    context: Dict,
+    weather_data: Dict,
+    prompt: str,
+    ai_response: str,
+    recommended_perfume: Optional[Perfume],
+    es_fallback: bool = False,
+) -> Recomendacion:
+    return Recomendacion(
+        user_id=user_id,
+        **context,
+        clima_descripcion=weather_data['descripcion'],
+        temperatura=weather_data['temperatura'],
+        humedad=weather_data['humedad'],
+        prompt=prompt,
+        respuesta_ia=ai_response,
+        es_fallback=es_fallback,
+        perfume_recomendado_id=recommended_perfume.id if recommended_perfume else None,
+        explicacion=f"Recomendación: {recommended_perfume.nombre if recommended_perfume else 'No se pudo determinar'}"
+    )
+
+
+async def _save_recommendation(
+    db: AsyncSession,
+    user_id: int,
+    context: Dict,
+    weather_data: Dict,
+    prompt: str,
+    ai_response: str,
+    recommended_perfume: Optional[Perfume],
+    cache_key: str,
+    es_fallback: bool = False,
+    before_commit: Optional[Callable[[Recomendacion], Awaitable[None]]] = None,
+) -> Recomendacion:
+    """Crear el registro de recomendación (`before_commit` corre en la misma transacción)"""
+    recommendation = _new_recommendation(
+        user_id, context, weather_data, prompt, ai_response, recommended_perfume, es_fallback
+    )
     
-    # Buscar coincidencia con los perfumes disponibles
-    for perfume in perfumes:
-        # Comparación flexible
-        if perfume.nombre.lower() in first_line.lower():
-            return perfume
-        # También buscar sin espacios o guiones
-        perfume_clean = perfume.nombre.replace(' ', '').replace('-', '').lower()
-        first_clean = first_line.replace(' ', '').replace('-', '').lower()
-        if perfume_clean in first_clean:
-            return perfume
+    db.add(recommendation)
+    if before_commit is not None:
+        await db.flush()  # Para obtener el ID
+        await before_commit(recommendation)
+    await db.commit()
+    await db.refresh(recommendation)
     
-    # Si no encontramos en la primera línea, buscar en todo el texto
-    for perfume in perfumes:
-        if perfume.nombre.lower() in ai_response.lower():
-            return perfume
+    # Solo se cachean respuestas útiles de la IA: tras un fallback se vuelve a intentar
+    if recommended_perfume and not es_fallback:
+        await set_cached_recommendation_id(cache_key, recommendation.id)
     
-    return None
+    return recommendation
 
 
 async def generate_recommendation(
@@ -54,68 +214,318 @@ async def generate_recommendation(
     lugar_descripcion: str,
     ocasion: str,
     expectativa: str,
-    vestimenta: str
-) -> Recomendacion:
-    """Generar una recomendación completa"""
+    vestimenta: str,
+    before_commit: Optional[Callable[[Recomendacion, bool], Awaitable[None]]] = None
+) -> Tuple[Recomendacion, bool]:
+    """Generar una recomendación completa; devuelve (recomendación, desde_cache).
+
+    `before_commit(recomendación, desde_cache)` se ejecuta en la transacción que
+    guarda la fila, para que el llamador confirme sus cambios a la vez.
+    """
+    context = {
+        "fecha_evento": fecha_evento,
+        "hora_evento": hora_evento,
+        "latitud": latitud,
+        "longitud": longitud,
+        "lugar_nombre": lugar_nombre,
+        "lugar_tipo": lugar_tipo,
+        "lugar_descripcion": lugar_descripcion,
+        "ocasion": ocasion,
+        "expectativa": expectativa,
+        "vestimenta": vestimenta,
+    }
     
-    # Obtener datos del clima
-    weather_data = await get_weather_data(
-        latitud, longitud, fecha_evento, hora_evento
+    version = await collection_version(db, user_id)
+    weather_data, cache_key = await _weather_and_cache_key(user_id, context, version)
+    cached = await _cached_recommendation(db, cache_key, user_id)
+    if cached is not None:
+        if before_commit is not None:
+            await before_commit(cached, True)
+            await db.commit()
+        return cached, True
+    
+    candidates = _candidates(perfumes, context, weather_data)
+    structured = settings.RECOMMENDATION_STRUCTURED_OUTPUT
+    prompt = _build_prompt(candidates, context, weather_data, structured)
+    
+    # Obtener recomendación de la IA dentro del presupuesto de latencia
+    try:
+        ai_response = await asyncio.wait_for(
+            get_ai_recommendation(
+                prompt, response_schema=RECOMMENDATION_SCHEMA if structured else None
+            ),
+            settings.RECOMMENDATION_LLM_BUDGET_SECONDS
+        )
+    except asyncio.TimeoutError:
+        print("⏱️ Gemini no respondió a tiempo: se usa el recomendador local")
+        ai_response = None
+    
+    parsed = None
+    if structured:
+        parsed = parse_structured_recommendation(ai_response, short_perfume_ids(candidates))
+        if ai_response is not None and parsed is None:
+            # JSON que no cumple el esquema: no se guarda el JSON crudo como respuesta
+            print("⚠️ Respuesta estructurada inválida de Gemini: se usa el recomendador local")
+            ai_response = None
+    es_fallback = False
+    if ai_response is None:
+        recommended_perfume, ai_response = _local_fallback(candidates, context, weather_data)
+        es_fallback = True
+    elif parsed is not None:
+        # Id exacto: sin emparejar nombres; se guarda en el formato de texto habitual
+        recommended_perfume, explicacion, alternativas = parsed
+        ai_response = _structured_text(recommended_perfume, explicacion, alternativas)
+    else:
+        # Texto libre: extraer el perfume por nombre
+        recommended_perfume = extract_perfume_name(
+            ai_response, perfumes, collection_matcher(user_id, version, perfumes)
+        )
+    
+    recommendation = await _save_recommendation(
+        db, user_id, context, weather_data, prompt, ai_response, recommended_perfume, cache_key,
+        es_fallback,
+        before_commit=(lambda rec: before_commit(rec, False)) if before_commit else None
     )
+    return recommendation, False
+
+
+class QuotaExceeded(Exception):
+    """El usuario no tiene consultas suficientes para el lote"""
+
+
+async def recommend_batch(
+    db: AsyncSession,
+    user: User,
+    perfumes: List[Perfume],
+    events: List[Dict],
+) -> List[Recomendacion]:
+    """Recomendar varios eventos con una sola llamada a la IA.
+
+    El clima se resuelve en paralelo (un pronóstico por celda geohash gracias a
+    la caché con single-flight), las filas se guardan en una sola transacción
+    y las consultas se descuentan con un UPDATE condicional: todo o nada.
+    """
+    weathers = await asyncio.gather(*(
+        get_weather_data(event["latitud"], event["longitud"], event["fecha_evento"], event["hora_evento"])
+        for event in events
+    ))
+    weathers = [weather or dict(DEFAULT_WEATHER) for weather in weathers]
     
-    if not weather_data:
-        weather_data = {
-            'descripcion': 'información no disponible',
-            'temperatura': 20.0,
-            'humedad': 60.0
-        }
-    
-    # Construir prompt
-    prompt = build_prompt(
-        perfumes=perfumes,
-        fecha_evento=fecha_evento,
-        hora_evento=hora_evento,
-        lugar_nombre=lugar_nombre,
-        lugar_tipo=lugar_tipo,
-        lugar_descripcion=lugar_descripcion,
-        ocasion=ocasion,
-        expectativa=expectativa,
-        vestimenta=vestimenta,
-        temperatura=weather_data['temperatura'],
-        humedad=weather_data['humedad'],
-        clima_descripcion=weather_data['descripcion']
+    # Candidatos: unión de los pre-rankings de cada evento
+    candidates = list({
+        perfume.id: perfume
+        for event, weather in zip(events, weathers)
+        for perfume in _candidates(perfumes, event, weather)
+    }.values())
+    prompt = build_batch_prompt(
+        candidates, [_prompt_context(event, weather) for event, weather in zip(events, weathers)]
     )
     
-    # Obtener recomendación de la IA
-    ai_response = await get_ai_recommendation(prompt)
+    try:
+        ai_response = await asyncio.wait_for(
+            get_ai_recommendation(prompt, response_schema=BATCH_RECOMMENDATION_SCHEMA),
+            settings.RECOMMENDATION_LLM_BUDGET_SECONDS
+        )
+    except asyncio.TimeoutError:
+        print("⏱️ Gemini no respondió a tiempo (lote): se usa el recomendador local")
+        ai_response = None
+    parsed = parse_batch_recommendations(ai_response, short_perfume_ids(candidates), len(events))
     
-    # Extraer el perfume recomendado
-    recommended_perfume = extract_perfume_name(ai_response, perfumes)
+    recommendations = []
+    for numero, (event, weather) in enumerate(zip(events, weathers), 1):
+        if numero in parsed:
+            perfume, explicacion, alternativas = parsed[numero]
+            texto, es_fallback = _structured_text(perfume, explicacion, alternativas), False
+        else:
+            # Evento sin respuesta válida de la IA: recomendador local
+            (perfume, texto), es_fallback = _local_fallback(candidates, event, weather), True
+        recommendations.append(
+            _new_recommendation(user.id, event, weather, prompt, texto, perfume, es_fallback)
+        )
     
-    # Crear el registro de recomendación
-    recommendation = Recomendacion(
-        user_id=user_id,
-        fecha_evento=fecha_evento,
-        hora_evento=hora_evento,
-        latitud=latitud,
-        longitud=longitud,
-        lugar_nombre=lugar_nombre,
-        lugar_tipo=lugar_tipo,
-        lugar_descripcion=lugar_descripcion,
-        ocasion=ocasion,
-        expectativa=expectativa,
-        vestimenta=vestimenta,
-        clima_descripcion=weather_data['descripcion'],
-        temperatura=weather_data['temperatura'],
-        humedad=weather_data['humedad'],
-        prompt=prompt,
-        respuesta_ia=ai_response,
-        perfume_recomendado_id=recommended_perfume.id if recommended_perfume else None,
-        explicacion=f"Recomendación: {recommended_perfume.nombre if recommended_perfume else 'No se pudo determinar'}"
+    cost = sum(
+        1 for recommendation in recommendations
+        if not recommendation.es_fallback or settings.RECOMMENDATION_FALLBACK_CONSUMES_QUOTA
     )
-    
-    db.add(recommendation)
+    db.add_all(recommendations)
+    if cost:
+        result = await db.execute(
+            update(User)
+            .where(and_(User.id == user.id, User.consultas_restantes >= cost))
+            .values(consultas_restantes=User.consultas_restantes - cost)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            raise QuotaExceeded(cost)
     await db.commit()
-    await db.refresh(recommendation)
     
-    return recommendation
\ No newline at end of file
+    for recommendation in recommendations:
+        await db.refresh(recommendation)
+    await db.refresh(user)
+    return recommendations
+
+
+def _structured_text(perfume: Perfume, explicacion: str, alternativas: List[Perfume]) -> str:
+    texto = f"{perfume.nombre}\n{explicacion}"
+    if alternativas:
+        texto += "\nAlternativas: " + ", ".join(alt.nombre for alt in alternativas)
+    return texto
+
+
+async def load_active_collection(db: AsyncSession, user_id: int) -> List[Perfume]:
+    """Perfumes activos de la colección del usuario"""
+    result = await db.execute(
+        select(Perfume).join(
+            perfume_collection,
+            and_(
+                perfume_collection.c.perfume_id == Perfume.id,
+                perfume_collection.c.user_id == user_id,
+                perfume_collection.c.removed_at.is_(None)
+            )
+        )
+    )
+    return result.scalars().all()
+
+
+async def recommend_for_user(
+    db: AsyncSession,
+    user: User,
+    perfumes: List[Perfume],
+    request_fields: Dict,
+    on_saved: Optional[Callable[[Recomendacion], Awaitable[None]]] = None,
+) -> Recomendacion:
+    """Generar la recomendación y descontar la consulta (cache y fallback son configurables).
+
+    La fila, el descuento y `on_saved` se confirman en una sola transacción.
+    """
+    async def finalize(recommendation: Recomendacion, from_cache: bool) -> None:
+        if _charges_quota(from_cache, recommendation.es_fallback):
+            user.consultas_restantes -= 1
+        if on_saved is not None:
+            await on_saved(recommendation)
+    
+    recommendation, _ = await generate_recommendation(
+        db=db,
+        user_id=user.id,
+        perfumes=perfumes,
+        before_commit=finalize,
+        **request_fields
+    )
+    return recommendation
+
+
+def _charges_quota(from_cache: bool, es_fallback: bool) -> bool:
+    if from_cache and not settings.RECOMMENDATION_CACHE_HIT_CONSUMES_QUOTA:
+        return False
+    if es_fallback and not settings.RECOMMENDATION_FALLBACK_CONSUMES_QUOTA:
+        return False
+    return True
+
+
+def _quota_charge(user: User, from_cache: bool) -> Callable[[Recomendacion], Awaitable[None]]:
+    """`before_commit` que descuenta la consulta en la misma transacción que la fila"""
+    async def charge(recommendation: Recomendacion) -> None:
+        if _charges_quota(from_cache, recommendation.es_fallback):
+            user.consultas_restantes -= 1
+    return charge
+
+
+async def stream_recommendation(
+    db: AsyncSession,
+    user: User,
+    perfumes: List[Perfume],
+    request_fields: Dict,
+) -> AsyncIterator[Tuple[str, object]]:
+    """Variante en streaming de recommend_for_user: produce eventos (tipo, dato).
+
+    Eventos: "clima", "perfume" (en cuanto se lee la primera línea), "texto"
+    (fragmentos de la IA) y "fin" con la recomendación ya guardada. Si Gemini
+    se corta a mitad de camino se envía "reinicio" y luego la respuesta local.
+    Si el cliente corta el stream antes del final no se guarda ni se descuenta nada.
+    """
+    context = dict(request_fields)
+    version = await collection_version(db, user.id)
+    weather_data, cache_key = await _weather_and_cache_key(user.id, context, version)
+    yield "clima", weather_data
+    
+    cached = await _cached_recommendation(db, cache_key, user.id)
+    if cached is not None:
+        yield "perfume", _find_perfume(perfumes, cached.perfume_recomendado_id)
+        yield "texto", cached.respuesta_ia
+        await _quota_charge(user, True)(cached)
+        await db.commit()
+        yield "fin", cached
+        return
+    
+    candidates = _candidates(perfumes, context, weather_data)
+    prompt = _build_prompt(candidates, context, weather_data)
+    
+    async def local_fallback():
+        recommended_perfume, ai_response = _local_fallback(candidates, context, weather_data)
+        yield "perfume", recommended_perfume
+        yield "texto", ai_response
+        recommendation = await _save_recommendation(
+            db, user.id, context, weather_data, prompt, ai_response, recommended_perfume, cache_key,
+            es_fallback=True, before_commit=_quota_charge(user, False)
+        )
+        yield "fin", recommendation
+    
+    # Presupuesto de latencia para el primer fragmento; si no llega, respuesta local
+    stream = stream_ai_recommendation(prompt)
+    try:
+        first_chunk = await asyncio.wait_for(
+            stream.__anext__(), settings.RECOMMENDATION_LLM_BUDGET_SECONDS
+        )
+    except (asyncio.TimeoutError, StopAsyncIteration, StreamInterrupted):
+        await stream.aclose()
+        print("⏱️ Gemini no respondió a tiempo (streaming): se usa el recomendador local")
+        async for event in local_fallback():
+            yield event
+        return
+    
+    matcher = collection_matcher(user.id, version, perfumes)
+    
+    async def all_chunks():
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+    
+    chunks: List[str] = []
+    perfume_sent = False
+    announced = None
+    try:
+        async for chunk in all_chunks():
+            chunks.append(chunk)
+            if not perfume_sent:
+                text = "".join(chunks)
+                if "\n" in text.strip():
+                    # Primera línea completa: ya se puede anunciar el perfume
+                    announced = extract_perfume_name(text.strip().split("\n", 1)[0], perfumes, matcher)
+                    yield "perfume", announced
+                    perfume_sent = True
+            yield "texto", chunk
+    except StreamInterrupted:
+        # Respuesta truncada: no se guarda, no se cachea ni se cobra. El cliente
+        # descarta lo recibido ("reinicio") y recibe la recomendación local
+        print("⚠️ El stream de Gemini se cortó: se usa el recomendador local")
+        yield "reinicio", None
+        async for event in local_fallback():
+            yield event
+        return
+    
+    ai_response = "".join(chunks)
+    recommended_perfume = extract_perfume_name(ai_response, perfumes, matcher)
+    if not perfume_sent or recommended_perfume is not announced:
+        yield "perfume", recommended_perfume
+    
+    recommendation = await _save_recommendation(
+        db, user.id, context, weather_data, prompt, ai_response, recommended_perfume, cache_key,
+        before_commit=_quota_charge(user, False)
+    )
+    yield "fin", recommendation
+
+
+def _find_perfume(perfumes: List[Perfume], perfume_id: Optional[int]) -> Optional[Perfume]:
+    if perfume_id is None:
+        return None
+    return next((perfume for perfume in perfumes if perfume.id == perfume_id), None)
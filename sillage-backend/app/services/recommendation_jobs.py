@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.recommendation import RecomendacionJob
+from app.models.user import User
+from app.services.recommendation_engine import load_active_collection, recommend_for_user
+from app.services.request_flight import IdempotencyKeyReused
+
+PENDING = "pendiente"
+RUNNING = "en_proceso"
+COMPLETED = "completado"
+FAILED = "error"
+FINISHED_STATES = (COMPLETED, FAILED)
+
+SWEEP_BATCH = 100
+
+
+class JobRejected(Exception):
+    """El trabajo no puede procesarse (suscripción, consultas o colección)"""
+
+
+class JobLost(Exception):
+    """Otro worker reclamó el trabajo (el nuestro se consideró abandonado)"""
+
+
+def job_id_for(user_id: int, idempotency_key: Optional[str] = None) -> str:
+    """Id del trabajo: determinista con Idempotency-Key, aleatorio sin ella"""
+    if idempotency_key:
+        return hashlib.sha1(f"{user_id}:{idempotency_key}".encode("utf-8")).hexdigest()[:32]
+    return uuid.uuid4().hex
+
+
+async def enqueue_job(
+    db: AsyncSession,
+    user_id: int,
+    payload: Dict,
+    idempotency_key: Optional[str] = None,
+) -> RecomendacionJob:
+    """Persistir el trabajo (o devolver el existente con la misma Idempotency-Key).
+
+    Reutilizar la clave con otro payload lanza IdempotencyKeyReused.
+    """
+    job_id = job_id_for(user_id, idempotency_key)
+    if idempotency_key:
+        existing = await _get_job(db, job_id, user_id)
+        if existing is not None:
+            return _same_payload(existing, payload)
+
+    job = RecomendacionJob(id=job_id, user_id=user_id, estado=PENDING, payload=payload, intentos=0)
+    db.add(job)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Otro reintento con la misma clave llegó primero
+        await db.rollback()
+        return _same_payload(await _get_job(db, job_id, user_id), payload)
+    await db.refresh(job)
+    return job
+
+
+def _same_payload(job: RecomendacionJob, payload: Dict) -> RecomendacionJob:
+    if job.payload != payload:
+        raise IdempotencyKeyReused(job.id)
+    return job
+
+
+async def _get_job(db: AsyncSession, job_id: str, user_id: int) -> Optional[RecomendacionJob]:
+    result = await db.execute(
+        select(RecomendacionJob).where(
+            and_(RecomendacionJob.id == job_id, RecomendacionJob.user_id == user_id)
+        )
+    )
+    return result.scalar_one_or_none()
+
+
+def _claimable(stale_before: datetime):
+    return or_(
+        RecomendacionJob.estado == PENDING,
+        and_(RecomendacionJob.estado == RUNNING, RecomendacionJob.started_at < stale_before),
+    )
+
+
+async def _claim(db: AsyncSession, job_id: str) -> bool:
+    """Tomar el trabajo con un UPDATE condicional: solo un worker lo consigue"""
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=settings.RECOMMENDATION_JOB_STALE_SECONDS)
+    result = await db.execute(
+        update(RecomendacionJob)
+        .where(
+            and_(
+                RecomendacionJob.id == job_id,
+                RecomendacionJob.intentos < settings.RECOMMENDATION_JOB_MAX_ATTEMPTS,
+                _claimable(stale_before),
+            )
+        )
+        .values(estado=RUNNING, intentos=RecomendacionJob.intentos + 1, started_at=now)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def _finish(db: AsyncSession, job_id: str, estado: str, error: Optional[str] = None) -> None:
+    await db.execute(
+        update(RecomendacionJob)
+        .where(and_(RecomendacionJob.id == job_id, RecomendacionJob.estado == RUNNING))
+        .values(
+            estado=estado,
+            error=error,
+            finished_at=datetime.utcnow(),
+        )
+    )
+    await db.commit()
+
+
+def _request_fields(payload: Dict) -> Dict:
+    """Payload guardado (JSON) -> argumentos de generate_recommendation.
+
+    No se vuelve a validar la fecha: ya se validó al encolar.
+    """
+    fields = dict(payload)
+    fields["fecha_evento"] = date.fromisoformat(payload["fecha_evento"])
+    fields["hora_evento"] = time.fromisoformat(payload["hora_evento"])
+    return fields
+
+
+async def process_job(session_factory, job_id: str) -> None:
+    """Ejecutar un trabajo: reclamarlo, generar la recomendación y guardar el resultado"""
+    async with session_factory() as db:
+        if not await _claim(db, job_id):
+            return  # ya terminado o en manos de otro worker
+
+        result = await db.execute(
+            select(RecomendacionJob.user_id, RecomendacionJob.payload).where(
+                RecomendacionJob.id == job_id
+            )
+        )
+        user_id, payload = result.one()
+
+        try:
+            user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+            # El estado del usuario pudo cambiar desde que se encoló
+            if user is None or not user.suscrito:
+                raise JobRejected("Suscripción requerida para esta acción")
+            if user.consultas_restantes <= 0:
+                raise JobRejected("No tienes consultas disponibles este mes")
+            perfumes = await load_active_collection(db, user_id)
+            if not perfumes:
+                raise JobRejected("Debes tener al menos un perfume en tu colección")
+
+            async def complete(recommendation) -> None:
+                # En la misma transacción que la fila y el descuento: si el worker
+                # muere antes del commit, el reintento no duplica ni cobra dos veces
+                result = await db.execute(
+                    update(RecomendacionJob)
+                    .where(and_(RecomendacionJob.id == job_id, RecomendacionJob.estado == RUNNING))
+                    .values(
+                        estado=COMPLETED,
+                        recomendacion_id=recommendation.id,
+                        finished_at=datetime.utcnow(),
+                    )
+                )
+                if result.rowcount != 1:
+                    raise JobLost(job_id)
+
+            await recommend_for_user(
+                db, user, perfumes, _request_fields(payload), on_saved=complete
+            )
+        except JobLost:
+            await db.rollback()
+            print(f"⚠️ Trabajo de recomendación {job_id} reclamado por otro worker")
+        except JobRejected as e:
+            await db.rollback()
+            await _finish(db, job_id, FAILED, error=str(e))
+        except Exception as e:
+            print(f"❌ Error en trabajo de recomendación {job_id}: {e}")
+            await db.rollback()
+            await _finish(db, job_id, FAILED, error="No se pudo generar la recomendación")
+
+
+class RecommendationJobPool:
+    """Pool acotado de workers en segundo plano para los trabajos de recomendación.
+
+    Los trabajos viven en la BD: el barrido periódico recoge los pendientes de
+    otros procesos y los que quedaron a medias tras un reinicio.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._session_factory = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, session_factory, size: int, sweep_interval: int) -> None:
+        if self._tasks:
+            return
+        self._session_factory = session_factory
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(size)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop(sweep_interval)))
+
+    def submit(self, job_id: str) -> None:
+        """Encolar en este proceso; sin pool activo lo recoge el barrido de otro"""
+        if self._queue is None or job_id in self._queued:
+            return
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queue = None
+        self._queued = set()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await process_job(self._session_factory, job_id)
+            except Exception as e:
+                print(f"⚠️ Trabajo de recomendación {job_id} falló: {e}")
+
+    async def sweep(self) -> None:
+        """Encolar trabajos pendientes o abandonados y cerrar los que agotaron intentos"""
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.RECOMMENDATION_JOB_STALE_SECONDS)
+        async with self._session_factory() as db:
+            await db.execute(
+                update(RecomendacionJob)
+                .where(
+                    and_(
+                        RecomendacionJob.intentos >= settings.RECOMMENDATION_JOB_MAX_ATTEMPTS,
+                        _claimable(stale_before),
+                    )
+                )
+                .values(
+                    estado=FAILED,
+                    error="No se pudo generar la recomendación",
+                    finished_at=datetime.utcnow(),
+                )
+            )
+            await db.commit()
+            result = await db.execute(
+                select(RecomendacionJob.id)
+                .where(_claimable(stale_before))
+                .order_by(RecomendacionJob.created_at)
+                .limit(SWEEP_BATCH)
+            )
+            job_ids = result.scalars().all()
+        for job_id in job_ids:
+            self.submit(job_id)
+
+    async def _sweep_loop(self, interval: int) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"⚠️ Error al revisar trabajos de recomendación: {e}")
+            await asyncio.sleep(interval)
+
+
+# Instancia global
+recommendation_jobs = RecommendationJobPool()
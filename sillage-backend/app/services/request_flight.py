@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.cache import cache
+
+FLIGHT_KEY_PREFIX = "recommendations:flight"
+PENDING = "pendiente"
+DONE = "listo"
+POLL_SECONDS = 0.2
+
+
+class FlightTimeout(Exception):
+    """El líder no terminó dentro del plazo del candado"""
+
+
+class IdempotencyKeyReused(Exception):
+    """La Idempotency-Key ya se usó con un payload distinto"""
+
+
+def payload_fingerprint(payload: Dict) -> str:
+    """Hash del payload que se guarda junto a la Idempotency-Key"""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def recommendation_flight_key(
+    user_id: int,
+    payload: Dict,
+    collection_version: tuple,
+    idempotency_key: Optional[str] = None,
+) -> Tuple[str, int]:
+    """Clave de deduplicación y TTL del resultado.
+
+    Con Idempotency-Key el resultado se conserva más tiempo; sin ella se
+    deduplican los reintentos del mismo payload con la misma colección.
+    """
+    if idempotency_key:
+        digest = hashlib.sha1(idempotency_key.encode("utf-8")).hexdigest()
+        return (
+            f"{FLIGHT_KEY_PREFIX}:{user_id}:idem:{digest}",
+            settings.RECOMMENDATION_IDEMPOTENCY_TTL_SECONDS,
+        )
+    raw = json.dumps([payload, collection_version], sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return f"{FLIGHT_KEY_PREFIX}:{user_id}:{digest}", settings.RECOMMENDATION_FLIGHT_RESULT_SECONDS
+
+
+async def run_single_flight(
+    key: str,
+    leader: Callable[[], Awaitable[int]],
+    result_ttl: int,
+    fingerprint: Optional[str] = None,
+) -> Tuple[int, bool]:
+    """Ejecutar `leader` una sola vez por clave entre todos los workers.
+
+    Devuelve (id del resultado, es_lider). Los seguidores esperan el resultado
+    del líder en Redis; si el líder falla, el siguiente toma el candado. Con
+    `fingerprint` (hash del payload) un seguidor con otro payload recibe
+    IdempotencyKeyReused en lugar del resultado ajeno.
+    """
+    if not cache.redis:
+        return await leader(), True
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.RECOMMENDATION_FLIGHT_LOCK_SECONDS
+    seen_leader = False
+    while True:
+        try:
+            acquired = await cache.set(
+                key,
+                {"estado": PENDING, "payload": fingerprint},
+                expire=settings.RECOMMENDATION_FLIGHT_LOCK_SECONDS,
+                nx=True
+            )
+        except Exception as e:
+            print(f"Error al tomar candado de recomendación: {e}")
+            if seen_leader:
+                # Ya hubo otro líder: ejecutar aquí podría cobrar dos veces
+                raise FlightTimeout(key)
+            return await leader(), True
+
+        if acquired:
+            try:
+                result_id = await leader()
+            except BaseException:
+                try:
+                    await cache.delete(key)
+                except Exception as e:
+                    # El candado vence solo; los seguidores esperan hasta entonces
+                    print(f"Error al liberar candado de recomendación: {e}")
+                raise
+            try:
+                await cache.set(
+                    key, {"estado": DONE, "id": result_id, "payload": fingerprint}, expire=result_ttl
+                )
+            except Exception as e:
+                # El resultado ya está confirmado (y cobrado). El candado PENDING se conserva
+                # hasta su TTL para que un reintento espere en vez de repetir el pipeline.
+                print(f"Error al publicar resultado de recomendación: {e}")
+            return result_id, True
+
+        # Seguidor: esperar el resultado del líder
+        seen_leader = True
+        while True:
+            try:
+                value = await cache.get(key)
+            except Exception as e:
+                # Un error de lectura no es un candado libre: seguir esperando al líder
+                print(f"Error al leer resultado de recomendación: {e}")
+            else:
+                if value is None:
+                    break  # el líder falló o expiró: intentar tomar el candado
+                if value.get("payload") != fingerprint:
+                    raise IdempotencyKeyReused(key)
+                if value.get("estado") == DONE:
+                    return value["id"], False
+            if loop.time() >= deadline:
+                raise FlightTimeout(key)
+            await asyncio.sleep(POLL_SECONDS)
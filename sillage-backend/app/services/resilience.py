@@ -0,0 +1,279 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.services.http_clients import PROVIDERS
+
+# Respuestas que indican un problema transitorio del proveedor
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+CLOSED = "cerrado"
+OPEN = "abierto"
+HALF_OPEN = "semiabierto"
+
+
+class ProviderUnavailable(Exception):
+    """El proveedor no se llama: circuito abierto o sin cupo de concurrencia"""
+
+
+class CircuitOpen(ProviderUnavailable):
+    pass
+
+
+class BulkheadFull(ProviderUnavailable):
+    pass
+
+
+class ResilienceMetrics:
+    """Contadores en memoria por proveedor y evento ("gemini", "retry") -> n"""
+
+    def __init__(self):
+        self.counters: Counter = Counter()
+
+    def incr(self, provider: str, event: str) -> None:
+        self.counters[(provider, event)] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        result: Dict[str, Dict[str, int]] = {}
+        for (provider, event), count in sorted(self.counters.items()):
+            result.setdefault(provider, {})[event] = count
+        return result
+
+
+metrics = ResilienceMetrics()
+
+
+class CircuitBreaker:
+    """Se abre tras `failure_threshold` fallos seguidos; pasado `reset_seconds`
+    deja pasar una sola prueba (semiabierto) que decide si vuelve a cerrarse."""
+
+    def __init__(
+        self,
+        provider: str,
+        failure_threshold: int,
+        reset_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.state = state
+        metrics.incr(self.provider, f"circuito_{state}")
+        print(f"🔌 Circuito de {self.provider}: {state}")
+
+    def allow(self) -> bool:
+        if self.state == OPEN and self._clock() - self._opened_at >= self.reset_seconds:
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """La prueba terminó sin veredicto (cancelada o sin cupo)"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+            self._transition(OPEN)
+
+
+class RetryBudget:
+    """Cada llamada deposita `ratio` fichas y cada reintento gasta una: los
+    reintentos nunca superan esa fracción del tráfico (evita tormentas)."""
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ProviderGuard:
+    """Bulkhead + circuit breaker + reintentos con jitter para un proveedor externo"""
+
+    def __init__(
+        self,
+        provider: str,
+        max_concurrent: int = 10,
+        queue_timeout: float = 1.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_cap: float = 2.0,
+        retry_ratio: float = 0.2,
+        retry_max_tokens: float = 10.0,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        slow_call_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.provider = provider
+        self.slow_call_seconds = slow_call_seconds
+        self._clock = clock
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = CircuitBreaker(provider, failure_threshold, reset_seconds, clock)
+        self.budget = RetryBudget(retry_ratio, retry_max_tokens)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._sleep = asyncio.sleep
+
+    @asynccontextmanager
+    async def slot(self):
+        """Cupo de concurrencia para una llamada (también para streams)"""
+        if not self.breaker.allow():
+            metrics.incr(self.provider, "rechazo_circuito")
+            raise CircuitOpen(self.provider)
+        # Semiabierto solo deja pasar la prueba: si entramos, la prueba es nuestra.
+        # Una llamada que entró con el circuito cerrado no debe liberar la prueba de otra.
+        probe = self.breaker.state == HALF_OPEN
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.incr(self.provider, "rechazo_bulkhead")
+            if probe:
+                self.breaker.release_probe()
+            raise BulkheadFull(self.provider)
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+            if probe:
+                self.breaker.release_probe()
+
+    def _record_cancelled(self, started: float) -> None:
+        # Cancelada por el presupuesto de latencia del llamador: una llamada lenta es un fallo
+        if self.slow_call_seconds is not None and self._clock() - started >= self.slow_call_seconds:
+            self.breaker.record_failure()
+            metrics.incr(self.provider, "lenta")
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_cap))
+        return delay
+
+    async def request(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Ejecutar `send` con reintentos ante errores de red y 429/5xx.
+
+        Devuelve la última respuesta (el llamador hace raise_for_status);
+        los 4xx del cliente no cuentan como fallo del proveedor.
+        """
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            response: Optional[httpx.Response] = None
+            error: Optional[Exception] = None
+            started = self._clock()
+            async with self.slot():
+                try:
+                    response = await send()
+                except httpx.TransportError as e:
+                    error = e
+                except asyncio.CancelledError:
+                    self._record_cancelled(started)
+                    raise
+            failed = error is not None or response.status_code in RETRYABLE_STATUS
+            if not failed:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            metrics.incr(self.provider, "fallo")
+
+            if attempt >= self.max_retries or self.breaker.state == OPEN:
+                break
+            if not self.budget.withdraw():
+                metrics.incr(self.provider, "presupuesto_agotado")
+                break
+            metrics.incr(self.provider, "reintento")
+            await self._sleep(self._delay(attempt, response))
+            attempt += 1
+
+        if error is not None:
+            raise error
+        return response
+
+    @asynccontextmanager
+    async def stream(self):
+        """Stream sin reintentos: solo breaker y bulkhead"""
+        started = self._clock()
+        async with self.slot():
+            try:
+                yield
+            except asyncio.CancelledError:
+                self._record_cancelled(started)
+                raise
+            except Exception as e:
+                if _is_provider_failure(e):
+                    self.breaker.record_failure()
+                    metrics.incr(self.provider, "fallo")
+                raise
+            self.breaker.record_success()
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, httpx.TransportError)
+
+
+class ProviderGuards:
+    """Un guard por proveedor (se crean al primer uso con la configuración de PROVIDERS)"""
+
+    def __init__(self, config: Dict[str, Dict]):
+        self._config = config
+        self._guards: Dict[str, ProviderGuard] = {}
+
+    def get(self, provider: str) -> ProviderGuard:
+        guard = self._guards.get(provider)
+        if guard is None:
+            guard = self._guards[provider] = ProviderGuard(provider, **self._config.get(provider, {}))
+        return guard
+
+    def set(self, provider: str, guard: ProviderGuard) -> None:
+        """Reemplazar el guard de un proveedor (tests)"""
+        self._guards[provider] = guard
+
+    def reset(self) -> None:
+        self._guards = {}
+
+    def states(self) -> Dict[str, str]:
+        return {provider: guard.breaker.state for provider, guard in self._guards.items()}
+
+
+# Instancia global
+guards = ProviderGuards({name: config.get("resilience", {}) for name, config in PROVIDERS.items()})
@@ -0,0 +1,71 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from app.core.config import settings
+from app.utils.cache import cache
+
+CATALOG_VERSION_KEY = "perfumes:catalog:version"
+SEARCH_KEY_PREFIX = "perfumes:search"
+SEARCH_STATS_KEY = "perfumes:search:stats"
+
+
+async def get_catalog_version() -> int:
+    """Versión actual del catálogo (0 si Redis no está disponible)"""
+    try:
+        version = await cache.get(CATALOG_VERSION_KEY)
+    except Exception as e:
+        print(f"Error al leer versión del catálogo: {e}")
+        return 0
+    return int(version or 0)
+
+
+async def bump_catalog_version() -> None:
+    """Invalidar en O(1) todas las búsquedas cacheadas del catálogo"""
+    try:
+        await cache.incr(CATALOG_VERSION_KEY)
+    except Exception as e:
+        print(f"Error al incrementar versión del catálogo: {e}")
+
+
+def search_cache_key(version: int, **params: Any) -> str:
+    """Clave de cache a partir de los parámetros normalizados y la versión"""
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+    return f"{SEARCH_KEY_PREFIX}:v{version}:{digest}"
+
+
+async def get_cached_search(key: str) -> Optional[Any]:
+    """Leer una búsqueda cacheada y registrar acierto/fallo"""
+    try:
+        value = await cache.get(key)
+        await cache.hincr(SEARCH_STATS_KEY, "hits" if value is not None else "misses")
+        return value
+    except Exception as e:
+        print(f"Error al leer cache de búsqueda: {e}")
+        return None
+
+
+async def set_cached_search(key: str, value: Any) -> None:
+    try:
+        await cache.set(key, value, expire=settings.SEARCH_CACHE_TTL_SECONDS)
+    except Exception as e:
+        print(f"Error al guardar cache de búsqueda: {e}")
+
+
+async def get_search_cache_stats() -> dict:
+    """Aciertos, fallos y tasa de aciertos del cache de búsqueda"""
+    try:
+        stats = await cache.hgetall(SEARCH_STATS_KEY)
+    except Exception as e:
+        print(f"Error al leer estadísticas de búsqueda: {e}")
+        stats = {}
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "catalog_version": await get_catalog_version(),
+    }
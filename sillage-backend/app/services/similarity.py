@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.core.config import settings
+from app.models.perfume import Perfume
+from app.utils.text import normalize_text
+
+# Peso de cada tipo de rasgo en el vector del perfume
+FEATURE_WEIGHTS = {
+    "a": 2.0,   # acordes
+    "n": 1.0,   # notas
+    "p": 0.5,   # perfumista
+}
+
+# Compactar la matriz cuando las filas obsoletas superan esta fracción
+COMPACT_RATIO = 0.2
+
+
+def perfume_features(
+    notas: Optional[Iterable[str]],
+    acordes: Optional[Iterable[str]],
+    perfumista: Optional[str],
+) -> Dict[str, float]:
+    """Rasgos ponderados de un perfume ("a:citrico" -> peso)"""
+    features = {}
+    for prefix, values in (("a", acordes), ("n", notas), ("p", [perfumista] if perfumista else None)):
+        for value in values or ():
+            clave = normalize_text(value)
+            if clave:
+                features[f"{prefix}:{clave}"] = FEATURE_WEIGHTS[prefix]
+    return features
+
+
+def _stamp(perfume: Perfume) -> float:
+    timestamps = [ts for ts in (perfume.created_at, perfume.updated_at) if ts is not None]
+    return max(ts.timestamp() for ts in timestamps) if timestamps else 0.0
+
+
+def _write_npz(path: Path, arrays: Dict[str, np.ndarray]) -> None:
+    """Escritura atómica con un temporal propio del proceso (varios workers comparten el archivo)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp.npz", delete=False)
+    try:
+        with tmp:
+            np.savez(tmp, **arrays)
+        os.replace(tmp.name, path)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+
+
+class SimilarityIndex:
+    """Matriz dispersa perfume × rasgo (notas, acordes, perfumista) con filas normalizadas.
+
+    La similitud coseno contra todo el catálogo es un único producto matriz-vector.
+    Las filas nuevas se agregan al final; las modificadas o eliminadas quedan
+    marcadas como obsoletas hasta la siguiente compactación.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.features: Dict[str, int] = {}
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.stamps = np.empty(0, dtype=np.float64)
+        self.alive = np.empty(0, dtype=bool)
+        self._row_by_id: Dict[int, int] = {}
+        self._save_task: Optional[asyncio.Task] = None
+        self._save_pending = False
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    # ------------------------------------------------------------------
+    # Construcción incremental
+    # ------------------------------------------------------------------
+
+    def _vectorize(self, features: Dict[str, float], grow: bool) -> Tuple[List[int], List[float]]:
+        norm = np.sqrt(sum(weight * weight for weight in features.values())) or 1.0
+        cols, vals = [], []
+        for feature, weight in features.items():
+            col = self.features.get(feature)
+            if col is None:
+                if not grow:
+                    continue
+                col = self.features[feature] = len(self.features)
+            cols.append(col)
+            vals.append(weight / norm)
+        return cols, vals
+
+    def apply(self, upserted: Sequence[Perfume], removed_ids: Sequence[int], full: bool = False) -> bool:
+        """Aplicar cambios del catálogo; devuelve True si la matriz cambió"""
+        changed = False
+        if full:
+            # Carga completa: las filas que ya no están en el catálogo quedan obsoletas
+            present = {perfume.id for perfume in upserted}
+            removed_ids = [pid for pid in self._row_by_id if pid not in present]
+
+        for perfume_id in removed_ids:
+            row = self._row_by_id.pop(perfume_id, None)
+            if row is not None:
+                self.alive[row] = False
+                changed = True
+
+        indptr, indices, data, new_ids, new_stamps = [0], [], [], [], []
+        for perfume in upserted:
+            stamp = _stamp(perfume)
+            row = self._row_by_id.get(perfume.id)
+            if row is not None:
+                if self.stamps[row] == stamp:
+                    continue
+                self.alive[row] = False
+            cols, vals = self._vectorize(
+                perfume_features(perfume.notas, perfume.acordes, perfume.perfumista), grow=True
+            )
+            indices.extend(cols)
+            data.extend(vals)
+            indptr.append(len(indices))
+            self._row_by_id[perfume.id] = len(self.ids) + len(new_ids)
+            new_ids.append(perfume.id)
+            new_stamps.append(stamp)
+
+        if new_ids:
+            width = len(self.features)
+            block = sparse.csr_matrix(
+                (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), indptr),
+                shape=(len(new_ids), width),
+            )
+            current = self.matrix
+            current.resize((current.shape[0], width))
+            self.matrix = sparse.vstack([current, block], format="csr")
+            self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=np.int64)])
+            self.stamps = np.concatenate([self.stamps, np.asarray(new_stamps, dtype=np.float64)])
+            self.alive = np.concatenate([self.alive, np.ones(len(new_ids), dtype=bool)])
+            changed = True
+
+        if changed and len(self.ids) and (~self.alive).sum() > COMPACT_RATIO * len(self.ids):
+            self._compact()
+        return changed
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self.alive)
+        self.matrix = self.matrix[keep]
+        self.ids = self.ids[keep]
+        self.stamps = self.stamps[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self._row_by_id = {int(pid): row for row, pid in enumerate(self.ids)}
+
+    def on_catalog_change(self, upserted, removed_ids, full) -> None:
+        """Listener del catálogo en memoria: actualiza la matriz y agenda su persistencia"""
+        if self.apply(upserted, removed_ids, full) and self.path:
+            self._schedule_save()
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+
+    def _schedule_save(self) -> None:
+        """Guardar en un hilo, fuera del event loop y del lock del catálogo.
+
+        Los cambios que llegan mientras se escribe se agrupan en una sola escritura más.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()  # sin event loop (scripts)
+            return
+        self._save_pending = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_in_background())
+
+    async def _save_in_background(self) -> None:
+        while self._save_pending:
+            self._save_pending = False
+            try:
+                await asyncio.to_thread(_write_npz, self.path, self._snapshot())
+            except Exception as e:
+                print(f"Error al guardar índice de similitud: {e}")
+
+    async def wait_saved(self) -> None:
+        """Esperar a que termine la escritura en curso (apagado y tests)"""
+        if self._save_task is not None:
+            await self._save_task
+
+    def _snapshot(self) -> Dict[str, np.ndarray]:
+        # Copias: la matriz puede cambiar en el loop mientras el hilo escribe
+        return {
+            "data": self.matrix.data.copy(),
+            "indices": self.matrix.indices.copy(),
+            "indptr": self.matrix.indptr.copy(),
+            "shape": np.asarray(self.matrix.shape),
+            "ids": self.ids.copy(),
+            "stamps": self.stamps.copy(),
+            "alive": self.alive.copy(),
+            "features": np.asarray(json.dumps(self.features)),
+            "saved_at": np.asarray(datetime.utcnow().isoformat()),
+        }
+
+    def save(self) -> None:
+        _write_npz(self.path, self._snapshot())
+
+    def load(self) -> bool:
+        """Cargar la matriz persistida; devuelve False si no existe o es inválida"""
+        if not self.path or not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as stored:
+                self.matrix = sparse.csr_matrix(
+                    (stored["data"], stored["indices"], stored["indptr"]),
+                    shape=tuple(stored["shape"]),
+                )
+                self.ids = stored["ids"]
+                self.stamps = stored["stamps"]
+                self.alive = stored["alive"]
+                self.features = json.loads(str(stored["features"]))
+        except Exception as e:
+            print(f"Error al cargar índice de similitud: {e}")
+            self.__init__(self.path)
+            return False
+        self._row_by_id = {
+            int(pid): row for row, pid in enumerate(self.ids) if self.alive[row]
+        }
+        return True
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def similar(
+        self,
+        notas: Optional[Iterable[str]],
+        acordes: Optional[Iterable[str]],
+        perfumista: Optional[str],
+        limit: int = 10,
+        exclude_id: Optional[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """Los `limit` perfumes más parecidos como pares (id, similitud coseno)"""
+        if not len(self._row_by_id):
+            return []
+        cols, vals = self._vectorize(perfume_features(notas, acordes, perfumista), grow=False)
+        if not cols:
+            return []
+
+        query = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        query[cols] = vals
+        scores = self.matrix @ query
+        scores[~self.alive] = -1.0
+        if exclude_id is not None and exclude_id in self._row_by_id:
+            scores[self._row_by_id[exclude_id]] = -1.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        # Mayor similitud primero; a igual puntaje, menor id
+        order = np.lexsort((self.ids[candidates], -scores[candidates]))
+        return [
+            (int(self.ids[candidates[i]]), float(scores[candidates[i]])) for i in order
+        ]
+
+
+# Instancia global
+similarity_index = SimilarityIndex(Path(settings.SIMILARITY_INDEX_PATH))
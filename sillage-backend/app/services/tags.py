@@ -0,0 +1,112 @@
+from typing import Dict, Iterable, List, Sequence
+
+from sqlalchemy import select, delete, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.core.database import get_dialect_name
+from app.models.perfume import Perfume, Nota, Acorde, perfume_nota, perfume_acorde
+from app.utils.text import normalize_text
+
+# asyncpg admite como máximo 32767 parámetros por sentencia: las cargas CSV
+# grandes se parten en lotes (un INSERT de 2 columnas usa 2 por fila)
+CHUNK_SIZE = 5000
+
+
+def _chunks(values: List):
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+
+def _clave(value: str) -> str:
+    return normalize_text(value)[:100]
+
+
+def _vocabulary(values: Iterable[str]) -> Dict[str, str]:
+    """Agrupar términos por su clave normalizada (clave -> primer nombre visto)"""
+    vocabulary = {}
+    for value in values:
+        clave = _clave(value)
+        if clave and clave not in vocabulary:
+            vocabulary[clave] = value.strip()[:100]
+    return vocabulary
+
+
+async def _select_ids(db, model, claves: List[str]) -> Dict[str, int]:
+    ids = {}
+    for chunk in _chunks(claves):
+        result = await db.execute(select(model.clave, model.id).where(model.clave.in_(chunk)))
+        ids.update(result.all())
+    return ids
+
+
+async def _resolve_ids(db, model, vocabulary: Dict[str, str]) -> Dict[str, int]:
+    """Obtener (creando si falta) el id de cada término del vocabulario.
+
+    INSERT ... ON CONFLICT DO NOTHING: si otra transacción crea el mismo término
+    a la vez no hay IntegrityError, y el SELECT posterior recoge su id.
+    """
+    if not vocabulary:
+        return {}
+
+    claves = list(vocabulary)
+    ids = await _select_ids(db, model, claves)
+
+    missing = [clave for clave in claves if clave not in ids]
+    if missing:
+        insert_ = pg_insert if get_dialect_name(db) == "postgresql" else sqlite_insert
+        for chunk in _chunks(missing):
+            await db.execute(
+                insert_(model).on_conflict_do_nothing(index_elements=["clave"]),
+                [{"clave": clave, "nombre": vocabulary[clave]} for clave in chunk]
+            )
+        ids.update(await _select_ids(db, model, missing))
+
+    return ids
+
+
+async def _sync_mapping(db, model, mapping, column: str, perfumes: Sequence[Perfume], attr: str):
+    vocabulary = _vocabulary(
+        value for perfume in perfumes for value in (getattr(perfume, attr) or [])
+    )
+    ids = await _resolve_ids(db, model, vocabulary)
+
+    perfume_ids = [perfume.id for perfume in perfumes]
+    for chunk in _chunks(perfume_ids):
+        await db.execute(delete(mapping).where(mapping.c.perfume_id.in_(chunk)))
+
+    rows = []
+    for perfume in perfumes:
+        claves = {_clave(value) for value in (getattr(perfume, attr) or [])}
+        rows.extend(
+            {"perfume_id": perfume.id, column: ids[clave]}
+            for clave in claves if clave
+        )
+    for chunk in _chunks(rows):
+        await db.execute(insert(mapping), chunk)
+
+
+async def sync_perfume_tags(db, perfumes: Sequence[Perfume]) -> None:
+    """Actualizar el índice invertido de notas y acordes para perfumes con id asignado"""
+    if not perfumes:
+        return
+    await _sync_mapping(db, Nota, perfume_nota, "nota_id", perfumes, "notas")
+    await _sync_mapping(db, Acorde, perfume_acorde, "acorde_id", perfumes, "acordes")
+
+
+def has_nota(nota: str):
+    """Condición: el perfume tiene la nota indicada (búsqueda en el índice invertido)"""
+    return Perfume.id.in_(
+        select(perfume_nota.c.perfume_id)
+        .join(Nota, Nota.id == perfume_nota.c.nota_id)
+        .where(Nota.clave == _clave(nota))
+    )
+
+
+def has_acorde(acorde: str):
+    """Condición: el perfume tiene el acorde indicado (búsqueda en el índice invertido)"""
+    return Perfume.id.in_(
+        select(perfume_acorde.c.perfume_id)
+        .join(Acorde, Acorde.id == perfume_acorde.c.acorde_id)
+        .where(Acorde.clave == _clave(acorde))
+    )
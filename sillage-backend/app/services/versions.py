@@ -0,0 +1,33 @@
+from sqlalchemy import select, func
+
+from app.models.perfume import Perfume, perfume_collection
+from app.models.recommendation import Recomendacion
+
+
+async def collection_version(db, user_id: int) -> tuple:
+    """Marcador de versión de la colección del usuario (una sola consulta de agregados)"""
+    result = await db.execute(
+        select(
+            func.count(),
+            func.count(perfume_collection.c.removed_at),
+            func.max(perfume_collection.c.added_at),
+            func.max(perfume_collection.c.removed_at),
+            func.max(Perfume.updated_at),
+        )
+        .select_from(perfume_collection)
+        .join(Perfume, Perfume.id == perfume_collection.c.perfume_id)
+        .where(perfume_collection.c.user_id == user_id)
+    )
+    return tuple(result.one())
+
+
+async def history_version(db, user_id: int) -> tuple:
+    """Marcador de versión del historial de recomendaciones (filas inmutables)"""
+    result = await db.execute(
+        select(
+            func.count(),
+            func.max(Recomendacion.created_at),
+            func.max(Recomendacion.id),
+        ).where(Recomendacion.user_id == user_id)
+    )
+    return tuple(result.one())
@@ -1,55 +1,126 @@
 import httpx
+from bisect import bisect_left
+from calendar import timegm
 from datetime import datetime, date, time
 from typing import Optional, Dict
 from app.core.config import settings
+from app.services.http_clients import http_clients
+from app.services.resilience import guards
+from app.utils.cache import cache
+from app.utils.geohash import tile_center
+from app.utils.singleflight import SingleFlight
 
+# Pronóstico por celda geohash: {"ts": [epoch...], "bloques": [{descripcion, temperatura, humedad}]}
+FORECAST_KEY_PREFIX = "weather:forecast"
 
-async def get_weather_data(
-    lat: float, 
-    lon: float, 
-    fecha: date, 
-    hora: time
-) -> Optional[Dict]:
-    """Obtener datos del clima para una ubicación y tiempo específicos"""
-    
-    api_key = settings.OPENWEATHER_API_KEY
-    url = f"https://api.openweathermap.org/data/2.5/forecast"
-    
+_forecast_flight = SingleFlight()
+
+
+def _timestamp(value: datetime) -> int:
+    # dt_txt y la hora del evento se comparan como horas de reloj (sin zona)
+    return timegm(value.timetuple())
+
+
+def parse_forecast(data: Dict) -> Dict:
+    """Reducir la respuesta de /forecast a timestamps ordenados y los campos usados"""
+    bloques = []
+    for bloque in data.get('list', []):
+        bloques.append((
+            _timestamp(datetime.strptime(bloque['dt_txt'], "%Y-%m-%d %H:%M:%S")),
+            {
+                'descripcion': bloque['weather'][0]['description'],
+                'temperatura': bloque['main']['temp'],
+                'humedad': bloque['main']['humidity']
+            }
+        ))
+    bloques.sort(key=lambda item: item[0])
+    return {
+        'ts': [ts for ts, _ in bloques],
+        'bloques': [bloque for _, bloque in bloques]
+    }
+
+
+def nearest_block(forecast: Dict, fecha: date, hora: time) -> Optional[Dict]:
+    """Bloque de 3 horas más cercano a la fecha/hora objetivo (búsqueda binaria)"""
+    timestamps = forecast['ts']
+    if not timestamps:
+        return None
+    objetivo = _timestamp(datetime.combine(fecha, hora))
+    i = bisect_left(timestamps, objetivo)
+    if i == len(timestamps) or (i > 0 and objetivo - timestamps[i - 1] <= timestamps[i] - objetivo):
+        i -= 1
+    return forecast['bloques'][i]
+
+
+async def _fetch_forecast(client: httpx.AsyncClient, lat: float, lon: float) -> Dict:
     params = {
         "lat": lat,
         "lon": lon,
-        "appid": api_key,
+        "appid": settings.OPENWEATHER_API_KEY,
         "units": "metric",
         "lang": "es"
     }
-    
+    response = await guards.get("openweather").request(
+        lambda: client.get("/data/2.5/forecast", params=params)
+    )
+    response.raise_for_status()
+    return parse_forecast(response.json())
+
+
+async def _read_forecast(key: str) -> Optional[Dict]:
+    """Leer el pronóstico cacheado; un error de Redis cuenta como fallo de caché"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Combinar fecha y hora objetivo
-            dt_objetivo = datetime.combine(fecha, hora)
-            
-            # Buscar el bloque de tiempo más cercano
-            bloques = data.get('list', [])
-            if not bloques:
-                return None
-            
-            mejor_bloque = min(
-                bloques,
-                key=lambda b: abs(
-                    datetime.strptime(b['dt_txt'], "%Y-%m-%d %H:%M:%S") - dt_objetivo
-                ).total_seconds()
-            )
-            
-            return {
-                'descripcion': mejor_bloque['weather'][0]['description'],
-                'temperatura': mejor_bloque['main']['temp'],
-                'humedad': mejor_bloque['main']['humidity']
-            }
-            
+        return await cache.get(key)
+    except Exception as e:
+        print(f"Error al leer cache de clima: {e}")
+        return None
+
+
+async def _store_forecast(key: str, forecast: Dict) -> None:
+    try:
+        await cache.set(key, forecast, expire=settings.WEATHER_CACHE_TTL_SECONDS)
+    except Exception as e:
+        print(f"Error al guardar cache de clima: {e}")
+
+
+async def get_tile_forecast(
+    lat: float,
+    lon: float,
+    client: Optional[httpx.AsyncClient] = None
+) -> Dict:
+    """Pronóstico de la celda geohash que contiene la coordenada (Redis + single-flight)"""
+    tile, center_lat, center_lon = tile_center(lat, lon, settings.WEATHER_GEOHASH_PRECISION)
+    key = f"{FORECAST_KEY_PREFIX}:{tile}"
+
+    forecast = await _read_forecast(key)
+    if forecast is not None:
+        return forecast
+
+    async def load() -> Dict:
+        # Otra instancia pudo llenar la caché mientras esperábamos
+        cached = await _read_forecast(key)
+        if cached is not None:
+            return cached
+        fresh = await _fetch_forecast(client or http_clients.get("openweather"), center_lat, center_lon)
+        await _store_forecast(key, fresh)
+        return fresh
+
+    return await _forecast_flight.do(key, load)
+
+
+async def get_weather_data(
+    lat: float,
+    lon: float,
+    fecha: date,
+    hora: time,
+    client: Optional[httpx.AsyncClient] = None
+) -> Optional[Dict]:
+    """Obtener datos del clima para una ubicación y tiempo específicos"""
+
+    try:
+        forecast = await get_tile_forecast(lat, lon, client)
+        return nearest_block(forecast, fecha, hora)
+
     except Exception as e:
         print(f"Error al consultar clima: {e}")
         # Valores por defecto si falla la API
@@ -57,4 +128,4 @@ async def get_weather_data(
             'descripcion': 'parcialmente nublado',
             'temperatura': 20.0,
             'humedad': 60.0
-        }
\ No newline at end of file
+        }
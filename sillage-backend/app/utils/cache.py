@@ -34,15 +34,15 @@ class RedisCache:
                 return value
         return None
     
-    async def set(self, key: str, value: Any, expire: int = 3600) -> bool:
-        """Guardar valor en cache con TTL"""
+    async def set(self, key: str, value: Any, expire: int = 3600, nx: bool = False) -> bool:
+        """Guardar valor en cache con TTL (con nx=True solo si la clave no existe)"""
         if not self.redis:
             return False
         
         if not isinstance(value, str):
             value = json.dumps(value)
         
-        return await self.redis.set(key, value, ex=expire)
+        return bool(await self.redis.set(key, value, ex=expire, nx=nx))
     
     async def delete(self, key: str) -> bool:
         """Eliminar valor del cache"""
@@ -58,6 +58,28 @@ class RedisCache:
         
         return await self.redis.exists(key) > 0
 
+    
+    async def incr(self, key: str, amount: int = 1) -> Optional[int]:
+        """Incrementar un contador atómicamente"""
+        if not self.redis:
+            return None
+        
+        return await self.redis.incrby(key, amount)
+    
+    async def hincr(self, key: str, field: str, amount: int = 1) -> Optional[int]:
+        """Incrementar un campo de un hash atómicamente"""
+        if not self.redis:
+            return None
+        
+        return await self.redis.hincrby(key, field, amount)
+    
+    async def hgetall(self, key: str) -> dict:
+        """Obtener todos los campos de un hash"""
+        if not self.redis:
+            return {}
+        
+        return await self.redis.hgetall(key)
+
 
 # Instancia global
 cache = RedisCache()
\ No newline at end of file
@@ -0,0 +1,33 @@
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag fuerte a partir de marcadores de versión baratos"""
+    raw = json.dumps(parts, default=str, separators=(",", ":")).encode("utf-8")
+    return f'"{hashlib.sha1(raw).hexdigest()[:20]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comprobar si If-None-Match contiene el ETag (o '*')"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    """Respuesta 304 sin cuerpo para un ETag vigente"""
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+    )
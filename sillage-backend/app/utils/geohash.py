@@ -0,0 +1,34 @@
+from typing import Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _bounds(lat: float, lon: float, precision: int) -> Tuple[str, Tuple[float, float], Tuple[float, float]]:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rango, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rango[0] + rango[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rango[0] = mid
+        else:
+            rango[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars), tuple(lat_range), tuple(lon_range)
+
+
+def encode(lat: float, lon: float, precision: int = 5) -> str:
+    """Geohash de una coordenada (precisión 5 ≈ celdas de 4,9 × 4,9 km)"""
+    return _bounds(lat, lon, precision)[0]
+
+
+def tile_center(lat: float, lon: float, precision: int = 5) -> Tuple[str, float, float]:
+    """Geohash de la celda y las coordenadas de su centro"""
+    code, lat_range, lon_range = _bounds(lat, lon, precision)
+    return code, (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
@@ -0,0 +1,80 @@
+from collections import deque
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from app.utils.text import normalize_text
+
+T = TypeVar("T")
+
+
+def compact(text: Optional[str]) -> str:
+    """Forma de comparación: normalizada (sin tildes, minúsculas) y sin espacios ni guiones"""
+    return normalize_text(text).replace(" ", "").replace("-", "")
+
+
+class NameMatcher(Generic[T]):
+    """Autómata Aho-Corasick sobre nombres compactados.
+
+    Se compila una vez por colección; cada búsqueda recorre el texto una sola
+    vez, sin importar cuántos nombres haya, y devuelve el match más largo
+    ("Sauvage Elixir" gana a "Sauvage").
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, T]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Patrón más largo que termina en cada estado: (largo, valor)
+        self._best: List[Optional[Tuple[int, T]]] = [None]
+
+        for name, value in items:
+            pattern = compact(name)
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                state = nxt
+            if self._best[state] is None:  # nombres repetidos: gana el primero
+                self._best[state] = (len(pattern), value)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Heredar el patrón más largo del sufijo si este estado no termina uno mejor
+                inherited = self._best[self._fail[nxt]]
+                if inherited and (self._best[nxt] is None or inherited[0] > self._best[nxt][0]):
+                    self._best[nxt] = inherited
+
+    def _longest(self, text: str) -> Optional[T]:
+        best: Optional[Tuple[int, T]] = None
+        state = 0
+        for char in compact(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            found = self._best[state]
+            if found and (best is None or found[0] > best[0]):
+                best = found
+        return best[1] if best else None
+
+    def match(self, text: str) -> Optional[T]:
+        """Buscar primero en la primera línea (donde la IA pone el nombre) y luego en todo el texto"""
+        if not text:
+            return None
+        first_line = text.strip().split("\n", 1)[0]
+        return self._longest(first_line) or self._longest(text)
@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _as_tuple(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(_as_tuple(v) for v in value)
+    return value
+
+
+def encode_cursor(**values: Any) -> str:
+    """Codificar la posición de la última fila como un cursor opaco"""
+    payload = {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in values.items()
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], *datetime_fields: str) -> Optional[dict]:
+    """Decodificar un cursor (las listas se devuelven como tuplas)"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, dict):
+            raise ValueError(cursor)
+        values = {key: _as_tuple(value) for key, value in payload.items()}
+        for field in datetime_fields:
+            values[field] = datetime.fromisoformat(values[field])
+        return values
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def set_next_cursor(response: Response, cursor: Optional[str]) -> None:
+    """Publicar el cursor de la página siguiente en la cabecera X-Next-Cursor"""
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
@@ -0,0 +1,16 @@
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+
+
+def fast_json_response(content: Any, response: Optional[Response] = None) -> Response:
+    """Serializar con orjson sin una segunda validación Pydantic.
+
+    Conserva las cabeceras ya fijadas en `response` (ETag, X-Next-Cursor).
+    """
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return Response(content=body, headers=headers, media_type="application/json")
@@ -0,0 +1,20 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            # shield: si un llamador se cancela, los demás siguen esperando el resultado
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
@@ -0,0 +1,19 @@
+import re
+from typing import Optional
+
+from unidecode import unidecode
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Normalizar texto para búsquedas: minúsculas, sin acentos y espacios colapsados"""
+    if not value:
+        return ""
+    folded = unidecode(value).lower()
+    return _WHITESPACE_RE.sub(" ", folded).strip()
+
+
+def build_search_text(nombre: Optional[str], marca: Optional[str]) -> str:
+    """Construir el texto indexado de búsqueda de un perfume (nombre + marca)"""
+    return normalize_text(f"{nombre or ''} {marca or ''}")
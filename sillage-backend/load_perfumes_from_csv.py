@@ -9,6 +9,9 @@ from sqlalchemy import select
 
 from app.core.database import AsyncSessionLocal
 from app.models.perfume import Perfume
+from app.services.search_cache import bump_catalog_version
+from app.services.tags import sync_perfume_tags
+from app.utils.cache import cache
 
 
 def _clean_text(value: Optional[str]) -> Optional[str]:
@@ -66,6 +69,7 @@ async def load_perfumes_from_csv(csv_path: Path) -> Tuple[int, int]:
     existing_pairs = await _load_existing_pairs()
     added = 0
     skipped = 0
+    new_perfumes = []
 
     async with AsyncSessionLocal() as session:
         with csv_path.open("r", encoding="utf-8", newline="") as csv_file:
@@ -94,11 +98,23 @@ async def load_perfumes_from_csv(csv_path: Path) -> Tuple[int, int]:
                     acordes=acordes,
                 )
                 session.add(perfume)
+                new_perfumes.append(perfume)
                 existing_pairs.add(key)
                 added += 1
 
+        # Asignar ids y poblar el índice de notas/acordes en la misma transacción
+        await session.flush()
+        await sync_perfume_tags(session, new_perfumes)
         await session.commit()
 
+    if added:
+        # Invalida las búsquedas cacheadas y avisa a los catálogos en memoria
+        await cache.connect()
+        try:
+            await bump_catalog_version()
+        finally:
+            await cache.disconnect()
+
     return added, skipped
 
 
@@ -0,0 +1,84 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.models.perfume import Perfume
+from app.services.catalog import catalog
+
+
+@pytest.mark.asyncio
+async def test_catalog_snapshot_is_compressed_and_versioned(test_client):
+    client, perfume, session, _ = test_client
+    session.add(Perfume(nombre="Privado", marca="Casa", created_at=datetime.now(UTC), is_private=True))
+    await session.commit()
+
+    await catalog.load(session)
+    try:
+        response = await client.get(
+            "/api/v1/perfumes/catalog/snapshot", headers={"Accept-Encoding": "identity"}
+        )
+        assert response.status_code == 200
+        snapshot = response.json()
+        assert snapshot["version"]
+        assert snapshot["campos"][:3] == ["id", "nombre", "marca"]
+        assert [row[1] for row in snapshot["perfumes"]] == [perfume.nombre]
+
+        etag = response.headers["etag"]
+        response = await client.get(
+            "/api/v1/perfumes/catalog/snapshot", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+
+        response = await client.get(
+            "/api/v1/perfumes/catalog/snapshot", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == snapshot
+    finally:
+        catalog.ready = False
+        catalog._reset()
+
+
+@pytest.mark.asyncio
+async def test_catalog_delta_returns_changes_since_version(test_client):
+    client, perfume, session, _ = test_client
+    since = datetime.now(UTC) + timedelta(seconds=1)
+
+    nuevo = Perfume(nombre="Nuevo", marca="Casa", created_at=since + timedelta(seconds=1), is_private=False)
+    session.add(nuevo)
+    perfume.is_private = True
+    perfume.updated_at = since + timedelta(seconds=2)
+    await session.commit()
+
+    response = await client.get("/api/v1/perfumes/catalog/delta", params={"since": since.isoformat()})
+    assert response.status_code == 200
+    delta = response.json()
+    assert [p["nombre"] for p in delta["perfumes"]] == ["Nuevo"]
+    assert delta["eliminados"] == [perfume.id]
+    # Las filas privadas no mueven la versión
+    assert datetime.fromisoformat(delta["version"]) == nuevo.created_at.replace(tzinfo=UTC)
+
+
+@pytest.mark.asyncio
+async def test_catalog_delta_rereads_rows_stamped_before_returned_version(test_client):
+    client, perfume, session, _ = test_client
+    since = datetime.now(UTC) + timedelta(seconds=1)
+    session.add(Perfume(nombre="Primero", marca="Casa", created_at=since + timedelta(seconds=10), is_private=False))
+    await session.commit()
+
+    response = await client.get("/api/v1/perfumes/catalog/delta", params={"since": since.isoformat()})
+    version = response.json()["version"]
+
+    # Transacción larga: se confirma después de entregar `version` con un now() anterior
+    session.add(Perfume(
+        nombre="Tardío",
+        marca="Casa",
+        created_at=datetime.fromisoformat(version) - timedelta(seconds=5),
+        is_private=False,
+    ))
+    await session.commit()
+
+    response = await client.get("/api/v1/perfumes/catalog/delta", params={"since": version})
+    delta = response.json()
+    assert "Tardío" in [p["nombre"] for p in delta["perfumes"]]
+    assert datetime.fromisoformat(delta["version"]) == datetime.fromisoformat(version)
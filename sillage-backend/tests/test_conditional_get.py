@@ -0,0 +1,49 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_collection_etag_short_circuits_until_collection_changes(test_client):
+    client, perfume, _, _ = test_client
+
+    response = await client.get("/api/v1/perfumes/collection")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = await client.get("/api/v1/perfumes/collection", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    response = await client.get("/api/v1/perfumes/collection", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == [perfume.id]
+    added_etag = response.headers["etag"]
+    assert added_etag != etag
+
+    await client.delete(f"/api/v1/perfumes/collection/{perfume.id}")
+    response = await client.get("/api/v1/perfumes/collection", headers={"If-None-Match": added_etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_profile_and_history_etags(test_client):
+    client, _, session, user = test_client
+
+    response = await client.get("/api/v1/users/me")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    response = await client.get("/api/v1/users/me", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    user.consultas_restantes += 1
+    await session.commit()
+    response = await client.get("/api/v1/users/me", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    response = await client.get("/api/v1/recommendations/history")
+    assert response.status_code == 200
+    response = await client.get(
+        "/api/v1/recommendations/history", headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert response.status_code == 304
@@ -0,0 +1,43 @@
+from datetime import date, time
+
+import httpx
+import pytest
+
+from app.services.gemini import get_ai_recommendation
+from app.services.http_clients import http_clients
+from app.services.weather import get_weather_data
+
+
+def _forecast(request: httpx.Request) -> httpx.Response:
+    assert request.url.path == "/data/2.5/forecast"
+    return httpx.Response(200, json={"list": [
+        {"dt_txt": "2026-01-01 18:00:00", "weather": [{"description": "despejado"}],
+         "main": {"temp": 25.0, "humidity": 30}},
+        {"dt_txt": "2026-01-01 21:00:00", "weather": [{"description": "nublado"}],
+         "main": {"temp": 19.0, "humidity": 55}},
+    ]})
+
+
+def _gemini(request: httpx.Request) -> httpx.Response:
+    assert request.url.params["key"]
+    return httpx.Response(200, json={
+        "candidates": [{"content": {"parts": [{"text": "Sauvage\nFresco y versátil"}]}}]
+    })
+
+
+@pytest.mark.asyncio
+async def test_services_use_shared_clients_with_injected_transports():
+    http_clients.start(transports={
+        "openweather": httpx.MockTransport(_forecast),
+        "gemini": httpx.MockTransport(_gemini),
+    })
+    try:
+        client = http_clients.get("openweather")
+        clima = await get_weather_data(-33.4, -70.6, date(2026, 1, 1), time(20, 0))
+        assert clima == {"descripcion": "nublado", "temperatura": 19.0, "humedad": 55}
+        assert http_clients.get("openweather") is client
+
+        assert await get_ai_recommendation("prompt") == "Sauvage\nFresco y versátil"
+    finally:
+        await http_clients.close()
+    assert client.is_closed
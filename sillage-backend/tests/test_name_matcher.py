@@ -0,0 +1,26 @@
+from app.utils.name_matcher import NameMatcher
+
+
+def test_longest_accent_insensitive_match_wins():
+    matcher = NameMatcher([
+        ("Sauvage", 1),
+        ("Sauvage Elixir", 2),
+        ("Le Mâle", 3),
+        ("Aventus", 4),
+    ])
+    assert matcher.match("**Sauvage Elixir**\nPerfecto para la noche") == 2
+    assert matcher.match("Sauvage\nFresco") == 1
+    assert matcher.match("le male\nClásico") == 3
+    assert matcher.match("LE-MÂLE: intenso") == 3
+    assert matcher.match("Mi elección\nRecomiendo Aventus por su frescura") == 4
+    # La primera línea tiene prioridad sobre el resto del texto
+    assert matcher.match("Aventus\nMejor que Sauvage Elixir") == 4
+    assert matcher.match("Ninguno\nNada que ver") is None
+    assert matcher.match("") is None
+
+
+def test_overlapping_names_use_failure_links():
+    matcher = NameMatcher([("abcd", 1), ("bc", 2), ("bcdef", 3)])
+    assert matcher.match("xabcdef") == 3
+    assert matcher.match("xbcx") == 2
+    assert matcher.match("abcd") == 1
@@ -0,0 +1,106 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.models.perfume import Perfume, perfume_collection
+from app.services.catalog import catalog
+
+
+async def _fetch_all(client, url, params):
+    pages = []
+    cursor = None
+    while True:
+        response = await client.get(url, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append([p["nombre"] for p in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+@pytest.fixture()
+def perfumes_catalog():
+    return [f"Rosa {i:02d}" for i in range(7)]
+
+
+async def _add_perfumes(session, nombres):
+    perfumes = [
+        Perfume(nombre=nombre, marca="Jardín", created_at=datetime.now(UTC), is_private=False)
+        for nombre in nombres
+    ]
+    session.add_all(perfumes)
+    await session.commit()
+    return perfumes
+
+
+@pytest.mark.asyncio
+async def test_search_keyset_pages_from_db(test_client, perfumes_catalog):
+    client, _, session, _ = test_client
+    await _add_perfumes(session, perfumes_catalog)
+
+    pages = await _fetch_all(client, "/api/v1/perfumes/search", {"q": "rosa", "limit": 3})
+
+    assert pages == [perfumes_catalog[0:3], perfumes_catalog[3:6], perfumes_catalog[6:]]
+
+
+@pytest.mark.asyncio
+async def test_search_keyset_pages_from_memory_catalog(test_client, perfumes_catalog):
+    client, _, session, _ = test_client
+    await _add_perfumes(session, perfumes_catalog)
+    await catalog.load(session)
+    try:
+        pages = await _fetch_all(client, "/api/v1/perfumes/search", {"marca": "jardin", "limit": 4})
+    finally:
+        catalog.ready = False
+        catalog._reset()
+
+    assert pages == [perfumes_catalog[0:4], perfumes_catalog[4:]]
+
+
+@pytest.mark.asyncio
+async def test_collection_keyset_pages_newest_first(test_client, perfumes_catalog):
+    client, _, session, user = test_client
+    perfumes = await _add_perfumes(session, perfumes_catalog)
+
+    base = datetime(2026, 1, 1, 12, 0)
+    for i, perfume in enumerate(perfumes):
+        # Dos perfumes con el mismo added_at para cubrir el desempate por id
+        await session.execute(
+            perfume_collection.insert().values(
+                user_id=user.id,
+                perfume_id=perfume.id,
+                added_at=base + timedelta(minutes=min(i, 5)),
+            )
+        )
+    await session.commit()
+
+    pages = await _fetch_all(client, "/api/v1/perfumes/collection", {"limit": 3})
+
+    expected = list(reversed(perfumes_catalog))
+    assert pages == [expected[0:3], expected[3:6], expected[6:]]
+
+
+@pytest.mark.asyncio
+async def test_collection_without_limit_returns_everything(test_client, perfumes_catalog):
+    client, _, session, user = test_client
+    perfumes = await _add_perfumes(session, perfumes_catalog)
+    for perfume in perfumes:
+        await session.execute(
+            perfume_collection.insert().values(user_id=user.id, perfume_id=perfume.id)
+        )
+    await session.commit()
+
+    response = await client.get("/api/v1/perfumes/collection")
+
+    assert response.status_code == 200
+    assert len(response.json()) == len(perfumes_catalog)
+    assert "x-next-cursor" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_is_rejected(test_client):
+    client, _, _, _ = test_client
+
+    response = await client.get("/api/v1/perfumes/collection", params={"cursor": "no-es-un-cursor"})
+
+    assert response.status_code == 400
@@ -0,0 +1,237 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+import pytest_asyncio
+
+from sqlalchemy import select
+
+from app.models.perfume import Nota, Perfume
+from app.services import tags
+from app.services.catalog import catalog
+
+
+@pytest.mark.asyncio
+async def test_search_is_accent_insensitive_and_ranked(test_client):
+    client, _, session, _ = test_client
+
+    session.add_all([
+        Perfume(
+            nombre="Eau de Lancôme",
+            marca="Lancôme",
+            created_at=datetime.now(UTC),
+            is_private=False,
+        ),
+        Perfume(
+            nombre="La Vie Est Belle",
+            marca="Lancôme",
+            created_at=datetime.now(UTC),
+            is_private=False,
+        ),
+    ])
+    await session.commit()
+
+    response = await client.get("/api/v1/perfumes/search", params={"q": "LANCOME"})
+    assert response.status_code == 200
+    nombres = [p["nombre"] for p in response.json()]
+    assert nombres == ["Eau de Lancôme", "La Vie Est Belle"]
+
+
+@pytest.mark.asyncio
+async def test_search_text_follows_name_changes(test_client):
+    _, perfume, session, _ = test_client
+
+    assert perfume.search_text == "test perfume test brand"
+
+    perfume.nombre = "Ámbar Nocturno"
+    await session.commit()
+    await session.refresh(perfume)
+
+    assert perfume.search_text == "ambar nocturno test brand"
+
+
+@pytest_asyncio.fixture()
+async def loaded_catalog(test_client):
+    _, _, session, _ = test_client
+    session.add_all([
+        Perfume(nombre="Sauvage", marca="Dior", created_at=datetime.now(UTC), is_private=False),
+        Perfume(nombre="Sauvage Elixir", marca="Dior", created_at=datetime.now(UTC), is_private=False),
+        Perfume(nombre="Eau Sauvage", marca="Dior", created_at=datetime.now(UTC), is_private=False),
+    ])
+    await session.commit()
+    await catalog.load(session)
+    try:
+        yield catalog
+    finally:
+        catalog.ready = False
+        catalog._reset()
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_served_from_memory(test_client, loaded_catalog):
+    client, _, _, _ = test_client
+
+    response = await client.get("/api/v1/perfumes/autocomplete", params={"q": "sauv"})
+    assert response.status_code == 200
+    assert [p["nombre"] for p in response.json()] == ["Sauvage", "Sauvage Elixir", "Eau Sauvage"]
+
+
+@pytest.mark.asyncio
+async def test_search_merges_memory_catalog_with_private_perfumes(test_client, loaded_catalog):
+    client, _, session, owner = test_client
+
+    session.add(Perfume(
+        nombre="Sauvage Casero",
+        marca="Dior",
+        created_at=datetime.now(UTC),
+        is_private=True,
+        created_by=owner.id,
+    ))
+    await session.commit()
+
+    response = await client.get("/api/v1/perfumes/search", params={"q": "sauvage"})
+    assert response.status_code == 200
+    nombres = [p["nombre"] for p in response.json()]
+    assert nombres == ["Sauvage", "Sauvage Elixir", "Sauvage Casero", "Eau Sauvage"]
+
+    session.add(Perfume(nombre="Sauvage Parfum", marca="Dior", created_at=datetime.now(UTC), is_private=False))
+    await session.commit()
+    await loaded_catalog.refresh(session)
+
+    response = await client.get("/api/v1/perfumes/autocomplete", params={"q": "sauvage par"})
+    assert [p["nombre"] for p in response.json()] == ["Sauvage Parfum"]
+
+
+@pytest.mark.asyncio
+async def test_refresh_picks_up_rows_stamped_before_the_watermark(test_client, loaded_catalog):
+    _, _, session, _ = test_client
+
+    session.add(Perfume(nombre="Sauvage Parfum", marca="Dior", created_at=datetime.now(UTC), is_private=False))
+    await session.commit()
+    await loaded_catalog.refresh(session)
+    watermark = loaded_catalog.watermark
+
+    # Fila de una transacción larga: se confirma después con un now() anterior
+    session.add(Perfume(
+        nombre="Sauvage Tardío",
+        marca="Dior",
+        created_at=watermark - timedelta(seconds=30),
+        is_private=False,
+    ))
+    await session.commit()
+    await loaded_catalog.refresh(session)
+
+    assert [p["nombre"] for p in loaded_catalog.autocomplete("sauvage tar")] == ["Sauvage Tardío"]
+
+
+@pytest.mark.asyncio
+async def test_search_filters_by_accord_and_note_index(test_client):
+    client, _, _, _ = test_client
+
+    for nombre, notas, acordes in [
+        ("Cítrico Privado", ["Bergamota", "Limón"], ["Cítrico", "Fresco"]),
+        ("Dulce Privado", ["Vainilla", "Bergamota"], ["Dulce"]),
+    ]:
+        response = await client.post(
+            "/api/v1/perfumes/",
+            json={"nombre": nombre, "marca": "Casa", "notas": notas, "acordes": acordes},
+        )
+        assert response.status_code == 200
+
+    response = await client.get(
+        "/api/v1/perfumes/search", params={"acorde": "citrico", "nota": "BERGAMOTA"}
+    )
+    assert response.status_code == 200
+    resultados = response.json()
+    assert [p["nombre"] for p in resultados] == ["Cítrico Privado"]
+    assert resultados[0]["acordes"] == ["Cítrico", "Fresco"]
+
+    response = await client.get("/api/v1/perfumes/search", params={"nota": "bergamota"})
+    assert {p["nombre"] for p in response.json()} == {"Cítrico Privado", "Dulce Privado"}
+
+
+@pytest.mark.asyncio
+async def test_tag_resolution_tolerates_concurrent_inserts(test_client, monkeypatch):
+    _, _, session, _ = test_client
+
+    # Otra transacción ya creó "bergamota" entre nuestro SELECT y el INSERT
+    session.add(Nota(clave="bergamota", nombre="Bergamota"))
+    await session.commit()
+    original_select = tags._select_ids
+    calls = []
+
+    async def stale_first_select(db, model, claves):
+        calls.append(claves)
+        if len(calls) == 1:
+            return {}
+        return await original_select(db, model, claves)
+
+    monkeypatch.setattr(tags, "_select_ids", stale_first_select)
+    monkeypatch.setattr(tags, "CHUNK_SIZE", 1)
+
+    ids = await tags._resolve_ids(session, Nota, {"bergamota": "Bergamota", "limon": "Limón"})
+    assert set(ids) == {"bergamota", "limon"}
+    result = await session.execute(select(Nota.clave))
+    assert sorted(result.scalars().all()) == ["bergamota", "limon"]
+
+
+@pytest.mark.asyncio
+async def test_facets_single_query_for_filtered_search(test_client):
+    client, _, _, _ = test_client
+
+    for nombre, acordes in [("Uno", ["Cítrico", "Fresco"]), ("Dos", ["Cítrico"]), ("Tres", ["Dulce"])]:
+        await client.post(
+            "/api/v1/perfumes/",
+            json={"nombre": nombre, "marca": "Casa", "notas": ["Bergamota"], "acordes": acordes},
+        )
+
+    response = await client.get("/api/v1/perfumes/facets", params={"acorde": "citrico"})
+    assert response.status_code == 200
+    facets = response.json()
+    assert facets["total"] == 2
+    assert facets["marcas"] == [{"valor": "Casa", "total": 2}]
+    assert facets["acordes"] == [{"valor": "Cítrico", "total": 2}, {"valor": "Fresco", "total": 1}]
+    assert facets["notas"] == [{"valor": "Bergamota", "total": 2}]
+
+
+@pytest.mark.asyncio
+async def test_brand_facets_match_between_db_and_memory(test_client):
+    client, _, session, _ = test_client
+
+    session.add_all([
+        Perfume(nombre="Idôle", marca="Lancôme", created_at=datetime.now(UTC), is_private=False),
+        Perfume(nombre="Trésor", marca="LANCOME", created_at=datetime.now(UTC), is_private=False),
+        Perfume(nombre="Hypnôse", marca="lancome ", created_at=datetime.now(UTC), is_private=False),
+    ])
+    await session.commit()
+
+    from_db = (await client.get("/api/v1/perfumes/facets", params={"q": "lancome"})).json()
+    await catalog.load(session)
+    try:
+        from_memory = (await client.get("/api/v1/perfumes/facets", params={"q": "lancome"})).json()
+    finally:
+        catalog.ready = False
+        catalog._reset()
+
+    assert from_db["marcas"] == [{"valor": "Lancôme", "total": 3}]
+    assert from_db == from_memory
+
+
+@pytest.mark.asyncio
+async def test_facets_from_precomputed_catalog_include_private(test_client, loaded_catalog):
+    client, _, _, _ = test_client
+
+    await client.post(
+        "/api/v1/perfumes/",
+        json={"nombre": "Propio", "marca": "Casa", "notas": [], "acordes": ["Acorde"]},
+    )
+
+    response = await client.get("/api/v1/perfumes/facets")
+    assert response.status_code == 200
+    facets = response.json()
+    assert facets["total"] == 5
+    assert facets["marcas"] == [
+        {"valor": "Dior", "total": 3},
+        {"valor": "Casa", "total": 1},
+        {"valor": "Test Brand", "total": 1},
+    ]
+    assert facets["acordes"] == [{"valor": "acorde", "total": 2}]
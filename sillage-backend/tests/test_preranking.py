@@ -0,0 +1,43 @@
+from app.models.perfume import Perfume
+from app.services.preranking import context_vector, local_recommendation, prerank_perfumes, score_perfumes
+
+
+def _perfume(perfume_id, acordes, notas=()):
+    return Perfume(id=perfume_id, nombre=f"Perfume {perfume_id}", marca="Casa",
+                   acordes=list(acordes), notas=list(notas))
+
+
+COLECCION = [
+    _perfume(1, ["Oriental", "Dulce"], ["Vainilla", "Incienso"]),
+    _perfume(2, ["Cítrico", "Fresco"], ["Bergamota", "Limón"]),
+    _perfume(3, ["Amaderado"], ["Cedro", "Vetiver"]),
+    _perfume(4, ["Acuático"], ["Pomelo"]),
+    _perfume(5, [], []),  # sin términos conocidos: neutro
+]
+
+
+def test_context_drives_ranking():
+    verano = prerank_perfumes(COLECCION, 2, "verano", "mañana", "abierto", 30.0, 50.0)
+    assert [p.id for p in verano] == [2, 4]
+
+    invierno = prerank_perfumes(COLECCION, 2, "invierno", "noche", "abierto", 5.0, 50.0)
+    assert [p.id for p in invierno] == [1, 3]
+
+
+def test_scores_are_deterministic_and_neutral_without_terms():
+    context = context_vector("otoño", "tarde", "cerrado", 18.0, 80.0)
+    scores = score_perfumes(COLECCION, context)
+    assert scores[4] == 0.0
+    assert (score_perfumes(COLECCION, context) == scores).all()
+
+    # Empates por id; colecciones pequeñas pasan completas
+    duplicados = [_perfume(9, ["Fresco"]), _perfume(7, ["Fresco"]), _perfume(8, ["Fresco"])]
+    assert [p.id for p in prerank_perfumes(duplicados, 2, "verano", "tarde", "abierto", 25.0, 50.0)] == [7, 8]
+    assert prerank_perfumes(COLECCION, 10, "verano", "tarde", "abierto", 25.0, 50.0) == COLECCION
+
+
+def test_local_recommendation_uses_the_ai_answer_format():
+    perfume, texto = local_recommendation(COLECCION, "invierno", "noche", "cerrado", 4.0, 40.0)
+    assert perfume.id == 1
+    assert texto.split("\n")[0] == perfume.nombre
+    assert "cálido" in texto
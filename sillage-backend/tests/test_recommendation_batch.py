@@ -0,0 +1,59 @@
+import json
+import re
+from datetime import UTC, datetime
+
+import pytest
+
+from app.models.perfume import Perfume
+from app.models.recommendation import Recomendacion
+from app.services import recommendation_engine
+from app.services.gemini import BATCH_RECOMMENDATION_SCHEMA
+from tests.test_recommendation_cache import _payload
+
+
+@pytest.mark.asyncio
+async def test_batch_uses_one_llm_call_and_charges_atomically(test_client, fake_providers, monkeypatch):
+    client, perfume, session, user = test_client
+    otro = Perfume(nombre="Brisa", marca="Casa", acordes=["cítrico"], created_at=datetime.now(UTC), is_private=False)
+    session.add(otro)
+    await session.commit()
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    await client.post(f"/api/v1/perfumes/collection/{otro.id}")
+    weather_calls, ai_calls = fake_providers.weather_calls, fake_providers.ai_calls
+
+    async def fake_ai(prompt, response_schema=None):
+        ai_calls.append(prompt)
+        assert response_schema == BATCH_RECOMMENDATION_SCHEMA
+        ids = dict(re.findall(r"\[(P\d+)\] (\w+)", prompt))
+        by_name = {name: short_id for short_id, name in ids.items()}
+        # El evento 3 queda sin respuesta: se completa con el recomendador local
+        return json.dumps({"recomendaciones": [
+            {"evento": 1, "perfume_id": by_name["Test"], "explicacion": "Para la oficina"},
+            {"evento": 2, "perfume_id": by_name["Brisa"], "explicacion": "Para el almuerzo"},
+        ]})
+
+    monkeypatch.setattr(recommendation_engine, "get_ai_recommendation", fake_ai)
+
+    eventos = [_payload("Trabajo"), _payload("Almuerzo"), _payload("Cena")]
+    response = await client.post("/api/v1/recommendations/batch", json={"eventos": eventos})
+    assert response.status_code == 200
+    body = response.json()
+
+    assert len(ai_calls) == 1
+    assert len(weather_calls) == 3
+    assert [r["ocasion"] for r in body] == ["Trabajo", "Almuerzo", "Cena"]
+    assert body[0]["perfume_recomendado_id"] == perfume.id
+    assert body[1]["perfume_recomendado_id"] == otro.id
+    assert [r["es_fallback"] for r in body] == [False, False, True]
+
+    # Dos consultas (el fallback no se cobra) y tres filas guardadas
+    await session.refresh(user)
+    assert user.consultas_restantes == 3
+    rows = (await session.execute(Recomendacion.__table__.select())).all()
+    assert len(rows) == 3
+
+    # Sin consultas suficientes para el lote: 429 sin llamar a la IA
+    demasiados = {"eventos": [_payload(str(i)) for i in range(4)]}
+    rejected = await client.post("/api/v1/recommendations/batch", json=demasiados)
+    assert rejected.status_code == 429
+    assert len(ai_calls) == 1
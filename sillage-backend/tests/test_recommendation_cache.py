@@ -0,0 +1,151 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.models.perfume import Perfume
+from app.services import recommendation_engine
+
+
+def _payload(ocasion="Cena"):
+    mañana = datetime.now(UTC) + timedelta(days=1)
+    return {
+        "fecha_evento": mañana.date().isoformat(),
+        "hora_evento": "20:00",
+        "latitud": -33.45,
+        "longitud": -70.66,
+        "lugar_nombre": "Restaurante",
+        "lugar_tipo": "cerrado",
+        "lugar_descripcion": "Terraza techada",
+        "ocasion": ocasion,
+        "expectativa": "Elegante",
+        "vestimenta": "Formal",
+    }
+
+
+@pytest.mark.asyncio
+async def test_identical_request_reuses_cached_recommendation(
+    test_client, fake_redis, fake_providers
+):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+
+    first = await client.post("/api/v1/recommendations/", json=_payload())
+    assert first.status_code == 200
+    assert first.json()["perfume_recomendado"]["id"] == perfume.id
+
+    # Mismo contexto con otra capitalización/espacios: acierto de cache
+    second = await client.post("/api/v1/recommendations/", json=_payload(ocasion="  CENA "))
+    assert second.json()["id"] == first.json()["id"]
+    assert len(fake_providers.ai_calls) == 1
+    await session.refresh(user)
+    assert user.consultas_restantes == 4
+
+    # Cambiar la colección invalida el resultado cacheado
+    session.add(Perfume(nombre="Otro", marca="Casa", created_at=datetime.now(UTC), is_private=False))
+    await session.commit()
+    otro = (await client.get("/api/v1/perfumes/search", params={"q": "otro"})).json()[0]
+    await client.post(f"/api/v1/perfumes/collection/{otro['id']}")
+
+    third = await client.post("/api/v1/recommendations/", json=_payload())
+    assert third.json()["id"] != first.json()["id"]
+    assert len(fake_providers.ai_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retries_share_one_pipeline(
+    test_client, fake_redis, fake_providers, monkeypatch
+):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    calls = fake_providers.ai_calls
+
+    async def slow_ai(prompt, **kwargs):
+        await asyncio.sleep(0.3)
+        return await fake_providers.ai(prompt, **kwargs)
+
+    monkeypatch.setattr(recommendation_engine, "get_ai_recommendation", slow_ai)
+
+    first, retry = await asyncio.gather(
+        client.post("/api/v1/recommendations/", json=_payload()),
+        client.post("/api/v1/recommendations/", json=_payload()),
+    )
+    assert first.status_code == retry.status_code == 200
+    assert first.json()["id"] == retry.json()["id"]
+    assert len(calls) == 1
+    await session.refresh(user)
+    assert user.consultas_restantes == 4
+
+    # La Idempotency-Key devuelve el mismo resultado para el mismo payload
+    headers = {"Idempotency-Key": "toque-123"}
+    original = await client.post("/api/v1/recommendations/", json=_payload("Almuerzo"), headers=headers)
+    replay = await client.post("/api/v1/recommendations/", json=_payload("Almuerzo"), headers=headers)
+    assert replay.json()["id"] == original.json()["id"]
+    assert len(calls) == 2
+
+    # ...y rechaza reutilizarla con otro payload
+    reused = await client.post("/api/v1/recommendations/", json=_payload("Otra"), headers=headers)
+    assert reused.status_code == 422
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_result_write_does_not_charge_twice(
+    test_client, fake_redis, fake_providers, monkeypatch
+):
+    from app.services import request_flight
+
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    original_set = fake_redis.set
+
+    async def flaky_set(key, value, ex=None, nx=False):
+        # Redis cae justo después de que el líder confirmó y cobró
+        if key.startswith(request_flight.FLIGHT_KEY_PREFIX) and request_flight.DONE in value:
+            raise ConnectionError("redis caído")
+        return await original_set(key, value, ex=ex, nx=nx)
+
+    monkeypatch.setattr(fake_redis, "set", flaky_set)
+    monkeypatch.setattr(request_flight.settings, "RECOMMENDATION_FLIGHT_LOCK_SECONDS", 0.3)
+    monkeypatch.setattr(request_flight, "POLL_SECONDS", 0.05)
+    headers = {"Idempotency-Key": "toque-456"}
+
+    first = await client.post("/api/v1/recommendations/", json=_payload(), headers=headers)
+    assert first.status_code == 200
+
+    # El reintento ve el candado del líder y espera en lugar de repetir el pipeline
+    retry = await client.post("/api/v1/recommendations/", json=_payload(), headers=headers)
+    assert retry.status_code == 409
+    await session.refresh(user)
+    assert user.consultas_restantes == 4
+    assert len(fake_providers.ai_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_llm_falls_back_to_local_pick(
+    test_client, fake_redis, fake_providers, monkeypatch
+):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    calls = fake_providers.ai_calls
+
+    async def hanging_ai(prompt, **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(recommendation_engine, "get_ai_recommendation", hanging_ai)
+    monkeypatch.setattr(recommendation_engine.settings, "RECOMMENDATION_LLM_BUDGET_SECONDS", 0.05)
+
+    response = await client.post("/api/v1/recommendations/", json=_payload())
+    body = response.json()
+    assert response.status_code == 200
+    assert body["es_fallback"] is True
+    assert body["perfume_recomendado"]["id"] == perfume.id
+    assert body["respuesta_ia"].startswith("Test Perfume\n")
+
+    # El fallback no descuenta consultas ni se cachea: el siguiente intento vuelve a la IA
+    await session.refresh(user)
+    assert user.consultas_restantes == 5
+    retry = await client.post("/api/v1/recommendations/", json=_payload(ocasion=" CENA "))
+    assert retry.json()["id"] != body["id"]
+    assert len(calls) == 2
@@ -0,0 +1,77 @@
+from datetime import UTC, date, datetime, time, timedelta
+
+import pytest
+
+from app.models.recommendation import Recomendacion
+
+
+def _recomendacion(user_id, perfume_id, created_at):
+    return Recomendacion(
+        user_id=user_id,
+        fecha_evento=date(2026, 1, 1),
+        hora_evento=time(20, 30),
+        latitud=-33.4,
+        longitud=-70.6,
+        lugar_nombre="Teatro",
+        lugar_tipo="cerrado",
+        ocasion="Cita",
+        expectativa="Elegante",
+        vestimenta="Formal",
+        clima_descripcion="Despejado",
+        temperatura=18.5,
+        humedad=40.0,
+        prompt="prompt largo",
+        respuesta_ia="respuesta larga",
+        perfume_recomendado_id=perfume_id,
+        explicacion="Por su salida cítrica",
+        created_at=created_at,
+    )
+
+
+@pytest.mark.asyncio
+async def test_history_returns_projected_rows_with_cursor(test_client):
+    client, perfume, session, user = test_client
+    now = datetime.now(UTC)
+    session.add_all([
+        _recomendacion(user.id, perfume.id, now - timedelta(minutes=1)),
+        _recomendacion(user.id, None, now),
+    ])
+    await session.commit()
+
+    response = await client.get("/api/v1/recommendations/history", params={"limit": 1})
+    assert response.status_code == 200
+    [reciente] = response.json()
+    assert reciente["perfume_recomendado"] is None
+    assert reciente["hora_evento"] == "20:30:00"
+    assert "respuesta_ia" not in reciente and "prompt" not in reciente
+
+    response = await client.get(
+        "/api/v1/recommendations/history",
+        params={"limit": 1, "cursor": response.headers["x-next-cursor"]},
+    )
+    [anterior] = response.json()
+    assert anterior["perfume_recomendado"] == {
+        "id": perfume.id,
+        "nombre": perfume.nombre,
+        "marca": perfume.marca,
+        "perfumista": perfume.perfumista,
+        "notas": perfume.notas,
+        "acordes": perfume.acordes,
+    }
+
+
+@pytest.mark.asyncio
+async def test_recommendation_detail_joins_recommended_perfume(test_client):
+    client, perfume, session, user = test_client
+    recomendacion = _recomendacion(user.id, perfume.id, datetime.now(UTC))
+    session.add(recomendacion)
+    await session.commit()
+
+    response = await client.get(f"/api/v1/recommendations/{recomendacion.id}")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["respuesta_ia"] == "respuesta larga"
+    assert body["perfume_recomendado"]["nombre"] == perfume.nombre
+
+    response = await client.get("/api/v1/recommendations/9999")
+    assert response.status_code == 404
@@ -0,0 +1,100 @@
+import pytest
+from sqlalchemy import func, select, update
+
+from app.models.recommendation import Recomendacion, RecomendacionJob
+from app.services import recommendation_engine
+from app.services.recommendation_jobs import process_job
+from tests.test_recommendation_cache import _payload
+
+
+class SessionFactory:
+    """Fábrica de sesiones para los workers que reutiliza la sesión de test"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self.session
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.mark.asyncio
+async def test_async_job_is_processed_by_worker_and_polled(test_client, fake_providers):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+
+    headers = {"Idempotency-Key": "job-1"}
+    created = await client.post("/api/v1/recommendations/?async=true", json=_payload(), headers=headers)
+    assert created.status_code == 202
+    job_id = created.json()["job_id"]
+    assert created.json()["estado"] == "pendiente"
+
+    # Reintento con la misma clave: mismo trabajo
+    retry = await client.post("/api/v1/recommendations/?async=true", json=_payload(), headers=headers)
+    assert retry.json()["job_id"] == job_id
+    otro = dict(_payload(), ocasion="Otra")
+    reused = await client.post("/api/v1/recommendations/?async=true", json=otro, headers=headers)
+    assert reused.status_code == 422
+
+    pending = await client.get(f"/api/v1/recommendations/jobs/{job_id}")
+    assert pending.json()["estado"] == "pendiente"
+    assert pending.json()["recomendacion"] is None
+
+    factory = SessionFactory(session)
+    await process_job(factory, job_id)
+    await process_job(factory, job_id)  # ya completado: no se repite
+    assert len(fake_providers.ai_calls) == 1
+
+    done = await client.get(f"/api/v1/recommendations/jobs/{job_id}", params={"wait": 5})
+    body = done.json()
+    assert body["estado"] == "completado"
+    assert body["recomendacion"]["perfume_recomendado"]["id"] == perfume.id
+    await session.refresh(user)
+    assert user.consultas_restantes == 4
+
+    missing = await client.get("/api/v1/recommendations/jobs/desconocido")
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_job_fails_when_collection_is_emptied(test_client):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    created = await client.post("/api/v1/recommendations/?async=true", json=_payload())
+    job_id = created.json()["job_id"]
+
+    await client.delete(f"/api/v1/perfumes/collection/{perfume.id}")
+    await process_job(SessionFactory(session), job_id)
+
+    body = (await client.get(f"/api/v1/recommendations/jobs/{job_id}")).json()
+    assert body["estado"] == "error"
+    assert "colección" in body["error"]
+
+
+@pytest.mark.asyncio
+async def test_reclaimed_job_does_not_save_or_charge_twice(test_client, fake_providers, monkeypatch):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    created = await client.post("/api/v1/recommendations/?async=true", json=_payload())
+    job_id = created.json()["job_id"]
+
+    async def reclaimed_ai(prompt, **kwargs):
+        # Mientras la IA responde, el barrido da el trabajo por abandonado y otro worker lo toma
+        await session.execute(
+            update(RecomendacionJob).where(RecomendacionJob.id == job_id).values(estado="pendiente")
+        )
+        return await fake_providers.ai(prompt, **kwargs)
+
+    monkeypatch.setattr(recommendation_engine, "get_ai_recommendation", reclaimed_ai)
+
+    await process_job(SessionFactory(session), job_id)
+
+    # La fila, el descuento y el cierre del trabajo van juntos: no se confirmó nada
+    assert (await session.execute(select(func.count(Recomendacion.id)))).scalar() == 0
+    await session.refresh(user)
+    assert user.consultas_restantes == 5
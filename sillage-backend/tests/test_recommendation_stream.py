@@ -0,0 +1,122 @@
+import json
+
+import httpx
+import pytest
+
+from app.services import recommendation_engine
+from app.services.gemini import StreamInterrupted, stream_ai_recommendation
+from tests.test_recommendation_cache import _payload
+
+
+def _parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_gemini_stream_yields_text_chunks():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.params["alt"] == "sse"
+        chunks = ["Test Per", "fume\nFresco", " y elegante"]
+        body = "".join(
+            f'data: {json.dumps({"candidates": [{"content": {"parts": [{"text": c}]}}]})}\r\n\r\n'
+            for c in chunks
+        )
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://g") as client:
+        chunks = [chunk async for chunk in stream_ai_recommendation("prompt", client)]
+    assert "".join(chunks) == "Test Perfume\nFresco y elegante"
+
+
+@pytest.mark.asyncio
+async def test_stream_endpoint_sends_perfume_before_the_rest(test_client, fake_providers, monkeypatch):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+
+    async def fake_stream(prompt):
+        for chunk in ["Test Per", "fume\n", "Ideal para ", "la ocasión"]:
+            yield chunk
+
+    monkeypatch.setattr(recommendation_engine, "stream_ai_recommendation", fake_stream)
+
+    response = await client.post("/api/v1/recommendations/stream", json=_payload())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _parse_sse(response.text)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "clima"
+    # El perfume se anuncia al completar la primera línea, antes del resto del texto
+    assert kinds.index("perfume") < len(kinds) - 3
+    assert events[kinds.index("perfume")][1]["id"] == perfume.id
+    assert kinds.count("perfume") == 1
+
+    kind, final = events[-1]
+    assert kind == "fin"
+    assert final["respuesta_ia"] == "Test Perfume\nIdeal para la ocasión"
+    assert final["perfume_recomendado"]["id"] == perfume.id
+
+    # Persistida y visible por el endpoint clásico
+    detail = await client.get(f"/api/v1/recommendations/{final['id']}")
+    assert detail.json()["respuesta_ia"] == final["respuesta_ia"]
+    await session.refresh(user)
+    assert user.consultas_restantes == 4
+
+
+@pytest.mark.asyncio
+async def test_stream_cut_midway_is_replaced_by_local_pick(
+    test_client, fake_redis, fake_providers, monkeypatch
+):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+
+    async def broken_stream(prompt):
+        yield "Test Perfume\n"
+        yield "Ideal para "
+        raise StreamInterrupted("conexión cerrada")
+
+    monkeypatch.setattr(recommendation_engine, "stream_ai_recommendation", broken_stream)
+
+    response = await client.post("/api/v1/recommendations/stream", json=_payload())
+    events = _parse_sse(response.text)
+    kinds = [kind for kind, _ in events]
+    assert "reinicio" in kinds
+    assert kinds[-1] == "fin"
+
+    # Se guarda la respuesta local completa, no el texto truncado, y no se cobra
+    final = events[-1][1]
+    assert final["es_fallback"] is True
+    assert "Ideal para" not in final["respuesta_ia"]
+    await session.refresh(user)
+    assert user.consultas_restantes == 5
+    assert not [key for key in fake_redis.data if key.startswith("recommendations:cache")]
+
+
+@pytest.mark.asyncio
+async def test_stream_fallback_charge_is_saved_with_the_row(test_client, fake_providers, monkeypatch):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+
+    async def empty_stream(prompt):
+        return
+        yield
+
+    monkeypatch.setattr(recommendation_engine, "stream_ai_recommendation", empty_stream)
+    monkeypatch.setattr(recommendation_engine.settings, "RECOMMENDATION_FALLBACK_CONSUMES_QUOTA", True)
+    commits = []
+    original_commit = session.commit
+
+    async def counting_commit():
+        commits.append(user.consultas_restantes)
+        await original_commit()
+
+    monkeypatch.setattr(session, "commit", counting_commit)
+
+    response = await client.post("/api/v1/recommendations/stream", json=_payload())
+    assert _parse_sse(response.text)[-1][1]["es_fallback"] is True
+    # Un solo commit guarda la fila y el descuento
+    assert commits == [4]
@@ -0,0 +1,147 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.gemini import get_ai_recommendation
+from app.services.resilience import (
+    BulkheadFull,
+    CircuitOpen,
+    ProviderGuard,
+    guards,
+    metrics,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _server(statuses, calls, delay=0.0):
+    """Servidor local: responde los códigos de `statuses` en orden (el último se repite)"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if delay:
+            await asyncio.sleep(delay)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        return httpx.Response(status, json={"ok": status == 200}, headers={"Retry-After": "1"})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://fake")
+
+
+def _guard(**kwargs):
+    guard = ProviderGuard("fake", backoff_base=0.01, **kwargs)
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    guard._sleep = fake_sleep
+    return guard, sleeps
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried_with_backoff():
+    calls = []
+    guard, sleeps = _guard(max_retries=2, backoff_cap=2.0)
+    async with _server([503, 429, 200], calls) as client:
+        response = await guard.request(lambda: client.get("/"))
+    assert response.status_code == 200
+    assert len(calls) == 3
+    # Retry-After (1s) acota por abajo el jitter
+    assert sleeps and all(1.0 <= s <= 2.0 for s in sleeps)
+
+    # Los 4xx del cliente no se reintentan
+    calls.clear()
+    async with _server([404], calls) as client:
+        assert (await guard.request(lambda: client.get("/"))).status_code == 404
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_budget_limits_retries():
+    calls = []
+    guard, _ = _guard(max_retries=3, retry_ratio=0.0, retry_max_tokens=1.0, failure_threshold=100)
+    async with _server([500], calls) as client:
+        await guard.request(lambda: client.get("/"))
+        assert len(calls) == 2  # un reintento con la única ficha
+        await guard.request(lambda: client.get("/"))
+        assert len(calls) == 3  # presupuesto agotado: sin reintentos
+    assert metrics.snapshot()["fake"]["presupuesto_agotado"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_fails_fast_and_recovers():
+    calls = []
+    clock = FakeClock()
+    guard, _ = _guard(max_retries=0, failure_threshold=2, reset_seconds=30.0, clock=clock)
+    before = dict(metrics.snapshot().get("fake", {}))
+
+    async with _server([502, 502, 200], calls) as client:
+        for _ in range(2):
+            await guard.request(lambda: client.get("/"))
+        assert guard.breaker.state == "abierto"
+
+        with pytest.raises(CircuitOpen):
+            await guard.request(lambda: client.get("/"))
+        assert len(calls) == 2  # sin llamar al proveedor
+
+        clock.now += 31
+        response = await guard.request(lambda: client.get("/"))
+        assert response.status_code == 200
+        assert guard.breaker.state == "cerrado"
+
+    after = metrics.snapshot()["fake"]
+    for event in ("circuito_abierto", "circuito_semiabierto", "circuito_cerrado", "rechazo_circuito"):
+        assert after[event] == before.get(event, 0) + 1
+
+
+@pytest.mark.asyncio
+async def test_call_started_while_closed_keeps_the_half_open_probe():
+    clock = FakeClock()
+    guard, _ = _guard(failure_threshold=1, reset_seconds=30.0, clock=clock)
+
+    old_call = guard.slot()
+    await old_call.__aenter__()
+    # Mientras sigue en curso, el circuito se abre y luego entra la prueba semiabierta
+    guard.breaker.record_failure()
+    clock.now += 31
+    async with guard.slot():
+        await old_call.__aexit__(None, None, None)
+        # La llamada antigua no libera la prueba ajena: sigue siendo la única
+        with pytest.raises(CircuitOpen):
+            async with guard.slot():
+                pass
+
+
+@pytest.mark.asyncio
+async def test_bulkhead_rejects_when_provider_is_saturated():
+    calls = []
+    guard, _ = _guard(max_concurrent=1, queue_timeout=0.01)
+    async with _server([200], calls, delay=0.1) as client:
+        results = await asyncio.gather(
+            guard.request(lambda: client.get("/")),
+            guard.request(lambda: client.get("/")),
+            return_exceptions=True,
+        )
+    assert sum(isinstance(r, BulkheadFull) for r in results) == 1
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_gemini_fails_fast_while_circuit_is_open():
+    calls = []
+    guard, _ = _guard(failure_threshold=1)
+    guard.breaker.record_failure()
+    guards.set("gemini", guard)
+    try:
+        async with _server([200], calls) as client:
+            assert await get_ai_recommendation("prompt", client) is None
+        assert calls == []
+    finally:
+        guards.reset()
@@ -0,0 +1,49 @@
+from datetime import UTC, datetime
+
+import pytest
+
+from app.models.perfume import Perfume
+from app.services.search_cache import bump_catalog_version
+
+
+@pytest.mark.asyncio
+async def test_public_search_results_are_cached_per_catalog_version(test_client, fake_redis):
+    client, _, session, user = test_client
+
+    session.add(Perfume(nombre="Neroli", marca="Casa", created_at=datetime.now(UTC), is_private=False))
+    await session.commit()
+
+    first = await client.get("/api/v1/perfumes/search", params={"q": "neroli"})
+    second = await client.get("/api/v1/perfumes/search", params={"q": "neroli"})
+    assert first.json() == second.json()
+    assert [p["nombre"] for p in second.json()] == ["Neroli"]
+
+    # Las estadísticas son solo para administradores
+    denied = await client.get("/api/v1/perfumes/search/cache-stats")
+    assert denied.status_code == 403
+    user.is_superuser = True
+    await session.commit()
+
+    stats = (await client.get("/api/v1/perfumes/search/cache-stats")).json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    # Un perfume privado no cambia el catálogo público: la entrada sigue sirviendo
+    # y el privado se suma desde la BD
+    created = await client.post(
+        "/api/v1/perfumes/",
+        json={"nombre": "Neroli Propio", "marca": "Casa", "notas": [], "acordes": []},
+    )
+    assert created.status_code == 200
+
+    third = await client.get("/api/v1/perfumes/search", params={"q": "neroli"})
+    assert [p["nombre"] for p in third.json()] == ["Neroli", "Neroli Propio"]
+
+    stats = (await client.get("/api/v1/perfumes/search/cache-stats")).json()
+    assert stats == {"hits": 2, "misses": 1, "hit_rate": 0.6667, "catalog_version": 0}
+
+    # Un cambio del catálogo público (carga CSV) sube la versión e invalida
+    await bump_catalog_version()
+    await client.get("/api/v1/perfumes/search", params={"q": "neroli"})
+    stats = (await client.get("/api/v1/perfumes/search/cache-stats")).json()
+    assert stats == {"hits": 2, "misses": 2, "hit_rate": 0.5, "catalog_version": 1}
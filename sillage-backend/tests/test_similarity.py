@@ -0,0 +1,102 @@
+from datetime import UTC, datetime
+
+import pytest
+
+from app.api.v1.endpoints import perfumes as perfumes_endpoint
+from app.models.perfume import Perfume
+from app.services.catalog import catalog
+from app.services.similarity import SimilarityIndex
+
+
+def _perfume(perfume_id, notas, acordes, perfumista=None):
+    return Perfume(
+        id=perfume_id,
+        nombre=f"Perfume {perfume_id}",
+        marca="Casa",
+        notas=notas,
+        acordes=acordes,
+        perfumista=perfumista,
+        created_at=datetime(2026, 1, 1, tzinfo=UTC),
+    )
+
+
+def test_similarity_index_ranks_and_updates_incrementally(tmp_path):
+    index = SimilarityIndex(tmp_path / "similarity.npz")
+    index.on_catalog_change([
+        _perfume(1, ["Bergamota", "Limón"], ["Cítrico", "Fresco"]),
+        _perfume(2, ["Bergamota"], ["Cítrico"]),
+        _perfume(3, ["Vainilla"], ["Dulce"]),
+    ], [], True)
+
+    assert [pid for pid, _ in index.similar(["bergamota"], ["citrico"], None, exclude_id=1)] == [2]
+
+    # Alta incremental con un rasgo nuevo y baja de otro perfume
+    index.on_catalog_change([_perfume(4, ["Bergamota"], ["Cítrico", "Ámbar"])], [2], False)
+    resultados = index.similar(["Bergamota", "Limón"], ["Cítrico", "Fresco"], None, exclude_id=1)
+    assert [pid for pid, _ in resultados] == [4]
+
+    restored = SimilarityIndex(tmp_path / "similarity.npz")
+    assert restored.load()
+    assert len(restored) == 3
+    assert restored.similar(["Bergamota", "Limón"], ["Cítrico", "Fresco"], None, exclude_id=1) == resultados
+
+
+@pytest.mark.asyncio
+async def test_index_saved_off_the_event_loop(tmp_path, monkeypatch):
+    import asyncio
+    import threading
+
+    from app.services import similarity
+
+    writers = []
+    write = similarity._write_npz
+
+    def recording_write(path, arrays):
+        writers.append(threading.current_thread() is threading.main_thread())
+        write(path, arrays)
+
+    monkeypatch.setattr(similarity, "_write_npz", recording_write)
+    index = SimilarityIndex(tmp_path / "similarity.npz")
+    index.on_catalog_change([_perfume(1, ["Bergamota"], ["Cítrico"])], [], True)
+    index.on_catalog_change([_perfume(2, ["Vainilla"], ["Dulce"])], [], False)
+    await index.wait_saved()
+
+    # Escrito en un hilo, agrupando los cambios, sin temporales sueltos
+    assert writers and not any(writers)
+    assert len(writers) <= 2
+    assert [p.name for p in tmp_path.iterdir()] == ["similarity.npz"]
+    restored = SimilarityIndex(tmp_path / "similarity.npz")
+    assert restored.load() and len(restored) == 2
+
+
+@pytest.mark.asyncio
+async def test_similar_endpoint_uses_catalog_index(test_client, monkeypatch):
+    client, _, session, _ = test_client
+
+    index = SimilarityIndex()
+    monkeypatch.setattr(perfumes_endpoint, "similarity_index", index)
+    session.add_all([
+        Perfume(nombre="Acqua", marca="Casa", notas=["Bergamota"], acordes=["Cítrico", "Fresco"],
+                created_at=datetime.now(UTC), is_private=False),
+        Perfume(nombre="Limonada", marca="Casa", notas=["Limón"], acordes=["Cítrico"],
+                created_at=datetime.now(UTC), is_private=False),
+        Perfume(nombre="Gourmand", marca="Casa", notas=["Vainilla"], acordes=["Dulce"],
+                created_at=datetime.now(UTC), is_private=False),
+    ])
+    await session.commit()
+
+    catalog.add_listener(index.on_catalog_change)
+    try:
+        await catalog.load(session)
+        acqua = next(p for p in catalog.search(q="acqua"))
+
+        response = await client.get(f"/api/v1/perfumes/{acqua['id']}/similar")
+        assert response.status_code == 200
+        assert [p["nombre"] for p in response.json()] == ["Limonada"]
+
+        response = await client.get("/api/v1/perfumes/9999/similar")
+        assert response.status_code == 404
+    finally:
+        catalog._listeners.remove(index.on_catalog_change)
+        catalog.ready = False
+        catalog._reset()
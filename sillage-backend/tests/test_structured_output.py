@@ -0,0 +1,106 @@
+import json
+import re
+from datetime import UTC, date, datetime, time
+
+import httpx
+import pytest
+
+from app.models.perfume import Perfume
+from app.services import recommendation_engine
+from app.services.gemini import (
+    RECOMMENDATION_SCHEMA,
+    build_prompt,
+    get_ai_recommendation,
+    parse_structured_recommendation,
+    short_perfume_ids,
+)
+from tests.test_recommendation_cache import _payload
+
+
+def _perfume(perfume_id, nombre):
+    return Perfume(id=perfume_id, nombre=nombre, marca="Dior", acordes=["fresco"], notas=["bergamota"])
+
+
+def test_strict_parser_maps_short_ids():
+    ids = short_perfume_ids([_perfume(10, "Sauvage"), _perfume(11, "Sauvage Elixir"), _perfume(12, "Fahrenheit")])
+    perfume, explicacion, alternativas = parse_structured_recommendation(
+        '{"perfume_id": "P1", "explicacion": "Fresco, no el Elixir", "alternativas": ["P3", "P1", "P9"]}', ids
+    )
+    assert perfume.id == 10
+    assert explicacion == "Fresco, no el Elixir"
+    assert [p.id for p in alternativas] == [12]
+
+    # Ids tal como aparecen en el prompt ("[P2]") o con espacios
+    perfume, _, alternativas = parse_structured_recommendation(
+        '{"perfume_id": " [P2] ", "explicacion": "x", "alternativas": ["[p3]"]}', ids
+    )
+    assert perfume.id == 11
+    assert [p.id for p in alternativas] == [12]
+
+    # Id desconocido, campos extra, tipos incorrectos o texto libre: se rechaza
+    assert parse_structured_recommendation('{"perfume_id": "P7", "explicacion": "x"}', ids) is None
+    assert parse_structured_recommendation('{"perfume_id": "P1", "explicacion": "x", "extra": 1}', ids) is None
+    assert parse_structured_recommendation('{"perfume_id": 1, "explicacion": "x"}', ids) is None
+    assert parse_structured_recommendation("Sauvage\nFresco", ids) is None
+
+
+@pytest.mark.asyncio
+async def test_structured_prompt_and_request_payload():
+    perfumes = [_perfume(10, "Sauvage"), _perfume(11, "Sauvage Elixir")]
+    prompt = build_prompt(
+        perfumes, date(2026, 1, 10), time(20, 0), "Bar", "cerrado", "Azotea", "Cita",
+        "Elegante", "Formal", 24.0, 50.0, "despejado", structured=True
+    )
+    assert "- [P1] Sauvage (Dior)" in prompt
+    assert "- [P2] Sauvage Elixir (Dior)" in prompt
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        assert body["generationConfig"]["responseMimeType"] == "application/json"
+        assert body["generationConfig"]["responseSchema"] == RECOMMENDATION_SCHEMA
+        answer = json.dumps({"perfume_id": "P2", "explicacion": "Intenso para la noche"})
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": answer}]}}]})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://g") as client:
+        text = await get_ai_recommendation(prompt, client, response_schema=RECOMMENDATION_SCHEMA)
+    assert parse_structured_recommendation(text, short_perfume_ids(perfumes))[0].id == 11
+
+
+@pytest.mark.asyncio
+async def test_recommendation_uses_exact_id_from_json(test_client, fake_providers, monkeypatch):
+    client, perfume, session, user = test_client
+    elixir = Perfume(nombre="Test Perfume Elixir", marca="Test Brand", created_at=datetime.now(UTC), is_private=False)
+    session.add(elixir)
+    await session.commit()
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+    await client.post(f"/api/v1/perfumes/collection/{elixir.id}")
+
+    async def fake_ai(prompt, response_schema=None):
+        assert response_schema == RECOMMENDATION_SCHEMA
+        short_id = re.search(r"\[(P\d+)\] Test Perfume \(", prompt).group(1)
+        # La explicación menciona el flanker: con texto libre se elegiría el nombre más largo
+        return json.dumps({"perfume_id": short_id, "explicacion": "Mejor que Test Perfume Elixir hoy"})
+
+    monkeypatch.setattr(recommendation_engine, "get_ai_recommendation", fake_ai)
+
+    body = (await client.post("/api/v1/recommendations/", json=_payload())).json()
+    assert body["perfume_recomendado_id"] == perfume.id
+    assert body["respuesta_ia"] == "Test Perfume\nMejor que Test Perfume Elixir hoy"
+    assert body["es_fallback"] is False
+
+
+@pytest.mark.asyncio
+async def test_invalid_structured_reply_uses_local_pick(test_client, fake_providers, monkeypatch):
+    client, perfume, session, user = test_client
+    await client.post(f"/api/v1/perfumes/collection/{perfume.id}")
+
+    async def fake_ai(prompt, response_schema=None):
+        return json.dumps({"perfume_id": "P1", "explicacion": "x", "sobra": True})
+
+    monkeypatch.setattr(recommendation_engine, "get_ai_recommendation", fake_ai)
+
+    body = (await client.post("/api/v1/recommendations/", json=_payload())).json()
+    assert body["es_fallback"] is True
+    assert body["perfume_recomendado_id"] == perfume.id
+    assert body["respuesta_ia"].startswith("Test Perfume\n")
+    assert "perfume_id" not in body["respuesta_ia"]
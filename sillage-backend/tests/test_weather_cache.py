@@ -0,0 +1,64 @@
+import asyncio
+from datetime import date, time
+
+import httpx
+import pytest
+
+from app.services.weather import get_weather_data
+from app.utils.geohash import encode
+
+
+def _forecast_transport(calls):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.params["lat"])
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"list": [
+            {"dt_txt": "2026-01-01 21:00:00", "weather": [{"description": "nublado"}],
+             "main": {"temp": 19.0, "humidity": 55}},
+            {"dt_txt": "2026-01-01 18:00:00", "weather": [{"description": "despejado"}],
+             "main": {"temp": 25.0, "humidity": 30}},
+        ]})
+    return httpx.MockTransport(handler)
+
+
+def test_geohash_matches_reference_value():
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+@pytest.mark.asyncio
+async def test_forecast_cached_per_tile_with_single_flight(fake_redis):
+    calls = []
+    async with httpx.AsyncClient(
+        base_url="https://api.openweathermap.org", transport=_forecast_transport(calls)
+    ) as client:
+        # Dos puntos de la misma celda (Santiago centro) consultados a la vez
+        resultados = await asyncio.gather(
+            get_weather_data(-33.4489, -70.6693, date(2026, 1, 1), time(19, 0), client),
+            get_weather_data(-33.4501, -70.6701, date(2026, 1, 1), time(20, 0), client),
+        )
+        assert [r["descripcion"] for r in resultados] == ["despejado", "nublado"]
+        assert len(calls) == 1
+
+        # Empate a igual distancia: gana el bloque anterior, ya desde la caché
+        clima = await get_weather_data(-33.45, -70.67, date(2026, 1, 1), time(19, 30), client)
+        assert clima["descripcion"] == "despejado"
+        assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_still_returns_fetched_forecast(fake_redis, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("redis caído")
+
+    monkeypatch.setattr(fake_redis, "get", broken)
+    monkeypatch.setattr(fake_redis, "set", broken)
+
+    calls = []
+    async with httpx.AsyncClient(
+        base_url="https://api.openweathermap.org", transport=_forecast_transport(calls)
+    ) as client:
+        clima = await get_weather_data(-33.4489, -70.6693, date(2026, 1, 1), time(19, 0), client)
+
+    # Pronóstico real, no los valores por defecto
+    assert clima["descripcion"] == "despejado"
+    assert len(calls) == 1
@@ -1,5 +1,11 @@
 import { useState, useEffect } from 'react';
 import { authService, User, LoginCredentials, RegisterData } from '../services/authService';
+import { catalogSync } from '../services/catalogSync';
+
+// Sincronizar el catálogo público en segundo plano (snapshot la primera vez, luego deltas)
+const syncCatalog = () => {
+  catalogSync.sync().catch((error) => console.log('Error syncing catalog:', error));
+};
 
 export const useAuth = () => {
   const [user, setUser] = useState<User | null>(null);
@@ -17,6 +23,7 @@ export const useAuth = () => {
         const userData = await authService.getUserFromStorage();
         setUser(userData);
         setIsAuthenticated(true);
+        syncCatalog();
       }
     } catch (error) {
       console.log('Error checking auth:', error);
@@ -30,6 +37,7 @@ export const useAuth = () => {
       const response = await authService.login(credentials);
       setUser(response.user);
       setIsAuthenticated(true);
+      syncCatalog();
       return { success: true };
     } catch (error: any) {
       return {
@@ -44,6 +52,7 @@ export const useAuth = () => {
       const response = await authService.register(data);
       setUser(response.user);
       setIsAuthenticated(true);
+      syncCatalog();
       return { success: true };
     } catch (error: any) {
       return {
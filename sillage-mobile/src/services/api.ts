@@ -14,6 +14,12 @@ const api = axios.create({
   timeout: 10000,
 });
 
+// Respuestas GET con ETag: se revalidan con If-None-Match y un 304 reutiliza el cuerpo guardado
+const etagCache = new Map<string, { etag: string; data: unknown; headers: unknown }>();
+
+const cacheKey = (config: { url?: string; params?: unknown }) =>
+  `${config.url}?${JSON.stringify(config.params ?? {})}`;
+
 // Interceptor para agregar token JWT en cada petición
 api.interceptors.request.use(
   async (config) => {
@@ -21,6 +27,12 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if ((config.method ?? 'get') === 'get') {
+      const cached = etagCache.get(cacheKey(config));
+      if (cached) {
+        config.headers['If-None-Match'] = cached.etag;
+      }
+    }
     return config;
   },
   (error) => {
@@ -30,9 +42,26 @@ api.interceptors.request.use(
 
 // Interceptor para manejar respuestas y errores
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    const etag = response.headers['etag'];
+    if (etag && (response.config.method ?? 'get') === 'get') {
+      etagCache.set(cacheKey(response.config), {
+        etag,
+        data: response.data,
+        headers: response.headers,
+      });
+    }
+    return response;
+  },
   async (error) => {
+    if (error.response?.status === 304) {
+      const cached = etagCache.get(cacheKey(error.config));
+      if (cached) {
+        return { ...error.response, status: 200, data: cached.data, headers: cached.headers };
+      }
+    }
     if (error.response?.status === 401) {
+      etagCache.clear();
       // Token expirado o inválido
       await AsyncStorage.removeItem('access_token');
       // Aquí podrías redirigir al login
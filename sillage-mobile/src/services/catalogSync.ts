@@ -0,0 +1,141 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
+import api from './api';
+import type { Perfume, SearchParams } from './perfumeService';
+
+const STORAGE_KEY = 'catalog_snapshot';
+
+interface CatalogSnapshot {
+  version: string | null;
+  campos: (keyof Perfume)[];
+  perfumes: unknown[][];
+}
+
+interface CatalogDelta {
+  version: string | null;
+  perfumes: Perfume[];
+  eliminados: number[];
+}
+
+interface StoredCatalog {
+  version: string | null;
+  perfumes: Perfume[];
+}
+
+let memoryCatalog: StoredCatalog | null = null;
+
+function fromSnapshot(snapshot: CatalogSnapshot): StoredCatalog {
+  const perfumes = snapshot.perfumes.map((row) => {
+    const perfume: Record<string, unknown> = {};
+    snapshot.campos.forEach((campo, i) => {
+      perfume[campo] = row[i];
+    });
+    return perfume as unknown as Perfume;
+  });
+  return { version: snapshot.version, perfumes };
+}
+
+async function downloadSnapshot(): Promise<StoredCatalog> {
+  const response = await api.get<CatalogSnapshot>('/perfumes/catalog/snapshot', { timeout: 60000 });
+  return fromSnapshot(response.data);
+}
+
+function applyDelta(catalog: StoredCatalog, delta: CatalogDelta): StoredCatalog {
+  const porId = new Map(catalog.perfumes.map((p) => [p.id, p]));
+  delta.eliminados.forEach((id) => porId.delete(id));
+  delta.perfumes.forEach((p) => porId.set(p.id, p));
+  return {
+    version: delta.version ?? catalog.version,
+    perfumes: Array.from(porId.values()).sort((a, b) => a.id - b.id),
+  };
+}
+
+// Misma normalización que el backend: minúsculas, sin acentos y espacios colapsados
+function normalize(value?: string): string {
+  if (!value) return '';
+  return value
+    .normalize('NFD')
+    .replace(/[\u0300-\u036f]/g, '')
+    .toLowerCase()
+    .replace(/\s+/g, ' ')
+    .trim();
+}
+
+// Puntaje de coincidencia (menor es mejor) o null; igual que match_score del backend
+function matchScore(searchText: string, q: string): [number, number] | null {
+  const words = searchText.split(' ');
+  for (const token of q.split(' ')) {
+    if (!words.some((word) => word.startsWith(token))) return null;
+  }
+  const position = searchText.indexOf(q);
+  if (position === 0) return [0, searchText.length];
+  if (position > 0) return [1, position];
+  return [2, searchText.length];
+}
+
+function hasTerm(values: string[] | undefined, term: string): boolean {
+  return (values ?? []).some((value) => normalize(value) === term);
+}
+
+export const catalogSync = {
+  // Catálogo público local: snapshot la primera vez, luego solo los cambios
+  async sync(): Promise<Perfume[]> {
+    let catalog = memoryCatalog;
+    if (!catalog) {
+      const stored = await AsyncStorage.getItem(STORAGE_KEY);
+      catalog = stored ? (JSON.parse(stored) as StoredCatalog) : null;
+    }
+
+    if (!catalog || !catalog.version) {
+      catalog = await downloadSnapshot();
+    } else {
+      try {
+        const response = await api.get<CatalogDelta>('/perfumes/catalog/delta', {
+          params: { since: catalog.version },
+        });
+        catalog = applyDelta(catalog, response.data);
+      } catch (error: any) {
+        // 410: demasiados cambios desde la última sincronización
+        if (error.response?.status !== 410) throw error;
+        catalog = await downloadSnapshot();
+      }
+    }
+
+    memoryCatalog = catalog;
+    await AsyncStorage.setItem(STORAGE_KEY, JSON.stringify(catalog));
+    return catalog.perfumes;
+  },
+
+  // Perfumes del catálogo local (sin red); vacío si aún no se sincronizó
+  async getLocal(): Promise<Perfume[]> {
+    if (!memoryCatalog) {
+      const stored = await AsyncStorage.getItem(STORAGE_KEY);
+      memoryCatalog = stored ? (JSON.parse(stored) as StoredCatalog) : null;
+    }
+    return memoryCatalog?.perfumes ?? [];
+  },
+
+  // Búsqueda sobre el catálogo local, con el mismo orden que /perfumes/search
+  async search({ q, marca, acorde, nota, limit = 50 }: SearchParams): Promise<Perfume[]> {
+    const perfumes = await this.getLocal();
+    const qNorm = normalize(q);
+    const marcaNorm = normalize(marca);
+    const acordeNorm = normalize(acorde);
+    const notaNorm = normalize(nota);
+
+    const ranked: { score: [number, number]; perfume: Perfume }[] = [];
+    for (const perfume of perfumes) {
+      if (marcaNorm && !normalize(perfume.marca).includes(marcaNorm)) continue;
+      if (acordeNorm && !hasTerm(perfume.acordes, acordeNorm)) continue;
+      if (notaNorm && !hasTerm(perfume.notas, notaNorm)) continue;
+      const score = qNorm
+        ? matchScore(normalize(`${perfume.nombre} ${perfume.marca}`), qNorm)
+        : ([0, 0] as [number, number]);
+      if (score) ranked.push({ score, perfume });
+    }
+    ranked.sort(
+      (a, b) =>
+        a.score[0] - b.score[0] || a.score[1] - b.score[1] || a.perfume.id - b.perfume.id
+    );
+    return ranked.slice(0, limit).map((item) => item.perfume);
+  },
+};
@@ -1,4 +1,5 @@
 import api from './api';
+import { catalogSync } from './catalogSync';
 
 export interface Perfume {
   id: number;
@@ -27,28 +28,75 @@ export interface SearchParams {
   q?: string;
   marca?: string;
   acorde?: string;
+  nota?: string;
   limit?: number;
 }
 
+export interface FacetCount {
+  valor: string;
+  total: number;
+}
+
+export interface PerfumeFacets {
+  total: number;
+  marcas: FacetCount[];
+  acordes: FacetCount[];
+  notas: FacetCount[];
+}
+
+export interface CollectionBatchResult {
+  agregados: number;
+  eliminados: number;
+  resultados: { perfume_id: number; estado: string }[];
+}
+
 export const perfumeService = {
-  // Buscar perfumes
+  // Buscar perfumes: primero en el catálogo local; la API solo si aún no se
+  // sincronizó o si no hay coincidencias por prefijo (búsqueda difusa del servidor)
   async search(params: SearchParams): Promise<Perfume[]> {
+    if ((await catalogSync.getLocal()).length) {
+      const local = await catalogSync.search(params);
+      if (local.length) return local;
+    }
     const response = await api.get<Perfume[]>('/perfumes/search', { params });
     return response.data;
   },
 
-  // Obtener mi colección
-  async getMyCollection(): Promise<PerfumeInCollection[]> {
-    const response = await api.get<PerfumeInCollection[]>('/perfumes/collection');
+  // Conteos por marca, acorde y nota para los filtros actuales
+  async getFacets(params: Omit<SearchParams, 'limit'> & { top?: number }): Promise<PerfumeFacets> {
+    const response = await api.get<PerfumeFacets>('/perfumes/facets', { params });
     return response.data;
   },
 
+  // Obtener mi colección (recorre todas las páginas con el cursor X-Next-Cursor)
+  async getMyCollection(): Promise<PerfumeInCollection[]> {
+    const perfumes: PerfumeInCollection[] = [];
+    let cursor: string | undefined;
+    do {
+      const response = await api.get<PerfumeInCollection[]>('/perfumes/collection', {
+        params: { limit: 200, cursor },
+      });
+      perfumes.push(...response.data);
+      cursor = response.headers['x-next-cursor'];
+    } while (cursor);
+    return perfumes;
+  },
+
   // Agregar perfume a mi colección
   async addToCollection(perfumeId: number): Promise<{ message: string }> {
     const response = await api.post(`/perfumes/collection/${perfumeId}`);
     return response.data;
   },
 
+  // Agregar y/o eliminar varios perfumes de mi colección en una sola petición
+  async updateCollection(agregar: number[], eliminar: number[] = []): Promise<CollectionBatchResult> {
+    const response = await api.post<CollectionBatchResult>('/perfumes/collection/batch', {
+      agregar,
+      eliminar,
+    });
+    return response.data;
+  },
+
   // Eliminar perfume de mi colección
   async removeFromCollection(perfumeId: number): Promise<{ message: string }> {
     const response = await api.delete(`/perfumes/collection/${perfumeId}`);
@@ -1,3 +1,4 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
 import api from './api';
 import { Perfume } from './perfumeService';
 
@@ -28,14 +29,166 @@ export interface Recommendation {
   perfume_recomendado_id: number | null;
   perfume_recomendado: Perfume | null;
   explicacion: string | null;
-  respuesta_ia: string;
+  es_fallback?: boolean; // Elegida por el recomendador local (sin IA)
+  respuesta_ia?: string; // No se incluye en el historial
   created_at: string;
 }
 
+export interface RecommendationJob {
+  job_id: string;
+  estado: 'pendiente' | 'en_proceso' | 'completado' | 'error';
+  error: string | null;
+  recomendacion: Recommendation | null;
+  created_at: string | null;
+  finished_at: string | null;
+}
+
+const JOB_WAIT_SECONDS = 20;
+
+export interface RecommendationStreamHandlers {
+  onPerfume?: (perfume: Perfume | null) => void;
+  onText?: (texto: string) => void;
+  // La IA se cortó: descartar el texto recibido, llega la recomendación local
+  onRestart?: () => void;
+}
+
+// Parsear los bloques SSE completos ("event: x\ndata: {...}\n\n") recibidos hasta ahora
+function parseSseBlocks(buffer: string): { events: [string, any][]; rest: string } {
+  const blocks = buffer.split('\n\n');
+  const rest = blocks.pop() ?? '';
+  const events = blocks.map((block): [string, any] => {
+    const lines = block.split('\n');
+    const event = lines.find((l) => l.startsWith('event: '))?.slice(7) ?? 'message';
+    const data = lines.find((l) => l.startsWith('data: '))?.slice(6) ?? 'null';
+    return [event, JSON.parse(data)];
+  });
+  return { events, rest };
+}
+
+export const newIdempotencyKey = (): string =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
+const MAX_RETRIES = 2;
+
+// Errores transitorios: sin respuesta (red/timeout), 409 (otra en curso) o 5xx
+const isRetryable = (error: any): boolean => {
+  const status = error.response?.status;
+  return !status || status === 409 || status >= 500;
+};
+
+// POST de una acción del usuario: la Idempotency-Key se genera una sola vez y se
+// reutiliza en cada reintento, así el backend devuelve el mismo resultado
+async function postIdempotent<T>(
+  url: string,
+  data: RecommendationRequest,
+  idempotencyKey: string,
+  params?: Record<string, unknown>
+): Promise<T> {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await api.post<T>(url, data, {
+        params,
+        headers: { 'Idempotency-Key': idempotencyKey },
+      });
+      return response.data;
+    } catch (error: any) {
+      if (attempt >= MAX_RETRIES || !isRetryable(error)) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** attempt));
+    }
+  }
+}
+
 export const recommendationService = {
-  // Crear nueva recomendación
-  async create(data: RecommendationRequest): Promise<Recommendation> {
-    const response = await api.post<Recommendation>('/recommendations/', data);
+  // Crear nueva recomendación. Los reintentos automáticos usan la misma clave;
+  // para un reintento manual de la misma acción, pasar la clave de la primera llamada
+  async create(
+    data: RecommendationRequest,
+    idempotencyKey: string = newIdempotencyKey()
+  ): Promise<Recommendation> {
+    return postIdempotent<Recommendation>('/recommendations/', data, idempotencyKey);
+  },
+
+  // Varios eventos en una sola llamada (una consulta por evento)
+  async createBatch(eventos: RecommendationRequest[]): Promise<Recommendation[]> {
+    const response = await api.post<Recommendation[]>(
+      '/recommendations/batch',
+      { eventos },
+      { timeout: 30000 }
+    );
+    return response.data;
+  },
+
+  // Modo asíncrono: encolar y esperar el resultado con long-polling
+  async createAsync(
+    data: RecommendationRequest,
+    idempotencyKey: string = newIdempotencyKey()
+  ): Promise<Recommendation> {
+    let current = await postIdempotent<RecommendationJob>(
+      '/recommendations/',
+      data,
+      idempotencyKey,
+      { async: true }
+    );
+    while (current.estado === 'pendiente' || current.estado === 'en_proceso') {
+      current = await recommendationService.getJob(current.job_id, JOB_WAIT_SECONDS);
+    }
+    if (current.estado === 'error' || !current.recomendacion) {
+      throw new Error(current.error ?? 'No se pudo generar la recomendación');
+    }
+    return current.recomendacion;
+  },
+
+  // Recomendación en streaming (SSE): el perfume llega antes que la explicación completa
+  async createStream(
+    data: RecommendationRequest,
+    handlers: RecommendationStreamHandlers = {}
+  ): Promise<Recommendation> {
+    const token = await AsyncStorage.getItem('access_token');
+    return new Promise((resolve, reject) => {
+      const xhr = new XMLHttpRequest();
+      let offset = 0;
+      let pending = '';
+      let result: Recommendation | null = null;
+
+      const consume = () => {
+        pending += xhr.responseText.slice(offset);
+        offset = xhr.responseText.length;
+        const { events, rest } = parseSseBlocks(pending);
+        pending = rest;
+        events.forEach(([event, payload]) => {
+          if (event === 'perfume') handlers.onPerfume?.(payload);
+          else if (event === 'texto') handlers.onText?.(payload.texto);
+          else if (event === 'reinicio') handlers.onRestart?.();
+          else if (event === 'fin') result = payload;
+          else if (event === 'error') reject(new Error(payload.detail));
+        });
+      };
+
+      xhr.open('POST', `${api.defaults.baseURL}/recommendations/stream`);
+      xhr.setRequestHeader('Content-Type', 'application/json');
+      xhr.setRequestHeader('Accept', 'text/event-stream');
+      if (token) xhr.setRequestHeader('Authorization', `Bearer ${token}`);
+      xhr.onprogress = consume;
+      xhr.onload = () => {
+        if (xhr.status !== 200) {
+          reject(new Error(`Error ${xhr.status}`));
+          return;
+        }
+        consume();
+        if (result) resolve(result);
+        else reject(new Error('La recomendación no se completó'));
+      };
+      xhr.onerror = () => reject(new Error('Error de red'));
+      xhr.send(JSON.stringify(data));
+    });
+  },
+
+  // Estado de un trabajo (espera hasta `wait` segundos a que termine)
+  async getJob(jobId: string, wait: number = 0): Promise<RecommendationJob> {
+    const response = await api.get<RecommendationJob>(`/recommendations/jobs/${jobId}`, {
+      params: { wait },
+      timeout: (wait + 10) * 1000,
+    });
     return response.data;
   },
 